@@ -8,24 +8,19 @@ from modules.utils import (
     load_history, 
     save_history, 
     load_letters,
-    add_log
+    add_log,
+    update_sidebar_points
 )
-from modules.pr_generator import PRGenerator
-from modules.faq_generator import FAQGenerator
-from modules.faq_in import InternalFAQGenerator
-from modules.mlp_generator import MLPGenerator
 from datetime import datetime
-import pandas as pd
-from modules.all_in_one_generator import AllInOneGenerator
-from modules.aar_generator import AARGenerator
 from user.admin import show_admin_panel
-from user.user_process import check_auth, handle_logout, UserManager
+from user.user_process import check_auth, handle_logout
 from user.chat import show_chat_interface
-from bill.bill import BillManager, show_bill_detail
-from user.logger import display_logs
+from bill.bill import show_bill_detail
+from user.logger import clear_logs, display_logs
 from db.db_admin import show_db_admin
 from user.user_history import show_user_history
 from db.db_upgrade import check_and_upgrade
+from modules.resources import startup
 import sys
 import traceback
 
@@ -43,12 +38,24 @@ def clear_main_content():
         'aar_form_data',  
         'aar_generation_started',  
         'aar_data_fact',
-        'user_role'
+        'user_role',
+        'api_client'
     ]
     for key in list(st.session_state.keys()):
         if key not in preserved_keys:
             del st.session_state[key]
 
+def get_api_client(config) -> APIClient:
+    """本会话复用的API客户端，配置重新加载后重建
+
+    APIClient 保存单次生成的状态（输出内容、预授权等），只在会话内复用；
+    连接池和健康登记表本身是进程级共享的
+    """
+    cached = st.session_state.get('api_client')
+    if cached is None or cached.config is not config:
+        cached = st.session_state.api_client = APIClient(config)
+    return cached
+
 def main():
     try:
         # 检查是否是来自AWS Marketplace的请求
@@ -66,6 +73,9 @@ def main():
             add_log("error", "数据库升级失败，程序无法继续运行")
             return
         
+        # 创建进程级共享资源（每个进程只执行一次，之后的重新运行直接返回）
+        startup()
+        
         # Load configurations
         config = None
         templates = None
@@ -106,7 +116,7 @@ def main():
         if 'current_section' not in st.session_state:
             st.session_state.current_section = 'pr'
         if 'logs' not in st.session_state:
-            st.session_state.logs = []
+            clear_logs()
             
         # 创建侧边栏
         render_sidebar()
@@ -125,7 +135,7 @@ def main():
                 display_logs()
                 # Add clear logs button
                 if st.button("清除日志", key="clear_logs"):
-                    st.session_state.logs = []
+                    clear_logs()
                     add_log("info", "日志已清除")
         else:
             # 普通用户不显示日志，直接渲染主内容
@@ -178,13 +188,10 @@ def render_sidebar():
         
         st.title(f"助你高效 - {st.session_state.user}")
         
-        # 显示用户积分
-        user_mgr = UserManager()
-        bill_mgr = BillManager()
-        user_info = user_mgr.get_user_info(st.session_state.user)
-        if user_info:
-            points_info = bill_mgr.get_user_points(user_info['user_id'])
-            st.metric("当前积分", f"{points_info:,}")
+        # 显示用户积分（读取用户信息缓存并扣除计费队列中尚未落库的消费，TTL 内不访问数据库）
+        update_sidebar_points()
+        if 'sidebar_points' in st.session_state:
+            st.metric("当前积分", f"{st.session_state.sidebar_points:,}")
         
         # 如果是管理员，显示管理员功能
         if st.session_state.user_role == 'admin':
@@ -278,40 +285,46 @@ def render_main_content(config, templates):
         from aws.aws_mp import show_aws_panel
         show_aws_panel()
     elif st.session_state.current_section == 'chat_test':
-        api_client = APIClient(config)
+        api_client = get_api_client(config)
         show_chat_interface(api_client)
     elif st.session_state.current_section == 'history':
         show_user_history()
     elif st.session_state.current_section == 'bill':
         show_bill_detail()
     elif st.session_state.current_section == 'all_in_one':
-        api_client = APIClient(config)
+        from modules.all_in_one_generator import AllInOneGenerator
+        api_client = get_api_client(config)
         all_in_one_generator = AllInOneGenerator(api_client)
         all_in_one_generator.render()
     elif st.session_state.current_section == 'pr':
         st.markdown("""
         逆向工作法是一种从结果反推过程的创新思维方法。通过先设想理想的最终成果，再逐步分析实现这个结果所需的步骤和条件，帮助我们更清晰地规划项目路径。本模块将帮助您运用这种方法，通过编写未来新闻稿的形式，明确项目目标和关键成功要素。您只需要输入产品的核心理念，系统就会协助您生成完整的项目愿景说明，包括目标受众、价值主张、功能特性等关键内容。
         """)
-        api_client = APIClient(config)
+        from modules.pr_generator import PRGenerator
+        api_client = get_api_client(config)
         pr_generator = PRGenerator(api_client)
         pr_generator.render()
     elif st.session_state.current_section == 'faq':
-        api_client = APIClient(config)
+        from modules.faq_generator import FAQGenerator
+        api_client = get_api_client(config)
         faq_generator = FAQGenerator(api_client)
         faq_generator.generate_customer_faq()
     elif st.session_state.current_section == 'internal_faq':
-        api_client = APIClient(config)
+        from modules.faq_in import InternalFAQGenerator
+        api_client = get_api_client(config)
         faq_generator = InternalFAQGenerator(api_client)
         faq_generator.generate_internal_faq()
     elif st.session_state.current_section == 'mlp':
-        api_client = APIClient(config)
+        from modules.mlp_generator import MLPGenerator
+        api_client = get_api_client(config)
         mlp_generator = MLPGenerator(api_client)
         mlp_generator.generate_mlp()
     elif st.session_state.current_section == 'aar':
         st.markdown("""
         复盘六步法源于军事领域的"事后复盘"（After Action Review），后被广泛应用于企业管理实践中。它通过六个系统化步骤：设定复盘目标、回顾行动过程、对比预期结果、分析差距原因、总结经验教训、形成复盘文档，帮助团队从实践中提炼经验，持续改进。本模块将引导您完整地执行这六个步骤，通过AI辅助分析，帮助您更深入地思考项目经验，形成可复用的经验总结文档。
         """)
-        api_client = APIClient(config)
+        from modules.aar_generator import AARGenerator
+        api_client = get_api_client(config)
         aar_generator = AARGenerator(api_client)
         aar_generator.render()
     elif st.session_state.current_section == 'career_test':
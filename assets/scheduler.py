@@ -2,6 +2,8 @@ import schedule
 import time
 from datetime import datetime
 from db.backup_db import backup_database
+from db.history_fts import backfill_history_fts
+from db.history_codec import recompress_history
 from modules.utils import add_log
 
 def auto_backup():
@@ -14,10 +16,28 @@ def auto_backup():
     except Exception as e:
         add_log("error", f"自动备份出错: {str(e)}")
 
+def backfill_search_index():
+    """为迁移前的历史记录补建全文索引，每次最多处理20批，避免长时间占用写锁"""
+    try:
+        backfill_history_fts(batch_size=500, max_batches=20)
+    except Exception as e:
+        add_log("error", f"补建全文索引出错: {str(e)}")
+
+def recompress_history_content():
+    """把未压缩的历史记录逐步改为压缩存储，每次最多处理10批"""
+    try:
+        recompress_history(batch_size=200, max_batches=10)
+    except Exception as e:
+        add_log("error", f"压缩历史记录出错: {str(e)}")
+
 def start_scheduler():
     """启动调度器"""
-    # 每小时整点执行备份
+    # 每小时整点执行备份（与最近的完整快照相比只保存变化的页，每天一次完整快照）
     schedule.every().hour.at(":00").do(auto_backup)
+    # 每5分钟补建一部分全文索引，补建完成后为空操作
+    schedule.every(5).minutes.do(backfill_search_index)
+    # 每小时半点压缩一部分历史记录，与整点备份错开
+    schedule.every().hour.at(":30").do(recompress_history_content)
     
     while True:
         schedule.run_pending()
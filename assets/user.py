@@ -15,7 +15,6 @@ from modules.faq_generator import FAQGenerator
 from modules.faq_in import InternalFAQGenerator
 from modules.mlp_generator import MLPGenerator
 from datetime import datetime
-import pandas as pd
 from modules.all_in_one_generator import AllInOneGenerator
 from modules.aar_generator import AARGenerator
 from user.user_process import show_login_page, show_admin_panel, show_user_profile
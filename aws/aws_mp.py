@@ -1,9 +1,11 @@
 import streamlit as st
-import boto3
 import json
-import pandas as pd
 from datetime import datetime
 from modules.utils import add_log
+from modules.lazy import lazy_import
+
+boto3 = lazy_import('boto3')
+pd = lazy_import('pandas')
 
 def test_aws_connection():
     """测试AWS连接"""
@@ -1,10 +1,11 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime
 import pytz
-from user.user_base import UserManager
 from user.logger import add_log
-from bill.bill_base import BillManager
+from modules.lazy import lazy_import
+from modules.resources import get_bill_manager, get_user_manager
+
+pd = lazy_import('pandas')
 
 # 定义时区
 TIMEZONE = pytz.timezone('Asia/Shanghai')
@@ -32,15 +33,14 @@ def show_bill_detail():
         st.markdown("### 账单明细")
         
         # 获取当前用户信息
-        user_mgr = UserManager()
-        user_info = user_mgr.get_user_info(st.session_state.user)
+        user_info = get_user_manager().get_user_info(st.session_state.user)
         
         if not user_info:
             st.error("获取用户信息失败")
             return
         
-        # 创建账单管理器实例
-        bill_mgr = BillManager()
+        # 进程内共享的账单管理器
+        bill_mgr = get_bill_manager()
         
         try:
             # 获取用户总使用量
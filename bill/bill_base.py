@@ -1,16 +1,23 @@
 import sqlite3
 from datetime import datetime
+from typing import Optional, Tuple
 import pytz
-import pandas as pd
 from user.user_base import UserManager
 from user.logger import add_log
+from user.user_cache import invalidate_user
+from modules.lazy import lazy_import
+
+pd = lazy_import('pandas')
 
 # 定义时区
 TIMEZONE = pytz.timezone('Asia/Shanghai')
 
+# SQLite 3.35 起支持 UPDATE ... RETURNING
+HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
 class BillManager:
-    def __init__(self):
-        self.user_mgr = UserManager()
+    def __init__(self, user_mgr: Optional[UserManager] = None):
+        self.user_mgr = user_mgr or UserManager()
         self.COST_PER_CHAR = 0.0001  # 每字符0.0001元人民币
     
     def get_current_time(self) -> str:
@@ -41,107 +48,150 @@ class BillManager:
         finally:
             conn.close()
     
-    def add_points(self, user_id: str, amount: int, type: str, description: str) -> bool:
-        """添加积分"""
-        if not isinstance(amount, int) or amount <= 0:
-            add_log("error", f"无效的积分数量: {amount}")
+    def _update_points(self, conn, user_id: str, delta: int, require_balance: bool,
+                       usage: Optional[Tuple[int, float]] = None) -> Optional[int]:
+        """在当前事务中变更积分（可同时累加使用统计），返回变更后的余额
+
+        余额不足或用户不存在时返回 None
+        """
+        sets = ["points = points + ?"]
+        params: list = [delta]
+        if usage:
+            chars, cost = usage
+            sets = ["total_chars = total_chars + ?", "total_cost = total_cost + ?",
+                    "used_chars_today = used_chars_today + ?"] + sets
+            params = [chars, cost, chars] + params
+        where = "user_id = ?"
+        params.append(user_id)
+        if require_balance:
+            where += " AND points >= ?"
+            params.append(-delta)
+        query = f"UPDATE users SET {', '.join(sets)} WHERE {where}"
+
+        if HAS_RETURNING:
+            row = self.safe_execute(conn, query + " RETURNING points", params).fetchone()
+            return row[0] if row else None
+        # 旧版SQLite不支持 RETURNING，在同一事务中读取更新后的余额
+        if self.safe_execute(conn, query, params).rowcount == 0:
+            return None
+        return self.safe_execute(conn, 'SELECT points FROM users WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+    def _insert_transaction(self, conn, user_id: str, type: str, amount: int, balance: int,
+                            description: str, operation_id: Optional[str], timestamp: Optional[str] = None):
+        self.safe_execute(
+            conn,
+            '''INSERT INTO point_transactions (
+                user_id, timestamp, type, amount, balance,
+                description, operation_id
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)''',
+            (
+                user_id,
+                timestamp or self.get_current_time(),
+                type,
+                amount,
+                balance,
+                description,
+                operation_id
+            )
+        )
+
+    def _is_applied(self, conn, operation_id: Optional[str]) -> bool:
+        """该幂等键对应的操作是否已经记录过"""
+        if not operation_id:
             return False
-            
+        return self.safe_execute(
+            conn, 'SELECT 1 FROM point_transactions WHERE operation_id = ?', (operation_id,)
+        ).fetchone() is not None
+
+    def _run_ledger(self, action: str, operation_id: Optional[str], apply,
+                    user_id: Optional[str] = None) -> bool:
+        """在一个连接上以 BEGIN IMMEDIATE 事务执行 apply(conn)
+
+        apply 返回 False 时回滚；相同 operation_id 的操作只执行一次；
+        提交后使 user_id 的用户信息缓存失效
+        """
         conn = None
         try:
             conn = self.user_mgr.get_db_connection()
-            current_points = self.get_user_points(user_id)
-            
-            # 更新用户积分
-            self.safe_execute(
-                conn,
-                'UPDATE users SET points = points + ? WHERE user_id = ?',
-                (amount, user_id)
-            )
-            
-            # 记录交易
-            self.safe_execute(
-                conn,
-                '''INSERT INTO point_transactions (
-                    user_id, timestamp, type, amount, balance,
-                    description, operation_id
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                (
-                    user_id,
-                    self.get_current_time(),
-                    type,
-                    amount,
-                    current_points + amount,
-                    description,
-                    None
-                )
-            )
-            
-            conn.commit()
-            add_log("info", f"用户 {user_id} 增加 {amount} 积分")
+            conn.isolation_level = None  # 手动控制事务
+            conn.execute('BEGIN IMMEDIATE')
+            if self._is_applied(conn, operation_id):
+                conn.execute('ROLLBACK')
+                add_log("info", f"操作 {operation_id} 已处理过，跳过")
+                return True
+            if not apply(conn):
+                conn.execute('ROLLBACK')
+                return False
+            conn.execute('COMMIT')
+            if user_id:
+                invalidate_user(user_id)
             return True
-            
+
+        except sqlite3.IntegrityError:
+            # 并发提交了同一个 operation_id，唯一索引保证只记录一次
+            if conn and conn.in_transaction:
+                conn.execute('ROLLBACK')
+            if operation_id:
+                add_log("info", f"操作 {operation_id} 已处理过，跳过")
+                return True
+            add_log("error", f"{action}失败: 数据约束冲突")
+            return False
         except Exception as e:
-            if conn:
-                conn.rollback()
-            add_log("error", f"添加积分失败: {str(e)}")
+            if conn and conn.in_transaction:
+                conn.execute('ROLLBACK')
+            add_log("error", f"{action}失败: {str(e)}")
             return False
         finally:
             if conn:
                 conn.close()
+
+    def add_points(self, user_id: str, amount: int, type: str, description: str,
+                   operation_id: Optional[str] = None) -> bool:
+        """添加积分
+
+        Args:
+            operation_id: 幂等键，同一个键只会加一次积分
+        """
+        if not isinstance(amount, int) or amount <= 0:
+            add_log("error", f"无效的积分数量: {amount}")
+            return False
+
+        def apply(conn) -> bool:
+            balance = self._update_points(conn, user_id, amount, require_balance=False)
+            if balance is None:
+                add_log("error", f"用户 {user_id} 不存在")
+                return False
+            self._insert_transaction(conn, user_id, type, amount, balance, description, operation_id)
+            return True
+
+        success = self._run_ledger("添加积分", operation_id, apply, user_id)
+        if success:
+            add_log("info", f"用户 {user_id} 增加 {amount} 积分")
+        return success
     
-    def deduct_points(self, user_id: str, amount: int, type: str, description: str) -> bool:
-        """扣除积分"""
+    def deduct_points(self, user_id: str, amount: int, type: str, description: str,
+                      operation_id: Optional[str] = None) -> bool:
+        """扣除积分
+
+        Args:
+            operation_id: 幂等键，同一个键只会扣一次积分
+        """
         if not isinstance(amount, int) or amount <= 0:
             add_log("error", f"无效的扣除积分数量: {amount}")
             return False
-            
-        conn = None
-        try:
-            conn = self.user_mgr.get_db_connection()
-            current_points = self.get_user_points(user_id)
-            
-            if current_points < amount:
-                add_log("warning", f"用户 {user_id} 积分不足: 当前{current_points}, 需要{amount}")
+
+        def apply(conn) -> bool:
+            balance = self._update_points(conn, user_id, -amount, require_balance=True)
+            if balance is None:
+                add_log("warning", f"用户 {user_id} 积分不足: 需要{amount}")
                 return False
-            
-            # 更新用户积分
-            self.safe_execute(
-                conn,
-                'UPDATE users SET points = points - ? WHERE user_id = ?',
-                (amount, user_id)
-            )
-            
-            # 记录交易
-            self.safe_execute(
-                conn,
-                '''INSERT INTO point_transactions (
-                    user_id, timestamp, type, amount, balance,
-                    description, operation_id
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                (
-                    user_id,
-                    self.get_current_time(),
-                    type,
-                    -amount,
-                    current_points - amount,
-                    description,
-                    None
-                )
-            )
-            
-            conn.commit()
-            add_log("info", f"用户 {user_id} 扣除 {amount} 积分")
+            self._insert_transaction(conn, user_id, type, -amount, balance, description, operation_id)
             return True
-            
-        except Exception as e:
-            if conn:
-                conn.rollback()
-            add_log("error", f"扣除积分失败: {str(e)}")
-            return False
-        finally:
-            if conn:
-                conn.close()
+
+        success = self._run_ledger("扣除积分", operation_id, apply, user_id)
+        if success:
+            add_log("info", f"用户 {user_id} 扣除 {amount} 积分")
+        return success
     
     def get_user_total_usage(self, user_id: str) -> dict:
         """获取用户的总使用量统计"""
@@ -183,7 +233,7 @@ class BillManager:
         finally:
             conn.close()
     
-    def get_points_history(self, user_id: str) -> pd.DataFrame:
+    def get_points_history(self, user_id: str) -> 'pd.DataFrame':
         """获取用户的积分历史记录"""
         conn = self.user_mgr.get_db_connection()
         
@@ -244,79 +294,57 @@ class BillManager:
         finally:
             conn.close()
     
-    def add_bill_record(self, user_id: str, api_name: str, operation: str,
-                       input_letters: int, output_letters: int) -> bool:
-        """添加账单记录"""
+    def charge(self, conn, user_id: str, api_name: str, operation: str,
+               input_letters: int, output_letters: int, operation_id: Optional[str] = None,
+               timestamp: Optional[str] = None, require_balance: bool = True) -> Optional[int]:
+        """在调用方的事务中记录一次消费：检查并扣减积分、累加使用统计、写入账单和积分交易
+
+        Args:
+            require_balance: 为 False 时不检查余额（结算已经完成的生成），扣减后余额可以为负
+
+        Returns:
+            扣减后的余额；积分不足时返回 None，调用方应回滚
+        """
         total_cost = (input_letters + output_letters) * self.COST_PER_CHAR
         points_cost = input_letters + output_letters  # 1字符=1积分
-        
-        conn = self.user_mgr.get_db_connection()
-        c = conn.cursor()
-        
-        try:
-            # 检查用户积分是否足够
-            current_points = self.get_user_points(user_id)
-            
-            if current_points < points_cost:
-                add_log("error", f"用户 {user_id} 积分不足，需要 {points_cost} 积分")
-                return False
-            
-            # 添加账单记录
-            c.execute('''
+        timestamp = timestamp or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        balance = self._update_points(
+            conn, user_id, -points_cost, require_balance=require_balance,
+            usage=(input_letters + output_letters, total_cost)
+        )
+        if balance is None:
+            add_log("error", f"用户 {user_id} 积分不足，需要 {points_cost} 积分")
+            return None
+
+        self.safe_execute(conn, '''
             INSERT INTO bills (
                 user_id, timestamp, api_name, operation,
                 input_letters, output_letters, total_cost, points_cost
             ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                user_id,
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                api_name,
-                operation,
-                input_letters,
-                output_letters,
-                total_cost,
-                points_cost
-            ))
-            
-            # 更新用户使用统计和积分
-            c.execute('''
-            UPDATE users 
-            SET total_chars = total_chars + ?,
-                total_cost = total_cost + ?,
-                used_chars_today = used_chars_today + ?,
-                points = points - ?
-            WHERE user_id = ?
-            ''', (
-                input_letters + output_letters,
-                total_cost,
-                input_letters + output_letters,
-                points_cost,
-                user_id
-            ))
-            
-            # 添加积分交易记录
-            c.execute('''
-            INSERT INTO point_transactions (
-                user_id, timestamp, type, amount, balance,
-                description, operation_id
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                user_id,
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'consume',
-                -points_cost,
-                current_points - points_cost,
-                f'使用{operation}消费',
-                None
-            ))
-            
-            conn.commit()
-            add_log("info", f"用户 {user_id} 使用 {operation} 消费 {points_cost} 积分")
-            return True
-            
-        except Exception as e:
-            conn.rollback()
-            add_log("error", f"记录账单失败: {str(e)}")
-            return False
-        finally:
-            conn.close()
\ No newline at end of file
+        ''', (
+            user_id,
+            timestamp,
+            api_name,
+            operation,
+            input_letters,
+            output_letters,
+            total_cost,
+            points_cost
+        ))
+        self._insert_transaction(conn, user_id, 'consume', -points_cost, balance,
+                                 f'使用{operation}消费', operation_id, timestamp)
+        return balance
+
+    def add_bill_record(self, user_id: str, api_name: str, operation: str,
+                       input_letters: int, output_letters: int,
+                       operation_id: Optional[str] = None) -> bool:
+        """添加账单记录，余额检查、扣减和记录在同一个事务中完成"""
+        def apply(conn) -> bool:
+            return self.charge(conn, user_id, api_name, operation,
+                               input_letters, output_letters, operation_id) is not None
+
+        success = self._run_ledger("记录账单", operation_id, apply, user_id)
+        if success:
+            add_log("info", f"用户 {user_id} 使用 {operation} 消费 {input_letters + output_letters} 积分")
+        return success
@@ -0,0 +1,567 @@
+"""
+计费写入队列
+生成开始前按预估字数预授权积分（reserve），结束后按实际字数结算（settle）或释放（release）。
+用量事件先写入本地日志文件（fsync 后才确认），再交给唯一的写线程按批次在一个事务中
+记录账单、扣减积分和写入积分交易，避免多个会话同时写库导致 "database is locked"。
+尚未落库的扣减保存在内存中，余额和每日限额检查会把它们计算在内。
+每个进程使用自己的日志文件（billing_journal.jsonl.<pid>），压缩时不会影响其他进程的事件；
+启动时接管已退出进程留下的日志（以文件锁判断进程是否仍在运行）。
+无法写入数据库的事件（数据错误，而不是数据库被锁）转入死信文件保存，不会丢失
+"""
+
+import json
+import math
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Any, List, NamedTuple, Optional, Set
+
+from bill.bill_base import BillManager
+from db.pool import get_pool
+from user.logger import add_log
+from user.user_cache import invalidate_user
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，无法判断其他进程是否在运行，假定只有一个进程
+    fcntl = None
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(ROOT_DIR, 'db', 'users.db')
+# 各进程的日志为 JOURNAL_PATH.<pid>，死信文件为 JOURNAL_PATH.deadletter
+JOURNAL_PATH = os.path.join(ROOT_DIR, 'db', 'billing_journal.jsonl')
+
+# 默认配置，可在 config.json 的 billing_queue 中覆盖
+DEFAULT_BILLING_QUEUE_CONFIG = {
+    "batch_size": 50,               # 每个事务最多处理的事件数
+    "flush_interval": 0.2,          # 凑批等待时间（秒）
+    "journal_max_bytes": 1048576,   # 日志超过该大小时压缩掉已落库的事件
+    "cost_per_char": 0.0001,        # 每字符费用（元），与 BillManager.COST_PER_CHAR 一致
+    "hold_output_chars": 6000,      # 不知道 max_tokens 时预估的输出字数
+    "chars_per_token": 1.5,         # 按 max_tokens 预估输出字数时每个token对应的字数
+    "hold_ttl": 900                 # 预授权有效期（秒），过期后不再占用余额
+}
+
+
+# 日志中每个事件必须有的字段，缺少时无法追踪未落库的扣减
+_REQUIRED_FIELDS = ('event_id', 'user_id', 'chars', 'points')
+
+
+class BillingResult(NamedTuple):
+    """提交结果"""
+    accepted: bool
+    message: str = ""
+    balance: Optional[int] = None  # 扣除本次、未落库消费和预授权后的预计可用余额
+    hold_id: Optional[str] = None
+
+
+class BillingQueue:
+    """单写线程的计费队列"""
+
+    def __init__(self, db_path: str = DB_PATH, journal_path: str = JOURNAL_PATH,
+                 batch_size: int = 50, flush_interval: float = 0.2,
+                 journal_max_bytes: int = 1048576, cost_per_char: float = 0.0001,
+                 hold_output_chars: int = 6000, hold_ttl: float = 900,
+                 chars_per_token: float = 1.5):
+        self.db_path = db_path
+        self.journal_base = journal_path
+        self.journal_path = f"{journal_path}.{os.getpid()}"
+        self.dead_letter_path = f"{journal_path}.deadletter"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.journal_max_bytes = journal_max_bytes
+        self.hold_output_chars = hold_output_chars
+        self.chars_per_token = chars_per_token
+        self.hold_ttl = hold_ttl
+        self.ledger = BillManager()
+        self.ledger.COST_PER_CHAR = cost_per_char
+
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()  # 保护日志文件和下面的未落库状态
+        self._outstanding: Dict[str, Dict[str, Any]] = {}  # event_id -> 已确认未落库的事件
+        self._pending_points: Dict[str, int] = {}
+        self._pending_chars: Dict[str, int] = {}
+        self._settling: Set[str] = set()  # 已提交结算、尚未落库的预授权
+        self._idle = threading.Condition(self._lock)
+        self._stopped = False
+
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        # 进程运行期间一直持有自己日志的锁文件，其他进程据此判断该日志是否有人负责
+        self._owner_lock = self._lock_journal(self.journal_path, blocking=True)
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        self._recover()
+        self._adopt_orphans()
+
+        self._writer = threading.Thread(target=self._run, name="billing-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = get_pool(self.db_path).connection()
+        conn.isolation_level = None  # 手动控制事务，归还连接池时恢复
+        return conn
+
+    def _read_journal(self, path: str) -> List[Dict[str, Any]]:
+        """读取日志中的事件，缺少必要字段的记录转入死信文件"""
+        events, invalid = [], []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    # 最后一行可能在写入时中断，该事件未被确认
+                    add_log("warning", f"计费日志 {os.path.basename(path)} 中有不完整的记录，已跳过")
+                    continue
+                if isinstance(event, dict) and all(key in event for key in _REQUIRED_FIELDS):
+                    events.append(event)
+                else:
+                    invalid.append(event)
+        if invalid and not self._dead_letter(invalid):
+            raise OSError(f"无法保存计费日志 {os.path.basename(path)} 中的无效记录")
+        return events
+
+    @staticmethod
+    def _lock_journal(path: str, blocking: bool):
+        """对日志的锁文件加排他锁，返回打开的锁文件；非阻塞时锁被其他进程持有则返回 None"""
+        lock_file = open(path + '.lock', 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                lock_file.close()
+                return None
+        return lock_file
+
+    def _recover(self):
+        """重新排队本进程日志中（同一 pid 的上一个进程）已确认但未落库的事件，已落库的由 operation_id 去重"""
+        events = self._read_journal(self.journal_path)
+        for event in events:
+            self._track(event)
+            self._queue.put(event)
+        if events:
+            add_log("info", f"从计费日志恢复 {len(events)} 条待处理事件")
+
+    def _adopt_orphans(self):
+        """接管已退出进程的日志：事件写入本进程的日志后删除原文件
+
+        旧版本所有进程共用的 billing_journal.jsonl 同样接管。多个进程同时启动时由目录级的锁串行执行
+        """
+        directory = os.path.dirname(self.journal_base)
+        name = os.path.basename(self.journal_base)
+        pattern = re.compile(re.escape(name) + r'(\.\d+)?$')
+        adopt_lock = self._lock_journal(self.journal_base + '.adopt', blocking=True)
+        try:
+            for entry in sorted(os.listdir(directory)):
+                path = os.path.join(directory, entry)
+                if not pattern.match(entry) or path == self.journal_path:
+                    continue
+                owner_lock = self._lock_journal(path, blocking=False)
+                if owner_lock is None:
+                    continue  # 所属进程仍在运行
+                try:
+                    events = self._read_journal(path)
+                    if events:
+                        self._append_journal(events)
+                        for event in events:
+                            self._track(event)
+                            self._queue.put(event)
+                        add_log("info", f"接管计费日志 {entry} 中的 {len(events)} 条待处理事件")
+                    os.remove(path)
+                    os.remove(path + '.lock')
+                finally:
+                    owner_lock.close()
+        finally:
+            adopt_lock.close()
+
+    def _append_journal(self, events: List[Dict[str, Any]]):
+        """追加事件到本进程的日志并 fsync"""
+        self._journal.write(''.join(json.dumps(event, ensure_ascii=False) + '\n' for event in events))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def _track(self, event: Dict[str, Any]):
+        self._outstanding[event['event_id']] = event
+        if event.get('hold_id'):
+            self._settling.add(event['hold_id'])
+        user_id = event['user_id']
+        self._pending_points[user_id] = self._pending_points.get(user_id, 0) + event['points']
+        self._pending_chars[user_id] = self._pending_chars.get(user_id, 0) + event['chars']
+
+    def _untrack(self, event: Dict[str, Any]):
+        self._outstanding.pop(event['event_id'], None)
+        self._settling.discard(event.get('hold_id'))
+        user_id = event['user_id']
+        for pending, value in ((self._pending_points, event['points']), (self._pending_chars, event['chars'])):
+            remaining = pending.get(user_id, 0) - value
+            if remaining > 0:
+                pending[user_id] = remaining
+            else:
+                pending.pop(user_id, None)
+
+    def _now(self, offset: float = 0) -> str:
+        return datetime.fromtimestamp(time.time() + offset).strftime('%Y-%m-%d %H:%M:%S')
+
+    def _load_account(self, conn: sqlite3.Connection, where: str, key: str):
+        """读取用户余额、每日限额和有效预授权总额，需持有 _lock
+
+        在锁内读取：写线程落库后要先拿到锁才能移除对应的未落库记录，
+        因此读到的余额和未落库消费最多重复计算一次，不会多算可用积分
+        """
+        return conn.execute(f'''
+            SELECT u.user_id, u.points, u.daily_chars_limit, u.used_chars_today,
+                   (SELECT COALESCE(SUM(h.amount), 0) FROM point_holds h
+                    WHERE h.user_id = u.user_id AND h.status = 'held' AND h.expires_at > ?)
+            FROM users u WHERE {where}
+        ''', (self._now(), key)).fetchone()
+
+    def _available(self, row, released: int = 0):
+        """可用积分和今日已用字符数（都计入未落库的消费和有效预授权）"""
+        user_id, points, daily_limit, used_today, held = row
+        balance = points - self._pending_points.get(user_id, 0) - held + released
+        used = used_today + self._pending_chars.get(user_id, 0)
+        return balance, used, daily_limit
+
+    def submit(self, username: str, api_name: str, operation: str,
+               input_letters: int, output_letters: int) -> BillingResult:
+        """提交一次用量，检查余额和每日限额后写入日志并排队
+
+        返回时事件已持久化到本地日志，即使进程退出也会在重启后落库
+        """
+        with self._lock:
+            if self._stopped:
+                return BillingResult(False, "计费服务已停止")
+            conn = self._connect()
+            try:
+                row = self._load_account(conn, 'u.username = ?', username)
+            finally:
+                conn.close()
+            if not row:
+                return BillingResult(False, "用户不存在")
+            balance, used, daily_limit = self._available(row)
+            return self._enqueue(row[0], balance, used, daily_limit, api_name, operation,
+                                 input_letters, output_letters)
+
+    def _enqueue(self, user_id: str, balance: int, used: int, daily_limit: int, api_name: str,
+                 operation: str, input_letters: int, output_letters: int,
+                 hold_id: Optional[str] = None, enforce_limits: bool = True) -> BillingResult:
+        """检查余额后写入日志并排队，需持有 _lock
+
+        enforce_limits 为 False 时（结算已经完成的生成）不检查余额和每日限额，按实际字数记账，余额可以为负
+        """
+        chars = input_letters + output_letters
+        if enforce_limits and used >= daily_limit:
+            return BillingResult(False, "已达到每日字符用限制", balance)
+        if enforce_limits and balance < chars:
+            return BillingResult(False, f"积分不足，需要 {chars} 积分，当前剩余 {balance} 积分", balance)
+
+        event = {
+            'event_id': uuid.uuid4().hex,
+            'user_id': user_id,
+            'api_name': api_name,
+            'operation': operation,
+            'input_letters': input_letters,
+            'output_letters': output_letters,
+            'chars': chars,
+            'points': chars,  # 1字符=1积分
+            'hold_id': hold_id,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        self._append_journal([event])
+        self._track(event)
+        self._queue.put(event)
+        return BillingResult(True, "", balance - chars, hold_id)
+
+    def reserve(self, username: str, input_letters: int, max_tokens: Optional[int] = None,
+                share: int = 1) -> BillingResult:
+        """生成开始前预授权积分，预授权保存在 point_holds 表中，重启后仍然有效
+
+        预授权金额为输入字数加预估输出字数（max_tokens × chars_per_token，未给出 max_tokens 时为 hold_output_chars），
+        余额不足预估值时按剩余余额预授权；share 为同时进行、共用余额的生成数（一键生成的并发数），
+        此时每个预授权最多占用可用余额的 1/share，后开始的生成不会因为前面的预授权过大而被拒绝。
+        连输入都付不起时拒绝。预授权只用于拦截余额明显不足的请求，结算时按实际字数记账
+        """
+        if max_tokens:
+            estimated_output = int(math.ceil(max_tokens * self.chars_per_token))
+        else:
+            estimated_output = self.hold_output_chars
+        with self._lock:
+            if self._stopped:
+                return BillingResult(False, "计费服务已停止")
+            conn = self._connect()
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                # 过期的预授权不再占用余额
+                conn.execute("UPDATE point_holds SET status = 'expired', closed_at = ? "
+                             "WHERE status = 'held' AND expires_at <= ?", (self._now(), self._now()))
+                row = self._load_account(conn, 'u.username = ?', username)
+                if not row:
+                    conn.execute('ROLLBACK')
+                    return BillingResult(False, "用户不存在")
+                balance, used, daily_limit = self._available(row)
+                if used >= daily_limit:
+                    conn.execute('ROLLBACK')
+                    return BillingResult(False, "已达到每日字符用限制", balance)
+                if balance <= input_letters:
+                    conn.execute('ROLLBACK')
+                    return BillingResult(False, f"积分不足，当前剩余 {balance} 积分", balance)
+
+                amount = min(balance, input_letters + estimated_output)
+                if share > 1:
+                    amount = min(amount, max(input_letters, balance // share))
+                hold_id = uuid.uuid4().hex
+                conn.execute('''
+                    INSERT INTO point_holds (hold_id, user_id, amount, status, created_at, expires_at)
+                    VALUES (?, ?, ?, 'held', ?, ?)
+                ''', (hold_id, row[0], amount, self._now(), self._now(self.hold_ttl)))
+                conn.execute('COMMIT')
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+            finally:
+                conn.close()
+        return BillingResult(True, "", balance - amount, hold_id)
+
+    def settle(self, hold_id: str, api_name: str, operation: str,
+               input_letters: int, output_letters: int) -> BillingResult:
+        """按实际字数结算预授权，预授权在账单落库的同一事务中关闭
+
+        生成时间超过 hold_ttl、预授权已过期时同样按实际字数记账（不再占用余额），不会因过期而漏记
+        """
+        with self._lock:
+            if self._stopped:
+                return BillingResult(False, "计费服务已停止")
+            if hold_id in self._settling:
+                return BillingResult(False, "预授权已结算")
+            conn = self._connect()
+            try:
+                hold = conn.execute(
+                    "SELECT user_id, amount, status, expires_at FROM point_holds WHERE hold_id = ?", (hold_id,)
+                ).fetchone()
+                if not hold or hold[2] not in ('held', 'expired'):
+                    return BillingResult(False, "预授权不存在或已结算")
+                row = self._load_account(conn, 'u.user_id = ?', hold[0])
+            finally:
+                conn.close()
+            active = hold[2] == 'held' and hold[3] > self._now()
+            if not active:
+                add_log("warning", f"预授权 {hold_id} 已过期，按实际字数直接记账")
+            # 本次预授权将被结算，不占用可用余额（已过期的本来就不占用）；
+            # 生成已经完成，超出预授权或余额时也按实际字数记账
+            balance, used, daily_limit = self._available(row, released=hold[1] if active else 0)
+            result = self._enqueue(row[0], balance, used, daily_limit, api_name, operation,
+                                   input_letters, output_letters, hold_id, enforce_limits=False)
+        if not result.accepted:
+            self.release(hold_id)
+        return result
+
+    def release(self, hold_id: str) -> bool:
+        """释放未结算的预授权（生成失败或被取消）"""
+        with self._lock:
+            if hold_id in self._settling:
+                return False
+        conn = self._connect()
+        try:
+            released = conn.execute(
+                "UPDATE point_holds SET status = 'released', closed_at = ? WHERE hold_id = ? AND status = 'held'",
+                (self._now(), hold_id)
+            ).rowcount
+        finally:
+            conn.close()
+        return bool(released)
+
+    def pending_points(self, user_id: str) -> int:
+        """已确认但尚未落库的积分消费"""
+        with self._lock:
+            return self._pending_points.get(user_id, 0)
+
+    def _run(self):
+        while True:
+            event = self._queue.get()
+            if event is None:
+                break
+            batch = [event]
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    event = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if event is None:
+                    stop = True
+                    break
+                batch.append(event)
+
+            failed = self._write_batch(batch)
+
+            with self._lock:
+                if failed and not self._dead_letter(failed):
+                    # 死信文件也写不进去时事件留在日志中，重启后重试
+                    batch = [event for event in batch if event not in failed]
+                for event in batch:
+                    self._untrack(event)
+                self._compact_journal()
+                self._idle.notify_all()
+            if stop:
+                break
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """写入一批事件，返回无法处理的事件
+
+        数据库错误（如被锁）时保留事件重试；其他错误说明事件本身有问题，
+        逐条重新写入，找出有问题的事件，同批的其他事件照常落库
+        """
+        attempt = 0
+        while True:
+            try:
+                self._apply(batch)
+                return []
+            except sqlite3.Error as e:
+                attempt += 1
+                add_log("error", f"批量写入账单失败（第{attempt}次）: {str(e)}")
+                time.sleep(min(5.0, 0.5 * attempt))
+            except Exception as e:
+                if len(batch) == 1:
+                    add_log("error", f"账单事件 {batch[0].get('event_id')} 无法处理: {str(e)}", include_trace=True)
+                    return batch
+                failed = []
+                for event in batch:
+                    failed.extend(self._write_batch([event]))
+                return failed
+
+    def _dead_letter(self, events: List[Dict[str, Any]]) -> bool:
+        """把无法处理的事件追加到死信文件，需人工核对后补记；写入失败时返回 False"""
+        try:
+            with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(event, ensure_ascii=False) + '\n' for event in events))
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            add_log("error", f"写入计费死信文件失败，{len(events)} 条事件保留在计费日志中: {str(e)}")
+            return False
+        add_log("error", f"{len(events)} 条账单事件无法落库，已转入 {os.path.basename(self.dead_letter_path)}")
+        return True
+
+    def _apply(self, batch: List[Dict[str, Any]]):
+        """在连接池写连接的一个 BEGIN IMMEDIATE 事务中写入一批事件
+
+        写连接只在本批次内占用：恢复数据库时 pool.quiesce() 会等到批次结束，
+        替换文件之后的批次写入新的数据库文件
+        """
+        with get_pool(self.db_path).writer() as conn:
+            for event in batch:
+                # 重启后重放的事件可能已经落库
+                if self.ledger._is_applied(conn, event['event_id']):
+                    continue
+                # 单个事件失败只回滚该事件，不影响同批的其他事件
+                conn.execute('SAVEPOINT billing_event')
+                # 预授权的结算按实际字数记账，余额不足时记为负数
+                balance = self.ledger.charge(
+                    conn, event['user_id'], event['api_name'], event['operation'],
+                    event['input_letters'], event['output_letters'],
+                    operation_id=event['event_id'], timestamp=event['timestamp'],
+                    require_balance=not event.get('hold_id')
+                )
+                status = 'settled'
+                if balance is None:
+                    # 提交时已检查余额，只有在队列外扣减了积分时才会出现
+                    conn.execute('ROLLBACK TO billing_event')
+                    add_log("error", f"用户 {event['user_id']} 积分不足，账单 {event['event_id']} 未记录")
+                    status = 'released'
+                if event.get('hold_id'):
+                    conn.execute(
+                        "UPDATE point_holds SET status = ?, settled_amount = ?, closed_at = ? "
+                        "WHERE hold_id = ? AND status IN ('held', 'expired')",
+                        (status, event['points'] if balance is not None else None,
+                         event['timestamp'], event['hold_id'])
+                    )
+                conn.execute('RELEASE billing_event')
+
+        for user_id in {event['user_id'] for event in batch}:
+            invalidate_user(user_id)
+
+        add_log("info", f"批量记录 {len(batch)} 条账单")
+
+    def _compact_journal(self):
+        """去掉本进程日志中已落库的事件，需持有 _lock"""
+        if self._outstanding and self._journal.tell() < self.journal_max_bytes:
+            return
+        tmp_path = self.journal_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for event in self._outstanding.values():
+                f.write(json.dumps(event, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal.close()
+        os.replace(tmp_path, self.journal_path)
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待所有已确认的事件落库"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while self._outstanding:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 10.0):
+        """停止接收新事件，等待队列写完后关闭"""
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+        self._queue.put(None)
+        self._writer.join(timeout)
+        with self._lock:
+            self._journal.close()
+            if not self._outstanding:
+                # 全部落库后删除本进程的日志，避免每个进程留下一个空文件
+                for path in (self.journal_path, self.journal_path + '.lock'):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            self._owner_lock.close()
+
+
+_queue_instance: Optional[BillingQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_billing_queue(config: Optional[Dict[str, Any]] = None) -> BillingQueue:
+    """获取进程级共享的计费队列"""
+    global _queue_instance
+    with _queue_lock:
+        if _queue_instance is None:
+            settings = dict(DEFAULT_BILLING_QUEUE_CONFIG)
+            settings.update((config or {}).get("billing_queue", {}))
+            _queue_instance = BillingQueue(
+                batch_size=int(settings["batch_size"]),
+                flush_interval=float(settings["flush_interval"]),
+                journal_max_bytes=int(settings["journal_max_bytes"]),
+                cost_per_char=float(settings["cost_per_char"]),
+                hold_output_chars=int(settings["hold_output_chars"]),
+                hold_ttl=float(settings["hold_ttl"]),
+                chars_per_token=float(settings["chars_per_token"])
+            )
+        return _queue_instance
+
+
+def close_billing_queue():
+    """关闭进程级共享的计费队列，之后再次获取会重新创建（由 modules.resources 在退出时调用）"""
+    global _queue_instance
+    with _queue_lock:
+        queue, _queue_instance = _queue_instance, None
+    if queue is not None:
+        queue.close()
@@ -1,9 +1,12 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime
-import plotly.express as px
 from user.user_process import UserManager
 from user.logger import add_log
+from user.user_cache import invalidate_user
+from modules.lazy import lazy_import
+
+pd = lazy_import('pandas')
+px = lazy_import('plotly.express')
 
 class PointsManager:
     def __init__(self):
@@ -32,7 +35,7 @@ class PointsManager:
         finally:
             conn.close()
     
-    def get_points_history(self, user_id: str) -> pd.DataFrame:
+    def get_points_history(self, user_id: str) -> 'pd.DataFrame':
         """获取积分历史记录"""
         conn = self.user_mgr.get_db_connection()
         try:
@@ -83,6 +86,7 @@ class PointsManager:
             ))
             
             conn.commit()
+            invalidate_user(user_id)
             add_log("info", f"用户 {user_id} 增加 {amount} 积分")
             return True
             
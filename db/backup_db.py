@@ -1,42 +1,179 @@
-"""数据库备份模块"""
+"""
+数据库备份模块
+通过 SQLite 在线备份接口（sqlite3.Connection.backup）分步复制数据库，每步之间让出锁，WAL 模式下不阻塞写入。
+备份文件用 gzip 压缩，分为两种：
+    full   完整快照（.db.gz），同时保存每一页的摘要（.pages），供之后的增量备份比对
+    delta  与某个完整快照相比发生变化的页（.delta.gz），恢复时先解压完整快照，再写回这些页
+每次备份和删除都在 db/backup/manifest.jsonl 末尾追加一行，不再整体重写备份记录；
+各类备份（auto/manual/upgrade/restore_backup）按 retention 配置分别保留最近的若干份。
+restore_backup 先在临时文件中还原并校验备份，通过后暂停连接池、原子替换数据库文件
+"""
 import os
+import gzip
 import json
+import time
 import shutil
-from datetime import datetime
-from pathlib import Path
+import struct
+import hashlib
 import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+from db.history_codec import decode_content
+from db.migrations import SCHEMA_VERSION, invalidate, migrate
+from db.pool import DB_PATH, ROOT_DIR, get_pool
+from user.logger import add_log
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，只做进程内互斥
+    fcntl = None
+
+BACKUP_ROOT = os.path.join(ROOT_DIR, 'db', 'backup')
+MANIFEST_PATH = os.path.join(BACKUP_ROOT, 'manifest.jsonl')
+LEGACY_MANIFEST_PATH = os.path.join(BACKUP_ROOT, 'db.json')
+CONFIG_PATH = os.path.join(ROOT_DIR, 'config', 'config.json')
+
+# 默认配置，可在 config.json 的 backup 中覆盖
+DEFAULT_BACKUP_CONFIG = {
+    "step_pages": 1024,                 # 每步复制的页数
+    "step_sleep": 0.005,                # 每步之间让出锁的时间（秒）
+    "max_restarts": 3,                  # 复制期间其他连接写入会使备份从头开始，超过该次数后改为一步复制完成
+    "compress_level": 6,                # gzip 压缩级别
+    "incremental_reasons": ["auto"],    # 这些原因的备份在有可用的完整快照时只保存变化的页
+    "full_interval_hours": 24,          # 完整快照超过该时长后重新做完整备份
+    "max_delta_ratio": 0.5,             # 变化的页超过该比例时直接做完整备份
+    "retention": {"auto": 48, "manual": 20, "upgrade": 10, "restore_backup": 10},
+    "default_retention": 20,            # 未在 retention 中列出的备份原因保留的份数
+    "quiesce_timeout": 30               # 恢复时等待已借出的数据库连接归还的秒数
+}
+
+DIGEST_SIZE = 8
+DELTA_MAGIC = b'PRFDELT1'
+DELTA_HEADER = struct.Struct('>8sIII')  # 魔数、页大小、快照页数、变化页数
+DELTA_PAGE = struct.Struct('>I')        # 页号（从1开始）
+
+_backup_lock = threading.Lock()
+
+
+class _BackupRestarted(Exception):
+    """分步复制被其他连接的写入打断的次数过多"""
+
+
+def _load_settings() -> Dict[str, Any]:
+    settings = dict(DEFAULT_BACKUP_CONFIG)
+    try:
+        with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
+            settings.update(json.load(f).get('backup', {}))
+    except (OSError, ValueError) as e:
+        add_log("warning", f"读取备份配置失败，使用默认配置: {str(e)}")
+    return settings
+
+
+@contextmanager
+def _file_lock() -> Iterator[None]:
+    """备份、清理和追加备份记录的跨进程锁（定时任务和管理界面可能同时备份）"""
+    with _backup_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(BACKUP_ROOT, '.lock'), 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _append_manifest(events: List[Dict[str, Any]]):
+    with open(MANIFEST_PATH, 'a', encoding='utf-8') as f:
+        for event in events:
+            f.write(json.dumps(event, ensure_ascii=False) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _import_legacy_manifest():
+    """第一次使用 manifest.jsonl 时导入旧的 db.json 记录（未压缩的完整备份，路径相对项目根目录）"""
+    if os.path.exists(MANIFEST_PATH) or not os.path.exists(LEGACY_MANIFEST_PATH):
+        return
+    try:
+        with open(LEGACY_MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            legacy = json.load(f)
+    except (OSError, ValueError) as e:
+        add_log("error", f"读取旧备份记录失败: {str(e)}")
+        return
+    events = []
+    for record in legacy:
+        path = os.path.join(ROOT_DIR, record.get('path') or record['filename'])
+        events.append({
+            **record,
+            'event': 'backup',
+            'path': os.path.relpath(path, BACKUP_ROOT),
+            'kind': 'full',
+            'compression': None
+        })
+    _append_manifest(events)
+    add_log("info", f"已导入 {len(events)} 条旧备份记录")
+
+
+def _read_manifest() -> Dict[str, Dict[str, Any]]:
+    """重放 manifest.jsonl，返回 文件名 -> 备份记录（按备份顺序）"""
+    records: Dict[str, Dict[str, Any]] = {}
+    if not os.path.exists(MANIFEST_PATH):
+        return records
+    with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue  # 写入中断留下的半行
+            if event.get('event') == 'delete':
+                records.pop(event['filename'], None)
+            else:
+                records[event['filename']] = {k: v for k, v in event.items() if k != 'event'}
+    return records
+
+
+def list_backups() -> List[Dict[str, Any]]:
+    """所有备份记录，按备份时间从早到晚排列"""
+    os.makedirs(BACKUP_ROOT, exist_ok=True)
+    with _file_lock():
+        _import_legacy_manifest()
+        return list(_read_manifest().values())
+
+
+def find_backup(filename: str) -> Optional[Dict[str, Any]]:
+    return next((r for r in list_backups() if r['filename'] == filename), None)
+
+
+def backup_file_path(record: Dict[str, Any]) -> str:
+    """备份文件的绝对路径"""
+    return os.path.join(BACKUP_ROOT, record['path'])
+
 
 def get_backup_info(db_path: str) -> dict:
     """获取数据库信息
-    
+
     Args:
         db_path: 数据库文件路径
-        
+
     Returns:
         包含用户数等信息的字典
     """
     try:
         conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # 获取用户数
-        cursor.execute("SELECT COUNT(*) FROM users")
-        user_count = cursor.fetchone()[0]
-        
-        # 获取其他统计信息
-        cursor.execute("SELECT COUNT(*) FROM bills")
-        bill_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM history")
-        history_count = cursor.fetchone()[0]
-        
-        conn.close()
-        
-        return {
-            "user_count": user_count,
-            "bill_count": bill_count,
-            "history_count": history_count
-        }
+        try:
+            return {
+                "user_count": conn.execute("SELECT COUNT(*) FROM users").fetchone()[0],
+                "bill_count": conn.execute("SELECT COUNT(*) FROM bills").fetchone()[0],
+                "history_count": conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+            }
+        finally:
+            conn.close()
     except Exception as e:
         return {
             "user_count": 0,
@@ -45,66 +182,415 @@ def get_backup_info(db_path: str) -> dict:
             "error": str(e)
         }
 
+
+def _snapshot(source_path: str, target_path: str, settings: Dict[str, Any]):
+    """用在线备份接口把数据库复制到 target_path
+
+    每步复制 step_pages 页；其他连接在步与步之间写入时 SQLite 会从头重新复制，
+    重来超过 max_restarts 次后改为一步复制完成（WAL 模式下只持有读快照，同样不阻塞写入）
+    """
+    state = {'remaining': None, 'restarts': 0}
+
+    def progress(status, remaining, total):
+        if state['remaining'] is not None and remaining > state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > int(settings['max_restarts']):
+                raise _BackupRestarted()
+        state['remaining'] = remaining
+
+    with get_pool(source_path).reader() as src:
+        target = sqlite3.connect(target_path)
+        try:
+            try:
+                src.backup(target, pages=int(settings['step_pages']), progress=progress,
+                           sleep=float(settings['step_sleep']))
+            except _BackupRestarted:
+                add_log("warning", f"分步备份被写入打断 {state['restarts']} 次，改为一次复制")
+                src.backup(target, pages=-1)
+            # 快照单独保存，不依赖 WAL 文件
+            target.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            target.close()
+
+
+def _pages(path: str, page_size: int) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        while True:
+            page = f.read(page_size)
+            if not page:
+                return
+            yield page
+
+
+def _digest(page: bytes) -> bytes:
+    return hashlib.blake2b(page, digest_size=DIGEST_SIZE).digest()
+
+
+def _write_full(snapshot: str, target: str, page_size: int, level: int):
+    """压缩保存完整快照，同时写出每页摘要"""
+    with gzip.open(target, 'wb', compresslevel=level) as out, open(target + '.pages', 'wb') as digests:
+        for page in _pages(snapshot, page_size):
+            out.write(page)
+            digests.write(_digest(page))
+
+
+def _read_digests(path: str) -> List[bytes]:
+    with open(path, 'rb') as f:
+        data = f.read()
+    return [data[i:i + DIGEST_SIZE] for i in range(0, len(data), DIGEST_SIZE)]
+
+
+def _changed_pages(snapshot: str, page_size: int, base_digests: List[bytes]) -> List[int]:
+    return [
+        page_no for page_no, page in enumerate(_pages(snapshot, page_size), start=1)
+        if page_no > len(base_digests) or base_digests[page_no - 1] != _digest(page)
+    ]
+
+
+def _write_delta(snapshot: str, target: str, page_size: int, page_count: int, changed: List[int], level: int):
+    """压缩保存变化的页：头部之后依次是 页号 + 页内容"""
+    with open(snapshot, 'rb') as src, gzip.open(target, 'wb', compresslevel=level) as out:
+        out.write(DELTA_HEADER.pack(DELTA_MAGIC, page_size, page_count, len(changed)))
+        for page_no in changed:
+            src.seek((page_no - 1) * page_size)
+            out.write(DELTA_PAGE.pack(page_no))
+            out.write(src.read(page_size))
+
+
+def _find_base(records: Dict[str, Dict[str, Any]], page_size: int, settings: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """最近一次可作为增量基准的完整快照：页大小相同、保存了页摘要且未超过 full_interval_hours"""
+    oldest = datetime.now() - timedelta(hours=float(settings['full_interval_hours']))
+    for record in reversed(list(records.values())):
+        if record.get('kind') != 'full' or record.get('page_size') != page_size:
+            continue
+        if datetime.strptime(record['datetime'], '%Y-%m-%d %H:%M:%S') < oldest:
+            return None
+        if os.path.exists(backup_file_path(record) + '.pages'):
+            return record
+    return None
+
+
+def _new_name(backup_dir: str, timestamp: str, reason: str, suffix: str) -> str:
+    name = f"{timestamp}_{reason}{suffix}"
+    counter = 1
+    while os.path.exists(os.path.join(backup_dir, name)):
+        counter += 1
+        name = f"{timestamp}_{reason}_{counter}{suffix}"
+    return name
+
+
+def create_backup(reason: str = "manual", operator: str = "system", path: Optional[str] = None) -> Dict[str, Any]:
+    """创建一份备份并追加备份记录，返回该记录；失败时抛出异常
+
+    incremental_reasons 中的备份在有可用的完整快照时只保存变化的页，其余备份都是完整快照
+    """
+    settings = _load_settings()
+    source = os.path.abspath(path or DB_PATH)
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"源数据库文件不存在: {source}")
+
+    backup_dir = os.path.join(BACKUP_ROOT, reason)
+    os.makedirs(backup_dir, exist_ok=True)
+    level = int(settings['compress_level'])
+    started = time.monotonic()
+
+    with _file_lock():
+        _import_legacy_manifest()
+        records = _read_manifest()
+        fd, snapshot = tempfile.mkstemp(suffix='.db', dir=BACKUP_ROOT)
+        os.close(fd)
+        target = None
+        try:
+            _snapshot(source, snapshot, settings)
+            conn = sqlite3.connect(snapshot)
+            try:
+                page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+                page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+            finally:
+                conn.close()
+            db_info = get_backup_info(snapshot)
+
+            now = datetime.now()
+            timestamp = now.strftime('%Y%m%d_%H%M%S')
+            record = {
+                'event': 'backup',
+                'timestamp': timestamp,
+                'datetime': now.strftime('%Y-%m-%d %H:%M:%S'),
+                'reason': reason,
+                'operator': operator,
+                'user_count': db_info['user_count'],
+                'bill_count': db_info['bill_count'],
+                'history_count': db_info['history_count'],
+                'compression': 'gzip',
+                'page_size': page_size,
+                'page_count': page_count,
+                'db_size': page_size * page_count
+            }
+
+            base = _find_base(records, page_size, settings) if reason in settings['incremental_reasons'] else None
+            changed = None
+            if base is not None:
+                changed = _changed_pages(snapshot, page_size, _read_digests(backup_file_path(base) + '.pages'))
+                if len(changed) > float(settings['max_delta_ratio']) * page_count:
+                    changed = None
+
+            if changed is None:
+                filename = _new_name(backup_dir, timestamp, reason, '.db.gz')
+                target = os.path.join(backup_dir, filename)
+                _write_full(snapshot, target, page_size, level)
+                record.update(kind='full')
+            else:
+                filename = _new_name(backup_dir, timestamp, reason, '.delta.gz')
+                target = os.path.join(backup_dir, filename)
+                _write_delta(snapshot, target, page_size, page_count, changed, level)
+                record.update(kind='delta', base=base['filename'], changed_pages=len(changed))
+
+            record.update(
+                filename=filename,
+                path=os.path.relpath(target, BACKUP_ROOT),
+                file_size=os.path.getsize(target),
+                duration=round(time.monotonic() - started, 3)
+            )
+            _append_manifest([record])
+        except BaseException:
+            for leftover in (target, target and target + '.pages'):
+                if leftover and os.path.exists(leftover):
+                    os.remove(leftover)
+            raise
+        finally:
+            os.remove(snapshot)
+
+        record.pop('event')
+        records[record['filename']] = record
+        _apply_retention(records, settings)
+
+    add_log("info", f"数据库备份成功: {record['filename']}（{record['kind']}，{record['file_size']} 字节，"
+                    f"耗时 {record['duration']} 秒）")
+    return record
+
+
 def backup_database(reason: str = "manual", operator: str = "system") -> bool:
     """备份数据库
-    
+
     Args:
-        reason: 备份原因 (manual/auto/upgrade)
+        reason: 备份原因 (manual/auto/upgrade/restore_backup)
         operator: 操作者
-        
+
     Returns:
         是否成功
     """
     try:
-        # 确保备份目录存在
-        backup_root = Path("db/backup")
-        backup_root.mkdir(parents=True, exist_ok=True)
-        
-        # 创建子目录
-        (backup_root / "auto").mkdir(exist_ok=True)
-        (backup_root / "manual").mkdir(exist_ok=True)
-        (backup_root / "upgrade").mkdir(exist_ok=True)
-        
-        # 确定备份文件名和路径
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_name = f"{timestamp}_{reason}.db"
-        backup_dir = backup_root / reason
-        backup_path = backup_dir / backup_name
-        
-        # 复制数据库文件
-        shutil.copy2('db/users.db', backup_path)
-        
-        # 获取数据库信息
-        db_info = get_backup_info(str(backup_path))
-        
-        # 更新备份记录
-        backup_json = backup_root / "db.json"
-        if backup_json.exists():
-            with open(backup_json, 'r', encoding='utf-8') as f:
-                backups = json.load(f)
-        else:
-            backups = []
-            
-        # 添加新的备份记录
-        backups.append({
-            "filename": backup_name,
-            "path": str(backup_path),
-            "timestamp": timestamp,
-            "datetime": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            "reason": reason,
-            "operator": operator,
-            "user_count": db_info["user_count"],
-            "bill_count": db_info["bill_count"],
-            "history_count": db_info["history_count"],
-            "file_size": os.path.getsize(backup_path)
-        })
-        
-        # 保存备份记录
-        with open(backup_json, 'w', encoding='utf-8') as f:
-            json.dump(backups, f, ensure_ascii=False, indent=2)
-            
+        create_backup(reason=reason, operator=operator)
         return True
-        
     except Exception as e:
-        print(f"备份失败: {str(e)}")
-        return False 
\ No newline at end of file
+        add_log("error", f"数据库备份失败: {str(e)}")
+        return False
+
+
+def materialize_backup(record: Dict[str, Any], target_path: str):
+    """把一份备份还原成普通的数据库文件 target_path（增量备份先还原其完整快照，再写回变化的页）"""
+    if record.get('kind') == 'delta':
+        base = find_backup(record['base'])
+        if base is None:
+            raise FileNotFoundError(f"增量备份的完整快照不存在: {record['base']}")
+        materialize_backup(base, target_path)
+        with gzip.open(backup_file_path(record), 'rb') as delta, open(target_path, 'r+b') as out:
+            magic, page_size, page_count, changed = DELTA_HEADER.unpack(delta.read(DELTA_HEADER.size))
+            if magic != DELTA_MAGIC:
+                raise ValueError(f"增量备份文件格式错误: {record['filename']}")
+            for _ in range(changed):
+                page_no, = DELTA_PAGE.unpack(delta.read(DELTA_PAGE.size))
+                out.seek((page_no - 1) * page_size)
+                out.write(delta.read(page_size))
+            out.truncate(page_count * page_size)
+        return
+
+    if record.get('compression') == 'gzip':
+        with gzip.open(backup_file_path(record), 'rb') as src, open(target_path, 'wb') as out:
+            shutil.copyfileobj(src, out)
+        return
+
+    # 旧的未压缩备份是直接复制的数据库文件（可能处于 WAL 模式），用在线备份接口复制成独立的文件
+    src = sqlite3.connect(backup_file_path(record))
+    try:
+        target = sqlite3.connect(target_path)
+        try:
+            src.backup(target)
+            target.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            target.close()
+    finally:
+        src.close()
+
+
+def _apply_retention(records: Dict[str, Dict[str, Any]], settings: Dict[str, Any]):
+    """每种备份原因只保留最近的若干份；仍被保留的增量备份引用的完整快照不删除"""
+    by_reason: Dict[str, List[Dict[str, Any]]] = {}
+    for record in records.values():
+        by_reason.setdefault(record['reason'], []).append(record)
+
+    expired = []
+    for reason, items in by_reason.items():
+        keep = int(settings['retention'].get(reason, settings['default_retention']))
+        expired.extend(items[:max(len(items) - keep, 0)])
+    expired_names = {r['filename'] for r in expired}
+    referenced = {r['base'] for r in records.values() if r.get('kind') == 'delta' and r['filename'] not in expired_names}
+
+    events = []
+    for record in expired:
+        if record['filename'] in referenced:
+            continue
+        path = backup_file_path(record)
+        for leftover in (path, path + '.pages'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        records.pop(record['filename'])
+        events.append({'event': 'delete', 'filename': record['filename']})
+    if events:
+        _append_manifest(events)
+        add_log("info", f"清理过期备份 {len(events)} 份")
+
+
+@contextmanager
+def _timed(timings: Dict[str, float], stage: str) -> Iterator[None]:
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        timings[stage] = round(time.monotonic() - started, 3)
+
+
+def verify_database(path: str) -> Dict[str, Any]:
+    """检查数据库文件能否用于恢复：完整性检查通过、已初始化且 schema 版本不高于当前程序
+
+    Returns:
+        {'ok': bool, 'message': str, 'version': int}
+    """
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        # 新版本的 integrity_check 会检查全文索引，索引的视图用到 history_content()
+        conn.create_function('history_content', 1, decode_content, deterministic=True)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        problems = [row[0] for row in conn.execute("PRAGMA integrity_check(10)")]
+        initialized = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users'"
+        ).fetchone() is not None
+    except sqlite3.DatabaseError as e:
+        return {'ok': False, 'message': f"备份文件已损坏: {str(e)}", 'version': 0}
+    finally:
+        conn.close()
+
+    if problems != ['ok']:
+        return {'ok': False, 'message': f"完整性检查失败: {'; '.join(problems)}", 'version': version}
+    if not initialized:
+        return {'ok': False, 'message': "备份中没有用户表", 'version': version}
+    if version > SCHEMA_VERSION:
+        return {'ok': False, 'version': version,
+                'message': f"备份的数据库版本 {version} 高于当前程序支持的版本 {SCHEMA_VERSION}"}
+    return {'ok': True, 'message': f"校验通过（版本 {version}）", 'version': version}
+
+
+def _swap(staging: str, target: str, rollback: str):
+    """用 staging 原子替换 target，原文件以硬链接保留为 rollback；调用方需已暂停连接池"""
+    conn = sqlite3.connect(target)
+    try:
+        busy = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()[0]
+    finally:
+        conn.close()
+    if busy:
+        raise RuntimeError("其他进程正在读写数据库，无法完成检查点，请先停止定时任务等进程后重试")
+
+    if os.path.exists(rollback):
+        os.remove(rollback)
+    try:
+        os.link(target, rollback)
+    except OSError:
+        shutil.copy2(target, rollback)
+    shutil.copymode(target, staging)
+    os.replace(staging, target)
+    # 原文件的 WAL 已在检查点后清空，不能留给新文件
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(target + suffix):
+            os.remove(target + suffix)
+
+
+def restore_backup(filename: str, operator: str = "system", dry_run: bool = False,
+                   path: Optional[str] = None) -> Dict[str, Any]:
+    """从备份恢复数据库
+
+    1. 把备份还原到数据库所在目录的临时文件中
+    2. 检查临时文件的完整性和 schema 版本，不通过时当前数据库不受影响
+    3. 对当前数据库做一次恢复前备份（restore_backup）
+    4. 暂停本进程的连接池，用临时文件原子替换数据库文件；需要时升级 schema，升级失败则换回原文件
+    dry_run 只执行前两步，用于确认备份可用并预估恢复耗时。
+    其他进程（如定时任务）的连接不在协调范围内，恢复前应先停止
+
+    Returns:
+        {'success': bool, 'message': str, 'dry_run': bool,
+         'timings': {阶段: 秒}, 'bytes': 数据库大小, 'throughput': 还原阶段的速度（MB/s）}
+    """
+    settings = _load_settings()
+    target = os.path.abspath(path or DB_PATH)
+    timings: Dict[str, float] = {}
+    result = {'success': False, 'message': '', 'dry_run': dry_run, 'timings': timings, 'bytes': 0, 'throughput': 0.0}
+
+    record = find_backup(filename)
+    if record is None or not os.path.exists(backup_file_path(record)):
+        result['message'] = f"备份文件不存在: {filename}"
+        return result
+    if not dry_run and not os.path.exists(target):
+        result['message'] = f"当前数据库文件不存在: {target}"
+        return result
+
+    started = time.monotonic()
+    fd, staging = tempfile.mkstemp(prefix=os.path.basename(target) + '.restore-', dir=os.path.dirname(target))
+    os.close(fd)
+    rollback = target + '.pre-restore'
+    try:
+        with _timed(timings, 'materialize'):
+            materialize_backup(record, staging)
+        result['bytes'] = os.path.getsize(staging)
+        if timings['materialize'] > 0:
+            result['throughput'] = round(result['bytes'] / 1048576 / timings['materialize'], 2)
+
+        with _timed(timings, 'verify'):
+            check = verify_database(staging)
+        if not check['ok']:
+            result['message'] = check['message']
+            return result
+        if dry_run:
+            result.update(success=True, message=f"试运行完成，备份可以恢复（{check['message']}）")
+            return result
+
+        with _timed(timings, 'pre_backup'):
+            create_backup(reason='restore_backup', operator=operator, path=target)
+
+        pool = get_pool(target)
+        with _timed(timings, 'swap'):
+            with pool.quiesce(float(settings['quiesce_timeout'])):
+                _swap(staging, target, rollback)
+        invalidate(target)
+
+        with _timed(timings, 'migrate'):
+            migrated = migrate(target)
+        if not migrated['success']:
+            with pool.quiesce(float(settings['quiesce_timeout'])):
+                os.replace(rollback, target)
+            invalidate(target)
+            result['message'] = f"恢复后升级数据库失败，已换回原数据库: {migrated['message']}"
+            return result
+
+        result.update(success=True, message=f"数据库已从备份 {filename} 恢复")
+        return result
+    except Exception as e:
+        result['message'] = f"数据库恢复失败: {str(e)}"
+        add_log("error", result['message'])
+        return result
+    finally:
+        for leftover in (staging, rollback):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        timings['total'] = round(time.monotonic() - started, 3)
+        add_log("info" if result['success'] else "error",
+                f"{'试运行' if dry_run else ''}恢复备份 {filename}: {result['message']}，"
+                f"耗时 {timings}，{result['bytes']} 字节，{result['throughput']} MB/s")
@@ -10,7 +10,6 @@ from db.migrate_data import show_migrate_interface
 from db.db_table import show_table_info
 from db.db_upgrade import upgrade_database
 from user.logger import add_log
-import pandas as pd
 
 def show_db_admin():
     """显示数据库管理界面"""
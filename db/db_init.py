@@ -1,13 +1,15 @@
-import sqlite3
 import hashlib
 from datetime import datetime
 import uuid
 from user.logger import add_log
+from db.migrations import migrate
+from db.pool import get_pool
 
 def init_database() -> bool:
     """初始化数据库"""
     try:
-        conn = sqlite3.connect('db/users.db')
+        # 连接池中的连接注册了 history 表触发器用到的 history_content()
+        conn = get_pool().connection()
         c = conn.cursor()
         
         # 创建用户表
@@ -141,6 +143,10 @@ def init_database() -> bool:
             ))
         
         conn.commit()
+        
+        # 补齐索引等后续版本的变更并记录 schema 版本号
+        if not migrate()['success']:
+            return False
         add_log("info", "数据库初始化成功")
         return True
         
@@ -1,141 +1,39 @@
 import streamlit as st
-import json
-from pathlib import Path
-import shutil
+import os
 from datetime import datetime
 import humanize
 from modules.logger import add_log
-import sqlite3
+from db.backup_db import backup_database, backup_file_path, find_backup, list_backups, restore_backup
 
-def backup_database(reason: str = "manual", operator: str = "system") -> bool:
-    """备份数据库"""
-    try:
-        # 创建备份目录
-        backup_root = Path("db/backup")
-        backup_root.mkdir(parents=True, exist_ok=True)
-        
-        # 生成备份文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_file = f"users_{timestamp}_{reason}.db"
-        backup_path = backup_root / backup_file
-        
-        # 确保源数据库文件存在
-        source_db = Path('db/users.db')
-        if not source_db.exists():
-            add_log("error", "源数据库文件不存在")
-            return False
-            
-        # 复制数据库文件
-        try:
-            shutil.copy2(source_db, backup_path)
-            add_log("info", f"数据库文件已复制到: {backup_path}")
-        except Exception as e:
-            add_log("error", f"复制数据库文件失败: {str(e)}")
-            return False
-        
-        # 获取数据库统计信息
-        try:
-            conn = sqlite3.connect('db/users.db')
-            cursor = conn.cursor()
-            
-            # 获取各表的记录数
-            stats = {}
-            for table in ['users', 'bills', 'history']:
-                cursor.execute(f"SELECT COUNT(*) FROM {table}")
-                stats[table] = cursor.fetchone()[0]
-            
-            conn.close()
-        except Exception as e:
-            add_log("error", f"获取数据库统计信息失败: {str(e)}")
-            stats = {'users': 0, 'bills': 0, 'history': 0}
-        
-        # 获取文件大小
-        file_size = backup_path.stat().st_size
-        
-        # 更新备份记录
-        backup_json = backup_root / "db.json"
-        backups = []
-        if backup_json.exists():
-            try:
-                with open(backup_json, 'r', encoding='utf-8') as f:
-                    backups = json.load(f)
-            except Exception as e:
-                add_log("error", f"读取备份记录失败: {str(e)}")
-                backups = []
-        
-        # 添加新的备份记录
-        backup_record = {
-            'datetime': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'filename': backup_file,
-            'path': str(backup_path),
-            'reason': reason,
-            'operator': operator,
-            'file_size': file_size,
-            'user_count': stats.get('users', 0),
-            'bill_count': stats.get('bills', 0),
-            'history_count': stats.get('history', 0)
-        }
-        
-        backups.append(backup_record)
-        
-        # 保存备份记录
-        try:
-            with open(backup_json, 'w', encoding='utf-8') as f:
-                json.dump(backups, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            add_log("error", f"保存备份记录失败: {str(e)}")
-            # 即使保存记录失败，备份本身是成功的
-        
-        add_log("info", f"数据库备份成功: {backup_file}")
-        return True
-        
-    except Exception as e:
-        add_log("error", f"数据库备份失败: {str(e)}")
-        return False
+def _show_restore_result(result: dict):
+    """显示恢复各阶段的耗时和还原速度"""
+    stage_names = {
+        'materialize': '还原到临时文件',
+        'verify': '完整性和版本校验',
+        'pre_backup': '恢复前备份',
+        'swap': '替换数据库文件',
+        'migrate': '升级数据库',
+        'total': '总耗时'
+    }
+    st.caption(
+        f"数据库大小 {humanize.naturalsize(result['bytes'])}，还原速度 {result['throughput']} MB/s；"
+        + "，".join(f"{stage_names.get(stage, stage)} {seconds} 秒" for stage, seconds in result['timings'].items())
+    )
 
-def restore_database(backup_file: str) -> bool:
-    """从备份文件恢复数据库"""
+def restore_database(backup_file: str, dry_run: bool = False) -> bool:
+    """从备份文件恢复数据库，dry_run 时只还原并校验备份、不替换当前数据库"""
     try:
-        # 验证备份文件
-        backup_root = Path("db/backup")
-        backup_path = backup_root / backup_file
-        
-        if not backup_path.exists():
-            error_msg = f"备份文件不存在: {backup_file}"
-            add_log("error", error_msg)
-            st.error(error_msg)
-            return False
-            
-        # 确保数据库���件存在
-        db_file = Path('db/users.db')
-        if not db_file.exists():
-            add_log("error", "当前数据库文件不存在")
-            return False
-            
-        # 先备份当前数据库
-        backup_result = backup_database(
-            reason="restore_backup",
-            operator=st.session_state.get('user', 'system')
+        result = restore_backup(
+            backup_file,
+            operator=st.session_state.get('user', 'system'),
+            dry_run=dry_run
         )
-        
-        if not backup_result:
-            error_msg = "恢复前备份失败"
-            add_log("error", error_msg)
-            st.error(error_msg)
-            return False
-            
-        # 恢复数据库
-        try:
-            shutil.copy2(backup_path, db_file)
-            success_msg = f"数据库已从备份 {backup_file} 恢复"
-            add_log("info", success_msg)
-            st.success(success_msg)
-            return True
-        except Exception as e:
-            error_msg = f"复制备份文件失败: {str(e)}"
-            add_log("error", error_msg)
-            st.error(error_msg)
-            return False
+        if result['success']:
+            st.success(result['message'])
+        else:
+            st.error(result['message'])
+        _show_restore_result(result)
+        return result['success']
         
     except Exception as e:
         error_msg = f"数据库恢复失败: {str(e)}"
@@ -163,23 +61,17 @@ def show_restore_interface():
     st.markdown("---")
     st.markdown("### 可用备份")
     
-    # 读取备份记录
-    backup_root = Path("db/backup")
-    backup_json = backup_root / "db.json"
-    
-    if not backup_json.exists():
-        st.warning("未找到备份记录")
-        return
-        
     try:
-        with open(backup_json, 'r', encoding='utf-8') as f:
-            backups = json.load(f)
+        # 读取备份记录
+        backups = list_backups()
+        if not backups:
+            st.warning("未找到备份记录")
+            return
             
         # 验证备份文件是否实际存在
         valid_backups = []
         for backup in backups:
-            backup_path = backup_root / backup['filename']
-            if backup_path.exists():
+            if os.path.exists(backup_file_path(backup)):
                 valid_backups.append(backup)
             else:
                 add_log("warning", f"备份记录中的文件不存在: {backup['filename']}")
@@ -210,6 +102,7 @@ def show_restore_interface():
                 '备份时间': backup['datetime'],
                 '相对时间': relative_time,
                 '备份原因': reason_text,
+                '类型': '增量' if backup.get('kind') == 'delta' else '完整',
                 '操作者': backup['operator'],
                 '用户数': backup['user_count'],
                 '账单数': backup['bill_count'],
@@ -225,6 +118,7 @@ def show_restore_interface():
                 '备份时间': st.column_config.TextColumn('备份时间', width='medium'),
                 '相对时间': st.column_config.TextColumn('距今', width='small'),
                 '备份原因': st.column_config.TextColumn('原因', width='small'),
+                '类型': st.column_config.TextColumn('类型', width='small'),
                 '操作者': st.column_config.TextColumn('操作者', width='small'),
                 '用户数': st.column_config.NumberColumn('用户数', width='small'),
                 '账单数': st.column_config.NumberColumn('账单数', width='small'),
@@ -246,6 +140,10 @@ def show_restore_interface():
                                 f"用户数: {[b for b in valid_backups if b['filename'] == x][0]['user_count']}"
         )
         
+        # 试运行：还原并校验备份，显示预计耗时，不影响当前数据库
+        if st.button("🧪 试运行恢复", use_container_width=True):
+            restore_database(selected_backup, dry_run=True)
+        
         # 添加确认对话框
         if st.button("🔄 恢复选中的备份", use_container_width=True, type="primary"):
             confirm = st.warning("⚠️ 确定要恢复此备份吗？这将覆盖当前的数据库！")
@@ -253,8 +151,7 @@ def show_restore_interface():
             with col1:
                 if st.button("✅ 确认恢复", use_container_width=True):
                     # 再次验证文件存在
-                    backup_path = backup_root / selected_backup
-                    if not backup_path.exists():
+                    if find_backup(selected_backup) is None:
                         st.error(f"备份文件不存在: {selected_backup}")
                         add_log("error", f"备份文件不存在: {selected_backup}")
                         return
@@ -1,11 +1,14 @@
-import sqlite3
 import streamlit as st
-import pandas as pd
+from modules.lazy import lazy_import
 from typing import Dict, List, Any
+from db.history_codec import decode_content  # 同时注册全文索引视图和触发器用到的 history_content()
+from db.pool import get_pool
+
+pd = lazy_import('pandas')
 
 def get_all_tables() -> List[str]:
     """获取所有表名"""
-    conn = sqlite3.connect('db/users.db')
+    conn = get_pool().connection()
     c = conn.cursor()
     
     c.execute("""
@@ -22,7 +25,7 @@ def get_all_tables() -> List[str]:
 
 def get_table_schema(table_name: str) -> str:
     """获取表的创建SQL"""
-    conn = sqlite3.connect('db/users.db')
+    conn = get_pool().connection()
     c = conn.cursor()
     
     c.execute(f"""
@@ -38,7 +41,7 @@ def get_table_schema(table_name: str) -> str:
 
 def get_table_info(table_name: str) -> List[Dict[str, Any]]:
     """获取表的详细信息"""
-    conn = sqlite3.connect('db/users.db')
+    conn = get_pool().connection()
     c = conn.cursor()
     
     c.execute(f"PRAGMA table_info({table_name})")
@@ -59,7 +62,7 @@ def get_table_info(table_name: str) -> List[Dict[str, Any]]:
 
 def get_table_stats(table_name: str) -> Dict[str, Any]:
     """获取表的统计信息"""
-    conn = sqlite3.connect('db/users.db')
+    conn = get_pool().connection()
     c = conn.cursor()
     
     # 获取记录数
@@ -131,10 +134,13 @@ def show_table_info():
                 
                 with tab3:
                     # 显示示例数据
-                    conn = sqlite3.connect('db/users.db')
+                    conn = get_pool().connection()
                     try:
                         # 只显示前5条记录
                         df = pd.read_sql_query(f"SELECT * FROM {table_name} LIMIT 5", conn)
+                        if table_name == 'history' and 'content' in df.columns:
+                            # content 可能是压缩后的 BLOB，显示解码后的原文
+                            df['content'] = df['content'].map(decode_content)
                         if not df.empty:
                             st.dataframe(df, use_container_width=True)
                         else:
@@ -146,7 +152,7 @@ def show_table_info():
                 
                 # 显示外键关系
                 try:
-                    conn = sqlite3.connect('db/users.db')
+                    conn = get_pool().connection()
                     c = conn.cursor()
                     c.execute(f"PRAGMA foreign_key_list({table_name})")
                     foreign_keys = c.fetchall()
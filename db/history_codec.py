@@ -0,0 +1,104 @@
+"""
+历史记录内容编码模块
+history.content 为 TEXT 时是未压缩的原文（旧数据或过短的内容）；为 BLOB 时第一个字节是编码方式：
+    0x01  zlib
+    0x02  zlib + 预置字典 history_v1.zdict（由 scripts/train_history_dict.py 训练）
+读写 content 都应经过 encode_content / decode_content；连接池中的连接注册了同名的
+SQL 函数 history_content(content)，供全文索引视图和触发器在SQL中解码。
+写入 history 表或读取 history_fts 的连接必须有该函数，否则报 no such function：程序内使用 get_pool() 的连接，
+单独打开的连接（脚本、sqlite3 命令行等）需先执行 conn.create_function('history_content', 1, decode_content)
+"""
+
+import zlib
+from pathlib import Path
+from typing import Optional, Union
+
+from db.pool import get_pool, register_function
+from user.logger import add_log
+
+CODEC_ZLIB = 0x01
+CODEC_ZLIB_DICT_V1 = 0x02
+
+CURRENT_CODEC = CODEC_ZLIB_DICT_V1
+MIN_COMPRESS_BYTES = 256  # 更短的内容压缩收益很小，保持原文
+COMPRESS_LEVEL = 6
+
+# 已发布的字典不能修改，否则已压缩的记录无法解码
+_DICTS = {
+    CODEC_ZLIB_DICT_V1: (Path(__file__).parent / 'history_v1.zdict').read_bytes(),
+}
+
+
+def encode_content(text: str) -> Union[str, bytes]:
+    """压缩内容，压缩后没有变小时返回原文"""
+    data = text.encode('utf-8')
+    if len(data) < MIN_COMPRESS_BYTES:
+        return text
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zdict=_DICTS[CURRENT_CODEC])
+    encoded = bytes([CURRENT_CODEC]) + compressor.compress(data) + compressor.flush()
+    return encoded if len(encoded) < len(data) else text
+
+
+def decode_content(value: Union[str, bytes, None]) -> Union[str, None]:
+    """还原 content 列的值，未压缩的原文原样返回"""
+    if value is None or isinstance(value, str):
+        return value
+    codec, payload = value[0], value[1:]
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(payload).decode('utf-8')
+    if codec in _DICTS:
+        decompressor = zlib.decompressobj(zdict=_DICTS[codec])
+        return (decompressor.decompress(payload) + decompressor.flush()).decode('utf-8')
+    raise ValueError(f"未知的历史记录编码: {codec:#04x}")
+
+
+def is_current(value: Union[str, bytes, None]) -> bool:
+    """是否已经是当前编码（或无需压缩），后台重压缩任务据此跳过"""
+    if isinstance(value, bytes):
+        return value[0] == CURRENT_CODEC
+    return value is None or len(value.encode('utf-8')) < MIN_COMPRESS_BYTES
+
+
+def recompress_history(batch_size: int = 200, max_batches: int = 0, path: Optional[str] = None) -> int:
+    """把未压缩或使用旧编码的历史记录重写为当前编码，每批一个短事务，返回重写的记录数
+
+    内容不变，全文索引的更新触发器会跳过这些记录；释放的页面由后续写入复用，
+    需要缩小数据库文件时另行执行 VACUUM
+
+    Args:
+        batch_size: 每批处理的记录数
+        max_batches: 最多处理的批数，0 表示处理完所有记录
+        path: 数据库路径，默认 db/users.db
+    """
+    pool = get_pool(path)
+    total = 0
+    batches = 0
+    last_id = 0
+    while not max_batches or batches < max_batches:
+        with pool.writer() as conn:
+            rows = conn.execute('''
+                SELECT history_id, content FROM history
+                WHERE history_id > ?
+                  AND ((typeof(content) = 'text' AND length(CAST(content AS BLOB)) >= ?)
+                       OR (typeof(content) = 'blob' AND substr(content, 1, 1) <> ?))
+                ORDER BY history_id
+                LIMIT ?
+            ''', (last_id, MIN_COMPRESS_BYTES, bytes([CURRENT_CODEC]), batch_size)).fetchall()
+            if not rows:
+                break
+            updates = []
+            for history_id, content in rows:
+                if not is_current(content):
+                    encoded = encode_content(decode_content(content))
+                    if encoded != content:
+                        updates.append((encoded, history_id))
+            conn.executemany("UPDATE history SET content = ? WHERE history_id = ?", updates)
+            last_id = rows[-1][0]
+        total += len(updates)
+        batches += 1
+    if total:
+        add_log("info", f"历史记录重新压缩 {total} 条")
+    return total
+
+
+register_function('history_content', 1, decode_content)
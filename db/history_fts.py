@@ -0,0 +1,98 @@
+"""
+历史记录全文检索模块
+history_fts 是 FTS5 外部内容表，内容来自视图 history_fts_source（从 content JSON 中取出输入和输出），
+索引本身不重复保存正文。使用 trigram 分词器，中文无需分词即可按任意连续3个字符以上的子串检索；
+history 表上的触发器在插入、修改、删除时同步更新索引，迁移前已有的记录由 backfill_history_fts 分批补建。
+索引表、视图和触发器的定义见 db/migrations.py 的 v6（创建）和 v7（视图和触发器改为先用 history_content() 解码）
+"""
+
+from typing import Any, Dict, List, Optional
+
+import db.history_codec  # noqa: F401  注册 history_content() SQL函数
+from db.pool import get_pool
+from user.logger import add_log
+
+MIN_TERM_CHARS = 3  # trigram 分词器能检索的最短子串
+SNIPPET_TOKENS = 16
+
+
+def backfill_history_fts(batch_size: int = 500, max_batches: int = 0, path: Optional[str] = None) -> int:
+    """为迁移前已有的历史记录分批补建索引，每批一个短事务，返回本次补建的记录数
+
+    Args:
+        batch_size: 每批处理的 history_id 区间长度
+        max_batches: 最多处理的批数，0 表示直到补建完成
+        path: 数据库路径，默认 db/users.db
+    """
+    total = 0
+    batches = 0
+    pool = get_pool(path)
+    while not max_batches or batches < max_batches:
+        with pool.writer() as conn:
+            row = conn.execute("SELECT last_id, target_id FROM history_fts_backfill WHERE id = 1").fetchone()
+            if not row or row[0] >= row[1]:
+                break
+            last_id, target_id = row
+            upper = min(last_id + batch_size, target_id)
+            count = conn.execute('''
+                INSERT INTO history_fts (rowid, user_id, input, output)
+                SELECT history_id, user_id, input, output FROM history_fts_source
+                WHERE history_id > ? AND history_id <= ?
+            ''', (last_id, upper)).rowcount
+            conn.execute("UPDATE history_fts_backfill SET last_id = ? WHERE id = 1", (upper,))
+        total += max(count, 0)
+        batches += 1
+    if total:
+        add_log("info", f"历史记录全文索引补建 {total} 条")
+    return total
+
+
+def _match_query(keywords: str) -> str:
+    """把用户输入的关键词转成 FTS5 查询：每个词作为短语，多个词之间为 AND"""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in keywords.split())
+
+
+def _escape_like(term: str) -> str:
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_history(user_id: str, keywords: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """在用户的历史记录中检索关键词，按相关度排序
+
+    Returns:
+        [{'history_id', 'timestamp', 'type', 'snippet'}]，snippet 中的命中词用 ** 标出
+    """
+    terms = keywords.split()
+    if not terms:
+        return []
+
+    with get_pool().reader() as conn:
+        if all(len(term) >= MIN_TERM_CHARS for term in terms):
+            # 输入的命中权重高于输出，user_id 列不参与排序
+            rows = conn.execute(f'''
+                SELECT h.history_id, h.timestamp, h.type,
+                       snippet(history_fts, -1, '**', '**', '…', {SNIPPET_TOKENS})
+                FROM history_fts
+                JOIN history h ON h.history_id = history_fts.rowid
+                WHERE history_fts MATCH ? AND h.user_id = ?
+                ORDER BY bm25(history_fts, 0.0, 2.0, 1.0)
+                LIMIT ?
+            ''', (_match_query(keywords), user_id, limit)).fetchall()
+        else:
+            # 少于3个字的词（如两个字的中文词）trigram 无法检索，退回按用户逐条匹配，按时间排序
+            condition = "(COALESCE(s.input, '') || ' ' || COALESCE(s.output, '')) LIKE ? ESCAPE '\\'"
+            conditions = " AND ".join([condition] * len(terms))
+            rows = conn.execute(f'''
+                SELECT h.history_id, h.timestamp, h.type,
+                       substr(COALESCE(NULLIF(s.input, ''), s.output), 1, 100)
+                FROM history h
+                JOIN history_fts_source s ON s.history_id = h.history_id
+                WHERE h.user_id = ? AND {conditions}
+                ORDER BY h.timestamp DESC, h.history_id DESC
+                LIMIT ?
+            ''', [user_id] + [f"%{_escape_like(term)}%" for term in terms] + [limit]).fetchall()
+
+    return [
+        {'history_id': row[0], 'timestamp': row[1], 'type': row[2], 'snippet': row[3] or ''}
+        for row in rows
+    ]
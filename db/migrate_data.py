@@ -1,15 +1,16 @@
 import json
-import sqlite3
 from datetime import datetime
 from pathlib import Path
 import streamlit as st
 from user.logger import add_log
+from user.user_history import insert_history
+from db.pool import get_pool
 import os
 import shutil
 
 def get_rose_user_id() -> str:
     """获取Rose的user_id"""
-    conn = sqlite3.connect('db/users.db')
+    conn = get_pool().connection()
     c = conn.cursor()
     
     c.execute('SELECT user_id FROM users WHERE username = ?', ('Rose',))
@@ -36,7 +37,7 @@ def migrate_bills() -> dict:
         results['details'].append(f"找到用户 Rose (ID: {user_id})")
         
         # 连接数据库
-        conn = sqlite3.connect('db/users.db')
+        conn = get_pool().connection()
         c = conn.cursor()
         
         # 读取历史账单数据
@@ -143,8 +144,8 @@ def migrate_history() -> dict:
         user_id = get_rose_user_id()
         results['details'].append(f"找到用户 Rose (ID: {user_id})")
         
-        # 连接数据库
-        conn = sqlite3.connect('db/users.db')
+        # 连接数据库（连接池中的连接注册了 history_content() 解码函数）
+        conn = get_pool().connection()
         c = conn.cursor()
         
         # 读取历史记录数据
@@ -164,7 +165,7 @@ def migrate_history() -> dict:
                     # 检查是否已存在相同记录
                     c.execute('''
                         SELECT COUNT(*) FROM history 
-                        WHERE user_id = ? AND timestamp = ? AND content = ?
+                        WHERE user_id = ? AND timestamp = ? AND history_content(content) = ?
                     ''', (
                         user_id,
                         record['timestamp'],
@@ -172,16 +173,13 @@ def migrate_history() -> dict:
                     ))
                     
                     if c.fetchone()[0] == 0:  # 如果不存在重复记录
-                        c.execute('''
-                            INSERT INTO history (
-                                user_id, timestamp, type, content
-                            ) VALUES (?, ?, ?, ?)
-                        ''', (
+                        insert_history(
+                            conn,
                             user_id,
                             record['timestamp'],
                             record.get('type', 'unknown'),
                             record['content']
-                        ))
+                        )
                         success_count += 1
                     else:
                         skip_count += 1
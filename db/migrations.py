@@ -0,0 +1,352 @@
+"""
+数据库版本迁移模块
+schema 版本保存在 PRAGMA user_version 中，MIGRATIONS 按版本号顺序列出每一步升级。
+每个进程只在第一次访问数据库时检查一次版本，需要升级时在文件锁内执行（多个进程同时启动时只有一个执行迁移），
+之后 ensure_current() 只检查进程内的标记，不再查询表结构
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+import db.history_codec  # noqa: F401  注册 v7 之后的视图和触发器用到的 history_content()
+from db.pool import DB_PATH, get_pool
+from user.logger import add_log
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，只做进程内互斥
+    fcntl = None
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _has_table(conn: sqlite3.Connection, name: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+
+def _add_column(conn: sqlite3.Connection, table: str, column: str, definition: str) -> bool:
+    """列不存在时添加，兼容未记录版本号、但已经手动升级过的旧数据库"""
+    if column in _columns(conn, table):
+        return False
+    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return True
+
+
+def _v1_history_columns(conn: sqlite3.Connection):
+    """history 表的 test_results、input_text、output_text 列，users 表的 points 列"""
+    for column in ('test_results', 'input_text', 'output_text'):
+        _add_column(conn, 'history', column, 'TEXT')
+    _add_column(conn, 'users', 'points', 'INTEGER DEFAULT 1000')
+
+
+def _v2_operation_id(conn: sqlite3.Connection):
+    """积分交易的幂等键（operation_id）及其唯一索引"""
+    _add_column(conn, 'point_transactions', 'operation_id', 'TEXT')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_point_transactions_operation_id
+        ON point_transactions(operation_id)
+        WHERE operation_id IS NOT NULL
+    ''')
+
+
+def _v3_point_holds(conn: sqlite3.Connection):
+    """积分预授权表"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS point_holds (
+            hold_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            expires_at TEXT NOT NULL,
+            settled_amount INTEGER,
+            closed_at TEXT,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_point_holds_user_status
+        ON point_holds(user_id, status)
+    ''')
+
+
+def _v4_user_timestamp_indexes(conn: sqlite3.Connection):
+    """按用户过滤、按时间排序的查询（历史记录、账单、积分明细）使用的复合索引
+
+    point_transactions 的索引带上 type 列，每日登录奖励的检查只读索引即可完成；
+    point_holds 按状态和到期时间清理过期预授权
+    """
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_history_user_timestamp ON history(user_id, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_bills_user_timestamp ON bills(user_id, timestamp)")
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_point_transactions_user_timestamp
+        ON point_transactions(user_id, timestamp, type)
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_point_holds_status_expires ON point_holds(status, expires_at)")
+    # 更新统计信息，让查询规划器按新索引选择执行计划
+    conn.execute("ANALYZE")
+
+
+def _v5_history_preview(conn: sqlite3.Connection):
+    """history 表的 preview 列：列表页只读取摘要，不再加载完整的 content
+
+    与 user.user_history.make_history_preview 一致：优先取输入，其次取输出，截取前100个字符
+    """
+    _add_column(conn, 'history', 'preview', 'TEXT')
+    conn.execute('''
+        UPDATE history SET preview = substr(
+            CASE WHEN json_valid(content) AND json_type(content) = 'object'
+                 THEN coalesce(nullif(json_extract(content, '$.input'), ''),
+                               nullif(json_extract(content, '$.output'), ''), '')
+                 ELSE content END, 1, 100)
+        WHERE preview IS NULL
+    ''')
+
+
+def _v6_history_fts(conn: sqlite3.Connection):
+    """历史记录全文索引（FTS5 trigram）及同步触发器，已有记录由 backfill_history_fts 分批补建
+
+    history_fts 是外部内容表，内容来自视图 history_fts_source；content 是 {"input", "output"} 形式的JSON，
+    早期记录可能是纯文本（整体视为输出）。尚未补建的旧记录（history_id 在 (last_id, target_id] 之间）
+    不在索引中，删除和修改时不能执行 'delete'，否则会破坏外部内容表的索引
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS history_fts_backfill (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            last_id INTEGER NOT NULL,
+            target_id INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE VIEW IF NOT EXISTS history_fts_source AS
+        SELECT history_id, user_id,
+               CASE WHEN json_valid(content) AND json_type(content) = 'object'
+                    THEN json_extract(content, '$.input') END AS input,
+               CASE WHEN json_valid(content) AND json_type(content) = 'object'
+                    THEN json_extract(content, '$.output') ELSE content END AS output
+        FROM history
+    ''')
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+            user_id UNINDEXED, input, output,
+            content = 'history_fts_source', content_rowid = 'history_id',
+            tokenize = 'trigram'
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history BEGIN
+            INSERT INTO history_fts (rowid, user_id, input, output)
+            SELECT history_id, user_id, input, output FROM history_fts_source WHERE history_id = new.history_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON history
+        WHEN (old.history_id <= (SELECT last_id FROM history_fts_backfill WHERE id = 1)
+              OR old.history_id > (SELECT target_id FROM history_fts_backfill WHERE id = 1)) BEGIN
+            INSERT INTO history_fts (history_fts, rowid, user_id, input, output)
+            VALUES ('delete', old.history_id, old.user_id,
+                    CASE WHEN json_valid(old.content) AND json_type(old.content) = 'object'
+                         THEN json_extract(old.content, '$.input') END,
+                    CASE WHEN json_valid(old.content) AND json_type(old.content) = 'object'
+                         THEN json_extract(old.content, '$.output') ELSE old.content END);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS history_fts_update AFTER UPDATE OF user_id, content ON history
+        WHEN (old.history_id <= (SELECT last_id FROM history_fts_backfill WHERE id = 1)
+              OR old.history_id > (SELECT target_id FROM history_fts_backfill WHERE id = 1)) BEGIN
+            INSERT INTO history_fts (history_fts, rowid, user_id, input, output)
+            VALUES ('delete', old.history_id, old.user_id,
+                    CASE WHEN json_valid(old.content) AND json_type(old.content) = 'object'
+                         THEN json_extract(old.content, '$.input') END,
+                    CASE WHEN json_valid(old.content) AND json_type(old.content) = 'object'
+                         THEN json_extract(old.content, '$.output') ELSE old.content END);
+            INSERT INTO history_fts (rowid, user_id, input, output)
+            SELECT history_id, user_id, input, output FROM history_fts_source WHERE history_id = new.history_id;
+        END
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO history_fts_backfill (id, last_id, target_id)
+        SELECT 1, 0, COALESCE(MAX(history_id), 0) FROM history
+    ''')
+
+
+def _v7_compressed_content(conn: sqlite3.Connection):
+    """history.content 可以保存压缩后的 BLOB（见 db/history_codec.py），全文索引的视图和触发器改为先解码
+
+    history_content() 由 db/history_codec.py 注册在连接池的连接上；内容解码后不变的修改（重新压缩）不更新索引。
+    已建好的索引数据不受影响，已有记录由后台任务 recompress_history 逐步压缩
+    """
+    for sql in ("DROP TRIGGER IF EXISTS history_fts_insert", "DROP TRIGGER IF EXISTS history_fts_delete",
+                "DROP TRIGGER IF EXISTS history_fts_update", "DROP VIEW IF EXISTS history_fts_source"):
+        conn.execute(sql)
+    conn.execute('''
+        CREATE VIEW history_fts_source AS
+        SELECT history_id, user_id,
+               CASE WHEN json_valid(history_content(content)) AND json_type(history_content(content)) = 'object'
+                    THEN json_extract(history_content(content), '$.input') END AS input,
+               CASE WHEN json_valid(history_content(content)) AND json_type(history_content(content)) = 'object'
+                    THEN json_extract(history_content(content), '$.output') ELSE history_content(content) END AS output
+        FROM history
+    ''')
+    conn.execute('''
+        CREATE TRIGGER history_fts_insert AFTER INSERT ON history BEGIN
+            INSERT INTO history_fts (rowid, user_id, input, output)
+            SELECT history_id, user_id, input, output FROM history_fts_source WHERE history_id = new.history_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER history_fts_delete AFTER DELETE ON history
+        WHEN (old.history_id <= (SELECT last_id FROM history_fts_backfill WHERE id = 1)
+              OR old.history_id > (SELECT target_id FROM history_fts_backfill WHERE id = 1)) BEGIN
+            INSERT INTO history_fts (history_fts, rowid, user_id, input, output)
+            VALUES ('delete', old.history_id, old.user_id,
+                    CASE WHEN json_valid(history_content(old.content)) AND json_type(history_content(old.content)) = 'object'
+                         THEN json_extract(history_content(old.content), '$.input') END,
+                    CASE WHEN json_valid(history_content(old.content)) AND json_type(history_content(old.content)) = 'object'
+                         THEN json_extract(history_content(old.content), '$.output') ELSE history_content(old.content) END);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER history_fts_update AFTER UPDATE OF user_id, content ON history
+        WHEN (old.history_id <= (SELECT last_id FROM history_fts_backfill WHERE id = 1)
+              OR old.history_id > (SELECT target_id FROM history_fts_backfill WHERE id = 1))
+             AND (old.user_id IS NOT new.user_id
+                  OR history_content(old.content) IS NOT history_content(new.content)) BEGIN
+            INSERT INTO history_fts (history_fts, rowid, user_id, input, output)
+            VALUES ('delete', old.history_id, old.user_id,
+                    CASE WHEN json_valid(history_content(old.content)) AND json_type(history_content(old.content)) = 'object'
+                         THEN json_extract(history_content(old.content), '$.input') END,
+                    CASE WHEN json_valid(history_content(old.content)) AND json_type(history_content(old.content)) = 'object'
+                         THEN json_extract(history_content(old.content), '$.output') ELSE history_content(old.content) END);
+            INSERT INTO history_fts (rowid, user_id, input, output)
+            SELECT history_id, user_id, input, output FROM history_fts_source WHERE history_id = new.history_id;
+        END
+    ''')
+
+
+def _v8_user_versions(conn: sqlite3.Connection):
+    """users 表每一行的版本号，由触发器在更新或删除用户时递增
+
+    用户信息缓存（user/user_cache.py）据此判断其他进程是否修改过该用户
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_versions (
+            user_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    for event in ('UPDATE', 'DELETE'):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS users_version_{event.lower()}
+            AFTER {event} ON users
+            BEGIN
+                INSERT INTO user_versions (user_id, version) VALUES (old.user_id, 1)
+                ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+            END
+        ''')
+
+
+# (版本号, 说明, 升级函数)，版本号从1开始连续递增，已发布的迁移不要修改，新的变更追加到末尾
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "添加history表的test_results、input_text、output_text列和users表的points列", _v1_history_columns),
+    (2, "添加point_transactions.operation_id唯一索引", _v2_operation_id),
+    (3, "添加point_holds表", _v3_point_holds),
+    (4, "添加history、bills、point_transactions的(user_id, timestamp)索引和point_holds的到期索引",
+     _v4_user_timestamp_indexes),
+    (5, "添加history表的preview列", _v5_history_preview),
+    (6, "添加历史记录全文索引history_fts", _v6_history_fts),
+    (7, "历史记录内容支持压缩存储", _v7_compressed_content),
+    (8, "添加user_versions表及users表的版本号触发器", _v8_user_versions),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+_current = set()  # 本进程中已确认为最新版本的数据库
+_current_lock = threading.Lock()
+
+
+def get_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def set_version(conn: sqlite3.Connection, version: int):
+    """记录 schema 版本，PRAGMA 不支持参数绑定，这里只接受整数"""
+    conn.execute(f"PRAGMA user_version = {int(version)}")
+
+
+@contextmanager
+def _file_lock(path: str) -> Iterator[None]:
+    """跨进程的迁移锁，锁文件与数据库放在同一目录"""
+    if fcntl is None:
+        yield
+        return
+    with open(path + '.migrate.lock', 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def migrate(path: str = DB_PATH) -> Dict[str, Any]:
+    """把数据库升级到 SCHEMA_VERSION，每个版本在一个事务中执行并随之更新 user_version
+
+    Returns:
+        {'success': bool, 'message': str, 'details': [已执行的迁移说明]}
+    """
+    details = []
+    try:
+        with _file_lock(path):
+            pool = get_pool(path)
+            with pool.reader() as conn:
+                version = get_version(conn)
+                initialized = _has_table(conn, 'users')
+            if not initialized:
+                # 尚未初始化的数据库由 init_database 直接建成最新结构
+                return {'success': True, 'message': "数据库尚未初始化", 'details': details}
+
+            for target, description, upgrade in MIGRATIONS:
+                if target <= version:
+                    continue
+                with pool.writer() as conn:
+                    # 其他进程可能在等锁期间已经完成了这一步
+                    if get_version(conn) >= target:
+                        continue
+                    upgrade(conn)
+                    set_version(conn, target)
+                details.append(description)
+                add_log("info", f"数据库升级到版本{target}：{description}")
+
+        with _current_lock:
+            _current.add(os.path.abspath(path))
+        message = "数据库升级成功" if details else "数据库已是最新版本"
+        return {'success': True, 'message': message, 'details': details}
+    except Exception as e:
+        add_log("error", f"数据库升级失败: {str(e)}")
+        return {'success': False, 'message': f"数据库升级失败: {str(e)}", 'details': details}
+
+
+def ensure_current(path: str = DB_PATH) -> bool:
+    """确认数据库是最新版本，本进程第一次调用时检查 user_version 并在需要时执行迁移"""
+    key = os.path.abspath(path)
+    if key in _current:
+        return True
+    with get_pool(key).reader() as conn:
+        version = get_version(conn)
+    if version >= SCHEMA_VERSION:
+        with _current_lock:
+            _current.add(key)
+        return True
+    return migrate(key)['success']
+
+
+def invalidate(path: str = DB_PATH):
+    """数据库文件被替换后（如从备份恢复）调用，下次访问时重新检查版本"""
+    with _current_lock:
+        _current.discard(os.path.abspath(path))
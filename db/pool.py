@@ -0,0 +1,290 @@
+"""
+SQLite连接池模块
+每个进程为每个数据库文件维护一个连接池，连接复用而不是每次操作都重新打开：
+数据库以 WAL 模式运行（读写互不阻塞），每个连接只在打开时设置一次 synchronous、busy_timeout、
+cache_size、mmap_size 等参数，页缓存和内存映射也随连接保留下来。
+
+用法:
+    with get_pool().reader() as conn:      # 只读连接，可并发
+        conn.execute(...)
+    with get_pool().writer() as conn:      # 进程内串行的写连接，自动 BEGIN IMMEDIATE / COMMIT
+        conn.execute(...)
+    conn = get_pool().connection()         # 兼容旧代码的读写连接，close() 时归还连接池
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from user.logger import add_log
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(ROOT_DIR, 'db', 'users.db')
+
+DEFAULT_DB_POOL_CONFIG = {
+    "busy_timeout": 10000,      # 等待锁的毫秒数
+    "synchronous": "NORMAL",    # WAL 模式下 NORMAL 只在检查点时 fsync，掉电最多丢失最后几个事务
+    "cache_size": -16000,       # 负数表示KB，每个连接约16MB页缓存
+    "mmap_size": 268435456,     # 256MB 内存映射读
+    "max_idle": 8               # 每类连接最多保留的空闲连接数
+}
+
+
+_pools: Dict[str, 'ConnectionPool'] = {}
+_pools_lock = threading.Lock()
+
+# 每个连接打开时注册的SQL函数：名称 -> (参数个数, 函数)
+_functions: Dict[str, Tuple[int, Callable]] = {}
+_functions_lock = threading.Lock()
+
+
+def register_function(name: str, num_params: int, func: Callable):
+    """注册在所有连接池连接上可用的确定性SQL函数（如视图和触发器中用到的解码函数）
+
+    应在模块导入时调用；之后新打开的连接都会注册，已打开的空闲连接在此处补注册
+    """
+    with _functions_lock:
+        _functions[name] = (num_params, func)
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool._register_on_open_connections(name, num_params, func)
+
+
+class PooledConnection(sqlite3.Connection):
+    """从连接池借出的连接，close() 时归还连接池而不是真正关闭"""
+
+    _pool: Optional['ConnectionPool'] = None
+    _mode = 'rw'
+
+    def close(self):
+        pool = self._pool
+        if pool is None:
+            super().close()
+        else:
+            pool._release(self)
+
+    def _close(self):
+        self._pool = None
+        super().close()
+
+
+class ConnectionPool:
+    """单个数据库文件的线程安全连接池
+
+    读连接设置 query_only，可被多个线程同时借出；写连接只有一个，由进程内的锁串行化，
+    避免多个写线程在 SQLite 的写锁上空转。连接借出期间只由借用的线程使用，
+    因此可以用 check_same_thread=False 在 Streamlit 的脚本线程之间复用
+    """
+
+    def __init__(self, path: str, config: Optional[Dict[str, Any]] = None):
+        self.path = path
+        self.config = {**DEFAULT_DB_POOL_CONFIG, **(config or {})}
+        self._lock = threading.Lock()
+        self._idle: Dict[str, List[PooledConnection]] = {'r': [], 'rw': []}
+        self._write_lock = threading.Lock()
+        self._writer: Optional[PooledConnection] = None
+        self._closed = False
+        self._wal_checked = False
+        self._borrowed = 0              # 已借出、尚未归还的读连接和读写连接数
+        self._paused = False            # quiesce() 期间暂停借出
+        self._resumed = threading.Condition(self._lock)
+
+    def _open(self, mode: str) -> PooledConnection:
+        conn = sqlite3.connect(self.path, timeout=self.config['busy_timeout'] / 1000,
+                               check_same_thread=False, factory=PooledConnection)
+        conn.execute(f"PRAGMA busy_timeout = {int(self.config['busy_timeout'])}")
+        conn.execute(f"PRAGMA synchronous = {self.config['synchronous']}")
+        conn.execute(f"PRAGMA cache_size = {int(self.config['cache_size'])}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.config['mmap_size'])}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        with _functions_lock:
+            functions = list(_functions.items())
+        for name, (num_params, func) in functions:
+            conn.create_function(name, num_params, func, deterministic=True)
+        if not self._wal_checked:
+            self._init_journal_mode(conn)
+        if mode == 'r':
+            conn.execute("PRAGMA query_only = ON")
+        conn._mode = mode
+        return conn
+
+    def _init_journal_mode(self, conn: sqlite3.Connection):
+        """journal_mode=WAL 会持久保存在数据库文件中，每个连接池只需设置一次"""
+        try:
+            mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+            if mode.lower() != 'wal':
+                add_log("warning", f"数据库未能切换到WAL模式，当前为 {mode}: {self.path}")
+            self._wal_checked = True
+        except sqlite3.Error as e:
+            add_log("warning", f"设置WAL模式失败: {str(e)}")
+
+    def _acquire(self, mode: str) -> PooledConnection:
+        with self._lock:
+            while self._paused:
+                self._resumed.wait()
+            if self._closed:
+                raise sqlite3.ProgrammingError("连接池已关闭")
+            idle = self._idle[mode]
+            conn = idle.pop() if idle else None
+            self._borrowed += 1
+        if conn is None:
+            try:
+                conn = self._open(mode)
+            except BaseException:
+                self._returned()
+                raise
+        conn._pool = self
+        return conn
+
+    def _returned(self):
+        with self._lock:
+            self._borrowed -= 1
+            self._resumed.notify_all()
+
+    def _release(self, conn: PooledConnection):
+        """归还连接：回滚未提交的事务并恢复借出时修改过的连接属性"""
+        try:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+                conn.row_factory = None
+                conn.isolation_level = ''
+            except sqlite3.Error:
+                conn._close()
+                return
+            with self._lock:
+                idle = self._idle[conn._mode]
+                if not self._closed and not self._paused and len(idle) < self.config['max_idle']:
+                    idle.append(conn)
+                    return
+            conn._close()
+        finally:
+            self._returned()
+
+    def connection(self) -> PooledConnection:
+        """借出一个读写连接，用法与 sqlite3.connect 的返回值相同，close() 时归还"""
+        return self._acquire('rw')
+
+    @contextmanager
+    def reader(self) -> Iterator[PooledConnection]:
+        """借出一个只读连接"""
+        conn = self._acquire('r')
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def writer(self) -> Iterator[PooledConnection]:
+        """借出写连接并开启 BEGIN IMMEDIATE 事务，正常退出时提交，出错时回滚"""
+        with self._write_lock:
+            with self._lock:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("连接池已关闭")
+            if self._writer is None:
+                self._writer = self._open('w')
+                self._writer.isolation_level = None  # 手动控制事务
+            conn = self._writer
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+                conn.execute('COMMIT')
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+
+    @contextmanager
+    def quiesce(self, timeout: float = 30.0) -> Iterator[None]:
+        """暂停借出连接、等待已借出的连接归还并关闭所有连接，期间可以替换数据库文件
+
+        等待超时抛出 TimeoutError 并恢复借出；退出后新借出的连接会重新打开数据库文件。
+        只能协调本进程内的连接，调用方不能持有本连接池借出的连接。
+        先等待借出的连接归还再获取写锁，持有连接的线程在此期间仍可以调用 writer() 完成写入
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self._paused = True
+            if not self._resumed.wait_for(lambda: self._borrowed == 0, timeout):
+                self._paused = False
+                self._resumed.notify_all()
+                raise TimeoutError(f"等待 {self._borrowed} 个已借出的连接归还超时: {self.path}")
+        # 写锁可能被正在等待借出连接的线程持有，限时获取避免互相等待
+        if not self._write_lock.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            with self._lock:
+                self._paused = False
+                self._resumed.notify_all()
+            raise TimeoutError(f"等待写连接释放超时: {self.path}")
+        try:
+            with self._lock:
+                idle = self._idle['r'] + self._idle['rw']
+                self._idle = {'r': [], 'rw': []}
+            if self._writer is not None:
+                idle.append(self._writer)
+                self._writer = None
+            for conn in idle:
+                conn._close()
+            # 新文件不一定是 WAL 模式
+            self._wal_checked = False
+            yield
+        finally:
+            self._write_lock.release()
+            with self._lock:
+                self._paused = False
+                self._resumed.notify_all()
+
+    def _register_on_open_connections(self, name: str, num_params: int, func: Callable):
+        with self._write_lock:
+            with self._lock:
+                conns = self._idle['r'] + self._idle['rw']
+            if self._writer is not None:
+                conns.append(self._writer)
+            for conn in conns:
+                conn.create_function(name, num_params, func, deterministic=True)
+
+    def close(self):
+        """关闭所有空闲连接和写连接，已借出的连接在归还时关闭"""
+        with self._write_lock:
+            with self._lock:
+                self._closed = True
+                idle = self._idle['r'] + self._idle['rw']
+                self._idle = {'r': [], 'rw': []}
+            if self._writer is not None:
+                idle.append(self._writer)
+                self._writer = None
+        for conn in idle:
+            conn._close()
+
+
+_pools_pid = os.getpid()
+
+
+def get_pool(path: Optional[str] = None, config: Optional[Dict[str, Any]] = None) -> ConnectionPool:
+    """获取指定数据库文件的连接池（默认 db/users.db），同一进程内按绝对路径共享
+
+    config 只在第一次创建连接池时生效
+    """
+    global _pools_pid
+    key = os.path.abspath(path or DB_PATH)
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            # fork 出的子进程不能复用父进程的连接
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(key)
+        if pool is None or pool._closed:
+            pool = _pools[key] = ConnectionPool(key, config)
+        return pool
+
+
+def close_pools():
+    """关闭本进程的所有连接池（如恢复数据库文件之前）"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
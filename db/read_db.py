@@ -1,9 +1,12 @@
-import sqlite3
-import pandas as pd
+from .pool import get_pool
+from . import history_codec  # noqa: F401  注册 history_content() SQL函数
+from modules.lazy import lazy_import
+
+pd = lazy_import('pandas')
 
 def read_database():
     """读取数据库内容"""
-    conn = sqlite3.connect('db/users.db')
+    conn = get_pool().connection()
     
     # 获取表结构
     schema = ""
@@ -72,12 +75,12 @@ def read_database():
 
 def read_history_records():
     """读取历史生成记录"""
-    conn = sqlite3.connect('db/users.db')
+    conn = get_pool().connection()
     c = conn.cursor()
     
     # 获取所有历史记录，包括用户信息
     c.execute("""
-        SELECT h.timestamp, u.username, h.type, h.content
+        SELECT h.timestamp, u.username, h.type, history_content(h.content)
         FROM history h
         JOIN users u ON h.user_id = u.user_id
         ORDER BY h.timestamp DESC
@@ -1,16 +1,14 @@
 import streamlit as st
 from typing import Optional, Dict
 from .api import APIClient
+from .stream_render import render_stream
 from .utils import load_prompts, add_log, save_history
+from .config_registry import get_aar_prompts
 from datetime import datetime
-import json
-from pathlib import Path
 
 def load_aar_prompts():
-    """Load AAR prompts from prompt-aar.json"""
-    prompt_path = Path("config/prompt-aar.json")
-    with open(prompt_path, 'r', encoding='utf-8') as file:
-        return json.load(file)["aar"]
+    """Load AAR prompts from prompt-aar.json（进程内缓存，返回只读视图）"""
+    return get_aar_prompts()
 
 class AARGenerator:
     def __init__(self, api_client: APIClient):
@@ -169,12 +167,12 @@ class AARGenerator:
         response_placeholder = st.empty()  # 使用空占位符来更新内容
         try:
             add_log("info", f"🚀 开始生成{step_title}...")
-            full_response = ""
-            
-            for chunk in self.api_client.generate_content_stream(prompt):
-                full_response += chunk
-                # 使用 unsafe_allow_html=True 来渲染 HTML 标签
-                response_placeholder.markdown(full_response, unsafe_allow_html=True)
+            # 使用 unsafe_allow_html=True 来渲染 HTML 标签
+            full_response = render_stream(
+                response_placeholder,
+                self.api_client.generate_content_stream(prompt),
+                unsafe_allow_html=True
+            )
             
             # 更新Context和data_fact
             self.data_fact += f"\n\n{step_title}：\n{full_response}"
@@ -1,15 +1,34 @@
 import streamlit as st
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Tuple
 from .api import APIClient
+from .stream_render import render_stream
 from .utils import load_prompts, add_log, save_history
+from .config_registry import compile_template
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import json
 
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:  # 旧版本streamlit
+    from streamlit.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+# 并发生成的默认配置，可在 config.json 的 all_in_one 中覆盖
+DEFAULT_CONCURRENT = True
+DEFAULT_MAX_WORKERS = 4
+
 class AllInOneGenerator:
-    def __init__(self, api_client: APIClient):
+    def __init__(self, api_client: APIClient, concurrent: Optional[bool] = None,
+                 max_workers: Optional[int] = None):
         self.api_client = api_client
         self.prompts = load_prompts()
         self.all_content = []  # 存储所有生成的内容
+        
+        # 并发模式：新闻稿生成后，FAQ与MLP各部分并行生成
+        settings = api_client.config.get("all_in_one", {})
+        self.concurrent = settings.get("concurrent", DEFAULT_CONCURRENT) if concurrent is None else concurrent
+        self.max_workers = max(1, int(settings.get("max_workers", DEFAULT_MAX_WORKERS) if max_workers is None else max_workers))
 
     def render(self):
         """渲染一键生成界面"""
@@ -98,50 +117,14 @@ class AllInOneGenerator:
             if pr_content:
                 self.all_content.append(("虚拟新闻稿", pr_content))
             
-            # 3. 生成客户FAQ
-            st.markdown("### 客户FAQ")
-            try:
-                customer_faqs = self.prompts.get("customer_faq", {})
-                for question_id, faq_data in customer_faqs.items():
-                    st.subheader(faq_data['title'])
-                    prompt = faq_data['prompt'].replace(
-                        "${core_sentence}", 
-                        f"客户需求：{customer_needs}\n解决方案：{solution}"
-                    )
-                    content = self._generate_content(f"客户FAQ-{faq_data['title']}", prompt)
-                    if content:
-                        self.all_content.append((f"客户FAQ-{faq_data['title']}", content))
-            except Exception as e:
-                add_log("error", f"❌ 生成客户FAQ时发生错误: {str(e)}")
-            
-            # 4. 生成内部FAQ
-            st.markdown("### 内部FAQ")
-            try:
-                internal_faqs = self.prompts.get("internal_faq", {})
-                for question_id, faq_data in internal_faqs.items():
-                    st.subheader(faq_data['title'])
-                    prompt = faq_data['prompt'].replace(
-                        "${core_sentence}", 
-                        f"客户需求：{customer_needs}\n解决方案：{solution}"
-                    )
-                    content = self._generate_content(f"内部FAQ-{faq_data['title']}", prompt)
-                    if content:
-                        self.all_content.append((f"内部FAQ-{faq_data['title']}", content))
-            except Exception as e:
-                add_log("error", f"❌ 生成内部FAQ时发生错误: {str(e)}")
-            
-            # 5. 生成MLP开发计划
-            st.markdown("### MLP开发计划")
-            try:
-                mlp_prompt = self.prompts.get("mlp", {}).get("prompt", "").replace(
-                    "${core_sentence}", 
-                    f"客户需求：{customer_needs}\n解决方案：{solution}"
-                )
-                content = self._generate_content("MLP开发计划", mlp_prompt)
-                if content:
-                    self.all_content.append(("MLP开发计划", content))
-            except Exception as e:
-                add_log("error", f"❌ 生成MLP开发计划时发生错误: {str(e)}")
+            core_sentence = f"客户需求：{customer_needs}\n解决方案：{solution}"
+            
+            # 3-5. 生成客户FAQ、内部FAQ和MLP开发计划
+            # 这些部分只依赖中心句，互不依赖
+            if self.concurrent:
+                self._generate_sections_concurrently(core_sentence)
+            else:
+                self._generate_sections_sequentially(core_sentence)
             
             # 6. 在生成完所有内容后，显示字数统计
             if self.all_content:
@@ -202,16 +185,95 @@ class AllInOneGenerator:
                 })
                 add_log("info", "✅ 已保存到历史记录")
 
-    def _generate_content(self, section_name: str, prompt: str) -> Optional[str]:
+    def _build_sections(self, core_sentence: str) -> List[Tuple[str, str, str, str]]:
+        """按原始顺序构建待生成的部分: (分组标题, 小标题, 部分名称, 提示词)"""
+        sections = []
+        
+        try:
+            customer_faqs = self.prompts.get("customer_faq", {})
+            for question_id, faq_data in customer_faqs.items():
+                prompt = compile_template(faq_data['prompt']).render(core_sentence=core_sentence)
+                sections.append(("客户FAQ", faq_data['title'], f"客户FAQ-{faq_data['title']}", prompt))
+        except Exception as e:
+            add_log("error", f"❌ 生成客户FAQ时发生错误: {str(e)}")
+        
+        try:
+            internal_faqs = self.prompts.get("internal_faq", {})
+            for question_id, faq_data in internal_faqs.items():
+                prompt = compile_template(faq_data['prompt']).render(core_sentence=core_sentence)
+                sections.append(("内部FAQ", faq_data['title'], f"内部FAQ-{faq_data['title']}", prompt))
+        except Exception as e:
+            add_log("error", f"❌ 生成内部FAQ时发生错误: {str(e)}")
+        
+        try:
+            mlp_prompt = compile_template(self.prompts.get("mlp", {}).get("prompt", "")).render(core_sentence=core_sentence)
+            sections.append(("MLP开发计划", None, "MLP开发计划", mlp_prompt))
+        except Exception as e:
+            add_log("error", f"❌ 生成MLP开发计划时发生错误: {str(e)}")
+        
+        return sections
+
+    def _render_section_header(self, group: str, title: Optional[str], last_group: Optional[str]):
+        """显示分组标题和小标题"""
+        if group != last_group:
+            st.markdown(f"### {group}")
+        if title:
+            st.subheader(title)
+
+    def _generate_sections_sequentially(self, core_sentence: str):
+        """逐个生成各部分"""
+        last_group = None
+        for group, title, section_name, prompt in self._build_sections(core_sentence):
+            self._render_section_header(group, title, last_group)
+            last_group = group
+            content = self._generate_content(section_name, prompt)
+            if content:
+                self.all_content.append((section_name, content))
+
+    def _generate_sections_concurrently(self, core_sentence: str):
+        """并发生成各部分，每部分流式输出到各自的占位符，结果按原始顺序保存"""
+        sections = self._build_sections(core_sentence)
+        
+        # 先在主线程中按顺序创建标题和占位符，保证页面布局顺序
+        placeholders = []
+        last_group = None
+        for group, title, section_name, prompt in sections:
+            self._render_section_header(group, title, last_group)
+            last_group = group
+            placeholders.append(st.empty())
+        
+        add_log("info", f"🚀 并发生成 {len(sections)} 个部分 (并发数: {self.max_workers})")
+        ctx = get_script_run_ctx()
+        
+        def worker(section_name: str, prompt: str, placeholder) -> Optional[str]:
+            # 工作线程需要绑定脚本上下文才能更新页面和session_state
+            add_script_run_ctx(threading.current_thread(), ctx)
+            # 每个部分使用独立的客户端，避免共享 full_content 状态
+            client = self.api_client.spawn()
+            # 并发的各部分共用积分余额，每个预授权最多占用可用余额的 1/并发数
+            client.hold_share = min(self.max_workers, len(sections))
+            return self._generate_content(section_name, prompt, placeholder, client)
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(worker, section_name, prompt, placeholder)
+                for (group, title, section_name, prompt), placeholder in zip(sections, placeholders)
+            ]
+            results = [future.result() for future in futures]
+        
+        for (group, title, section_name, prompt), content in zip(sections, results):
+            if content:
+                self.all_content.append((section_name, content))
+
+    def _generate_content(self, section_name: str, prompt: str, response_placeholder=None,
+                          api_client: Optional[APIClient] = None) -> Optional[str]:
         """生成内容并显示"""
         try:
             add_log("info", f"🚀 开始生成{section_name}...")
-            response_placeholder = st.empty()
-            full_response = ""
-            
-            for chunk in self.api_client.generate_content_stream(prompt):
-                full_response += chunk
-                response_placeholder.markdown(full_response)
+            if response_placeholder is None:
+                response_placeholder = st.empty()
+            api_client = api_client or self.api_client
+            full_response = render_stream(response_placeholder, api_client.generate_content_stream(prompt))
             
             add_log("info", f"✨ {section_name}生成完成")
             return full_response
@@ -1,177 +1,388 @@
-import json
-import requests
-from typing import Dict, Any, Generator
+import time
+from typing import Dict, Any, Generator, List, Optional
 import streamlit as st
-from .utils import add_letters_record, save_history
+from .hedging import get_hedging_settings, hedge_delay, hedged_stream
+from .http_pool import get_http_pool
+from .providers import MAX_OUTPUT_TOKENS, build_request, fallback_chain
+from .provider_health import CircuitOpenError, get_health_registry
+from .response_cache import ResponseCache, get_response_cache, get_cache_settings, replay_stream
+from .retry import APIError, RetryPolicy, parse_retry_after
+from .sse import decode_stream, get_stream_decoder
+from .utils import add_letters_record, release_points, reserve_points, save_history
 from user.logger import add_log
-from flask import Blueprint, jsonify, request
-from datetime import datetime
-
-faq_bp = Blueprint('faq', __name__)
-
-@faq_bp.route('/api/internal-faq/<int:question_id>', methods=['GET'])
-def get_internal_faq(question_id):
-    """获取内部FAQ答案"""
-    internal_faqs = {
-        1: "产品独特性分析...",
-        2: "产品售后服务流程...", 
-        3: "产品定价策略...",
-        4: "产品购买渠道...",
-        5: "产品促销活动..."
-    }
-    return jsonify({"answer": internal_faqs.get(question_id, "未找到答案")})
-
-@faq_bp.route('/api/external-faq/<int:question_id>', methods=['GET'])
-def get_external_faq(question_id):
-    """获取客户FAQ答案"""
-    external_faqs = {
-        1: "市场规模分析...",
-        2: "三年盈利预测...",
-        3: "合规风险分析...",
-        4: "供应商依赖分析...",
-        5: "竞品分析..."
-    }
-    return jsonify({"answer": external_faqs.get(question_id, "未找到答案")})
 
 class APIClient:
     def __init__(self, config: Dict[str, Any]):
         """初始化API客户端"""
         self.config = config  # 使用传入的配置
         self.full_content = ""  # 初始化为实例变量
+        self.current_api = None  # 当前正在使用的API
+        self.http_pool = get_http_pool(config)  # 进程级共享连接池
+        self.health = get_health_registry(config)  # 进程级共享的提供方健康登记表
+        self.retry_policy = RetryPolicy.from_config(config)  # 同一API上的重试策略
+        self.hold_id = None  # 本次生成的积分预授权
+        self.hold_share = 1  # 同时进行、共用积分余额的生成数（一键生成并发时由调用方设置）
+        self.last_usage = {}  # 最近一次完整生成的token用量（由提供方流式返回）
+        self.served_cache_keys = set()  # 本会话已经返回过结果的缓存键，再次生成时不读取缓存
         #add_log("info", "APIClient initialized")
-        
-    def generate_content_stream(self, prompt: str, api_name: str = "claude") -> Generator[str, None, None]:
-        """生成内容的流式接口"""
+
+    def spawn(self) -> "APIClient":
+        """为并发生成的工作线程创建客户端
+
+        生成状态（内容、预授权、用量）独立，与本会话的客户端共用已返回过的缓存键，重新生成时同样跳过响应缓存
+        """
+        client = APIClient(self.config)
+        client.served_cache_keys = self.served_cache_keys
+        return client
+
+    def _build_request(self, prompt: str, api_name: str):
+        """构建API请求的URL、请求头和请求体"""
+        return build_request(self.config, prompt, api_name)
+
+    def _stream_provider(self, prompt: str, api_name: str, cancel_event=None,
+                         on_response=None, usage: Optional[Dict[str, Any]] = None) -> Generator[str, None, None]:
+        """向单个API发送请求并逐块产出内容，连接复用自共享连接池，
+        同时把耗时、首字延迟和成败记录到提供方健康登记表
+
+        Args:
+            cancel_event: 被设置时表示请求已被主动取消，此后的异常不计为失败
+            on_response: 收到响应对象后的回调，供取消方关闭连接
+            usage: 写入本次请求token用量的字典，不传时写入 self.last_usage（对冲请求各自传入，避免互相覆盖）
+        """
+        url, headers, data = self._build_request(prompt, api_name)
+        health = self.health.get(api_name)
+        started = time.monotonic()
+        ttft = None
+
         try:
-            #add_log("info", f"Generating content stream for API: {api_name}")
-            # 每次生成前清空内容
-            self.full_content = ""
-            input_letters = len(prompt)
-            
-            # 准备API请求
-            if api_name == "claude":
-                headers = {
-                    "Content-Type": "application/json",
-                    "anthropic-version": "2023-06-01",
-                    "x-api-key": self.config['api_keys'][api_name]
-                }
-                data = {
-                    "model": "claude-3-sonnet-20240229",
-                    "max_tokens": 4096,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "stream": True
-                }
-            else:
-                headers = {
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {self.config['api_keys'][api_name]}"
-                }
-                data = {
-                    "model": self.config["models"][api_name],
-                    "messages": [
-                        {"role": "system", "content": "你是一个专业的产品经理..."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    "stream": True
-                }
-            
-            # 发送请求
-            response = requests.post(
-                self.config["api_urls"][api_name],
-                headers=headers,
-                json=data,
-                stream=True,
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                #add_log("info", f"API request successful for {api_name}")
-                chunk_count = 0
-                
-                for line in response.iter_lines():
-                    if not line:
-                        continue
-                        
-                    line = line.decode('utf-8')
-                    
-                    if not line.startswith('data: '):
-                        continue
-                    
-                    # 如果是结束标记
-                    if line == 'data: [DONE]':
-                        break
-                    
-                    # 处理内容块
-                    try:
-                        json_str = line[6:]
-                        json_data = json.loads(json_str)
-                        
-                        if api_name == "claude":
-                            chunk = json_data.get('delta', {}).get('text', '') or json_data.get('content', '')
-                        else:
-                            chunk = json_data['choices'][0]['delta'].get('content', '')
-                        
-                        if chunk:
-                            chunk_count += 1
-                            self.full_content += chunk
-                            yield chunk
-                            
-                    except json.JSONDecodeError as e:
-                        continue
-                
-                # 在所有内容接收完成后
-                if self.full_content:
-                    try:
-                        # 记录字符统计
-                        success = add_letters_record(
-                            input_letters=input_letters,
-                            output_letters=len(self.full_content),
-                            api_name=api_name,
-                            operation=f"生成{st.session_state.current_section}内容"
+            with self.http_pool.lease(api_name) as session:
+                response = session.post(
+                    url,
+                    headers=headers,
+                    json=data,
+                    stream=True,
+                    timeout=30
+                )
+                if on_response:
+                    on_response(response)
+                try:
+                    if response.status_code != 200:
+                        raise APIError(
+                            f"API请求失败 (状态码: {response.status_code})",
+                            status_code=response.status_code,
+                            retry_after=parse_retry_after(response.headers.get("Retry-After"))
                         )
-                        
-                        # 保存到历史记录
-                        if success:  # 只有在成功记录账单后才保存历史记录
-                            save_history(
-                                content=self.full_content,
-                                history_type=st.session_state.current_section
-                            )
-                        
-                        # 在内容末尾添加字符统计
-                        yield f"\n\n生成内容总字符数: {len(self.full_content)}"
-                        add_log("info", f"Content generation completed for {api_name}")
-                        
-                    except Exception as e:
-                        add_log("error", f"内容生成错误: {str(e)}")
-                        
+
+                    # chunk_size=None 时按网络到达的数据块读取，不等待凑满固定长度
+                    decoder = get_stream_decoder(api_name)
+                    for chunk in decode_stream(decoder, response.iter_content(chunk_size=None)):
+                        if ttft is None:
+                            ttft = time.monotonic() - started
+                        yield chunk
+                    self._record_decoder(api_name, decoder, usage)
+                finally:
+                    response.close()
+        except GeneratorExit:
+            # 调用方提前停止读取，不计入成败
+            if ttft is not None:
+                health.record_ttft(ttft)
+            health.record_cancel()
+            raise
+        except Exception:
+            if cancel_event is not None and cancel_event.is_set():
+                health.record_cancel()
             else:
-                raise Exception(f"API请求失败 (状态码: {response.status_code})")
-                
+                health.record_failure()
+            raise
+        else:
+            health.record_success(time.monotonic() - started, ttft)
+
+    def _record_decoder(self, api_name: str, decoder, usage: Optional[Dict[str, Any]] = None):
+        """记录解码器统计的用量和无法解析的事件数"""
+        if usage is None:
+            self.last_usage = dict(decoder.usage)
+        else:
+            usage.clear()
+            usage.update(decoder.usage)
+        if decoder.malformed:
+            add_log("warning", f"{api_name} 流中有 {decoder.malformed} 个事件无法解析，已跳过")
+
+    def _stream_with_retry(self, prompt: str, api_name: str, cancel_event=None, on_response=None,
+                           usage: Optional[Dict[str, Any]] = None) -> Generator[str, None, None]:
+        """在同一个API上按重试策略重试，已经产出内容后不再重试
+
+        参数同 _stream_provider；cancel_event 被设置后不再重试，等待重试时也立即返回
+        """
+        attempt = 0
+        while True:
+            yielded = False
+            try:
+                for chunk in self._stream_provider(prompt, api_name, cancel_event, on_response, usage):
+                    yielded = True
+                    yield chunk
+                return
+            except Exception as e:
+                if yielded or not self.retry_policy.is_retryable(e) or (cancel_event and cancel_event.is_set()):
+                    raise
+                wait = self.retry_policy.wait_time(attempt, getattr(e, "retry_after", None))
+                # 重试次数用尽、等待过长或期间熔断已打开时降级到下一个API
+                if wait is None or not self.health.get(api_name).allow_request():
+                    raise
+                attempt += 1
+                add_log("warning", f"{api_name} 请求失败: {str(e)}，{wait:.1f}秒后第{attempt}次重试")
+                if cancel_event is None:
+                    time.sleep(wait)
+                elif cancel_event.wait(wait):
+                    raise
+
+    def _cache_key(self, prompt: str, api_name: str) -> str:
+        """根据实际请求参数计算响应缓存键"""
+        url, headers, data = self._build_request(prompt, api_name)
+        params = {k: v for k, v in data.items() if k not in ("model", "messages", "stream")}
+        # 系统提示词同样影响生成结果
+        params["system"] = [m["content"] for m in data["messages"] if m["role"] != "user"]
+        return ResponseCache.make_key(api_name, data.get("model"), prompt, params)
+
+    def _replay_cached(self, prompt: str, api_name: str, content: str) -> Generator[str, None, None]:
+        """以快速流的形式回放缓存内容，并按配置的策略计费"""
+        settings = get_cache_settings(self.config)
+        for chunk in replay_stream(content, int(settings["replay_chunk_size"])):
+            self.full_content += chunk
+            yield chunk
+
+        try:
+            policy = settings["billing"]
+            success = True
+            if policy != "free":
+                success = self._record_usage(
+                    input_letters=len(prompt),
+                    output_letters=len(content) if policy == "full" else 0,
+                    api_name=api_name,
+                    operation=f"生成{st.session_state.current_section}内容(缓存)"
+                )
+
+            if success:
+                save_history(
+                    content=self.full_content,
+                    history_type=st.session_state.current_section
+                )
+
+            yield f"\n\n生成内容总字符数: {len(self.full_content)}"
+            add_log("info", f"Content replayed from cache for {api_name}")
+
         except Exception as e:
-            add_log("error", f"API调用失败: {str(e)}")
-            # API切换逻辑
-            next_api = None
-            if api_name == "claude":
-                next_api = "moonshot"
-            elif api_name == "moonshot":
-                next_api = "zhipu"
+            add_log("error", f"内容生成错误: {str(e)}")
+
+    def _record_usage(self, input_letters: int, output_letters: int, api_name: str, operation: str) -> bool:
+        """记录用量，生成开始时有预授权则结算该预授权"""
+        hold_id, self.hold_id = self.hold_id, None
+        return add_letters_record(
+            input_letters=input_letters,
+            output_letters=output_letters,
+            api_name=api_name,
+            operation=operation,
+            hold_id=hold_id
+        )
+
+    def _fallback_chain(self, api_name: str) -> List[str]:
+        """从指定的API开始的降级顺序"""
+        return fallback_chain(api_name)
+
+    def _lookup_cache(self, prompt: str, api_name: str, use_cache: bool):
+        """查询响应缓存，返回 (缓存对象, 缓存键, 命中内容)
+
+        本会话已经为同一请求返回过结果时视为重新生成：不读取缓存，生成的新内容仍写入缓存
+        """
+        cache = get_response_cache(self.config) if use_cache else None
+        if not cache:
+            return None, None, None
+        try:
+            cache_key = self._cache_key(prompt, api_name)
+            if cache_key in self.served_cache_keys:
+                add_log("info", f"重新生成，跳过响应缓存: {api_name}")
+                return cache, cache_key, None
+            self.served_cache_keys.add(cache_key)
+            return cache, cache_key, cache.get(cache_key)
+        except Exception as e:
+            add_log("warning", f"读取响应缓存失败: {str(e)}")
+            return None, None, None
+
+    def _finish_generation(self, prompt: str, api_name: str, cache,
+                           cache_key) -> Generator[str, None, None]:
+        """生成完成后缓存内容、记录账单和历史记录"""
+        # 只缓存完整生成的内容
+        if cache and self.full_content:
+            try:
+                cache.put(cache_key, api_name, self.config["models"].get(api_name), self.full_content)
+            except Exception as e:
+                add_log("warning", f"写入响应缓存失败: {str(e)}")
+
+        # 在所有内容接收完成后
+        if self.full_content:
+            try:
+                # 记录字符统计
+                success = self._record_usage(
+                    input_letters=len(prompt),
+                    output_letters=len(self.full_content),
+                    api_name=api_name,
+                    operation=f"生成{st.session_state.current_section}内容"
+                )
                 
-            if next_api:
-                add_log("info", f"尝试下一个API: {next_api}")
-                # 不清空 self.full_content，继续累积内容
-                yield from self.generate_content_stream(prompt, next_api)
-            else:
-                # 记录已生成的内容(如果有)
+                # 保存到历史记录
+                if success:  # 只有在成功记录账单后才保存历史记录
+                    save_history(
+                        content=self.full_content,
+                        history_type=st.session_state.current_section
+                    )
+                
+                # 在内容末尾添加字符统计
+                yield f"\n\n生成内容总字符数: {len(self.full_content)}"
+                add_log("info", f"Content generation completed for {api_name}")
+                
+            except Exception as e:
+                add_log("error", f"内容生成错误: {str(e)}")
+
+    def _generate_with_provider(self, prompt: str, api_name: str, use_cache: bool,
+                                force: bool = False) -> Generator[str, None, None]:
+        """使用单个API生成内容，完成后记录账单和历史记录
+
+        熔断打开时抛出 CircuitOpenError（force=True 时忽略熔断）
+        """
+        # 每次生成前清空内容
+        self.full_content = ""
+        self.current_api = api_name
+
+        cache, cache_key, cached = self._lookup_cache(prompt, api_name, use_cache)
+        if cached:
+            add_log("info", f"命中响应缓存: {api_name}")
+            yield from self._replay_cached(prompt, api_name, cached)
+            return
+
+        if not force and not self.health.get(api_name).allow_request():
+            raise CircuitOpenError(f"{api_name} 熔断中，跳过")
+
+        for chunk in self._stream_with_retry(prompt, api_name):
+            self.full_content += chunk
+            yield chunk
+
+        yield from self._finish_generation(prompt, api_name, cache, cache_key)
+
+    def _generate_hedged(self, prompt: str, chain: List[str], use_cache: bool) -> Generator[str, None, None]:
+        """对冲模式：首选API首字超时后向备用API发起请求，只为胜出方计费"""
+        self.full_content = ""
+        self.current_api = chain[0]
+
+        cache, cache_key, cached = self._lookup_cache(prompt, chain[0], use_cache)
+        if cached:
+            add_log("info", f"命中响应缓存: {chain[0]}")
+            yield from self._replay_cached(prompt, chain[0], cached)
+            return
+
+        settings = get_hedging_settings(self.config)
+        delay = hedge_delay(self.health.get(chain[0]), settings)
+        result: Dict[str, Any] = {}
+
+        for chunk in hedged_stream(self, prompt, chain, delay, result):
+            if "api_name" in result:
+                self.current_api = result["api_name"]
+            self.full_content += chunk
+            yield chunk
+
+        api_name = result.get("api_name", chain[0])
+        self.last_usage = result.get("usage", {})
+        if result.get("hedged"):
+            add_log("info", f"对冲请求完成，胜出API: {api_name} (截止时间 {delay:.1f}s)")
+        if cache and api_name != chain[0]:
+            cache_key = self._cache_key(prompt, api_name)
+            self.served_cache_keys.add(cache_key)
+
+        yield from self._finish_generation(prompt, api_name, cache, cache_key)
+
+    def generate_content_stream(self, prompt: str, api_name: str = "claude",
+                                use_cache: bool = True) -> Generator[str, None, None]:
+        """生成内容的流式接口
+
+        按 claude → moonshot → zhipu 的顺序降级，熔断中的API直接跳过；
+        所有API都处于熔断状态时，仍强制尝试首选API。
+        只在产出第一个内容块之前降级，已经输出部分内容后出错时抛出异常，不计费也不保存历史记录。
+        开始前按预估字数预授权积分，积分不足时不请求API；
+        生成结束后按实际字数结算，失败或被取消时释放预授权
+
+        Args:
+            prompt: 提示词
+            api_name: 首选的API提供方
+            use_cache: 是否使用响应缓存（config.json 的 response_cache.enabled 为全局开关，默认关闭）；
+                同一客户端再次生成相同的提示词时总是请求API
+        """
+        self.hold_id = reserve_points(len(prompt), MAX_OUTPUT_TOKENS, self.hold_share)
+        if not self.hold_id:
+            add_log("warning", "积分预授权失败，未调用API")
+            return
+
+        try:
+            yield from self._generate_stream(prompt, api_name, use_cache)
+        finally:
+            # 没有结算的预授权（生成失败、没有内容或调用方提前停止读取）全部释放
+            if self.hold_id:
+                release_points(self.hold_id)
+                self.hold_id = None
+
+    def _generate_stream(self, prompt: str, api_name: str, use_cache: bool) -> Generator[str, None, None]:
+        """按降级顺序生成内容，完成后记录账单和历史记录"""
+        chain = self._fallback_chain(api_name)
+        attempted = False
+        self.current_api = api_name
+
+        # 对冲模式（需在 config.json 的 hedging.enabled 中开启）
+        if len(chain) > 1 and get_hedging_settings(self.config)["enabled"]:
+            try:
+                yield from self._generate_hedged(prompt, chain, use_cache)
+                return
+            except Exception as e:
+                add_log("error", f"API调用失败: {str(e)}")
                 if self.full_content:
-                    try:
-                        success = add_letters_record(
-                            input_letters=input_letters,
-                            output_letters=len(self.full_content),
-                            api_name=api_name,
-                            operation=f"生成{st.session_state.current_section}内容(部分)"
-                        )
-                        # 在内容末尾添加字符统计
-                        yield f"\n\n生成内容总字符数: {len(self.full_content)}"
-                    except Exception as e:
-                        add_log("error", f"内容生成部分错误: {str(e)}")
-                yield ""
\ No newline at end of file
+                    raise
+                chain = []
+                attempted = True
+
+        for index, current_api in enumerate(chain):
+            try:
+                #add_log("info", f"Generating content stream for API: {current_api}")
+                yield from self._generate_with_provider(prompt, current_api, use_cache)
+                return
+            except CircuitOpenError as e:
+                add_log("warning", str(e))
+                continue
+            except Exception as e:
+                attempted = True
+                add_log("error", f"API调用失败: {str(e)}")
+                if self.full_content:
+                    # 已经输出的内容无法从页面上撤回，不再降级，避免两个API的内容拼接在一起；
+                    # 由调用方显示错误，预授权在 generate_content_stream 中释放
+                    raise
+                if index + 1 < len(chain):
+                    add_log("info", f"尝试下一个API: {chain[index + 1]}")
+
+        if not attempted:
+            # 全部熔断时不直接放弃，强制尝试首选API
+            add_log("warning", f"所有API均处于熔断状态，强制尝试 {chain[0]}")
+            try:
+                yield from self._generate_with_provider(prompt, chain[0], use_cache, force=True)
+                return
+            except Exception as e:
+                add_log("error", f"API调用失败: {str(e)}")
+
+        # 记录已生成的内容(如果有)
+        if self.full_content:
+            try:
+                self._record_usage(
+                    input_letters=len(prompt),
+                    output_letters=len(self.full_content),
+                    api_name=self.current_api,
+                    operation=f"生成{st.session_state.current_section}内容(部分)"
+                )
+                # 在内容末尾添加字符统计
+                yield f"\n\n生成内容总字符数: {len(self.full_content)}"
+            except Exception as e:
+                add_log("error", f"内容生成部分错误: {str(e)}")
+        yield ""
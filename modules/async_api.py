@@ -0,0 +1,198 @@
+"""
+异步API客户端
+基于 aiohttp 的 generate_content_stream 异步版本，多个生成任务可以共享同一个事件循环，
+用于并发生成和无界面的批量模式。支持与 APIClient 相同的三个API、SSE解析和降级顺序，
+不依赖 streamlit，计费和历史记录由调用方通过 on_complete 回调处理
+"""
+
+import asyncio
+import time
+from typing import Dict, Any, AsyncGenerator, Callable, Optional
+
+import aiohttp
+
+from .http_pool import DEFAULT_POOL_CONFIG
+from .provider_health import CircuitOpenError, get_health_registry
+from .providers import build_request, fallback_chain
+from .retry import APIError, RetryPolicy, parse_retry_after
+from .sse import get_stream_decoder
+
+# aiohttp 的可重试网络异常
+ASYNC_RETRYABLE_EXCEPTIONS = (
+    aiohttp.ClientConnectionError,
+    aiohttp.ClientPayloadError,
+    asyncio.TimeoutError,
+)
+
+
+class AsyncAPIClient:
+    """异步流式API客户端，建议在 async with 中使用以便关闭连接池"""
+
+    def __init__(self, config: Dict[str, Any], logger: Optional[Callable[[str, str], None]] = None):
+        self.config = config
+        self.health = get_health_registry(config)  # 与同步客户端共享健康登记表
+        self.retry_policy = RetryPolicy.from_config(config)
+        self.logger = logger or (lambda level, message: None)
+        self.last_usage: Dict[str, Any] = {}  # 最近一次完整生成的token用量
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> "AsyncAPIClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """获取（必要时创建）带keep-alive连接池的会话，需在事件循环中调用"""
+        if self._session is None or self._session.closed:
+            settings = dict(DEFAULT_POOL_CONFIG)
+            settings.update(self.config.get("http_pool", {}))
+            connector = aiohttp.TCPConnector(
+                limit_per_host=int(settings["pool_maxsize"]),
+                keepalive_timeout=float(settings["idle_timeout"])
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=30)
+            )
+        return self._session
+
+    async def close(self):
+        """关闭会话和连接池"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _is_retryable(self, error: Exception) -> bool:
+        return self.retry_policy.is_retryable(error) or isinstance(error, ASYNC_RETRYABLE_EXCEPTIONS)
+
+    async def _stream_provider(self, prompt: str, api_name: str) -> AsyncGenerator[str, None]:
+        """向单个API发送请求并逐块产出内容，同时记录健康状态"""
+        url, headers, data = build_request(self.config, prompt, api_name)
+        health = self.health.get(api_name)
+        started = time.monotonic()
+        ttft = None
+
+        try:
+            async with self._get_session().post(url, headers=headers, json=data) as response:
+                if response.status != 200:
+                    raise APIError(
+                        f"API请求失败 (状态码: {response.status})",
+                        status_code=response.status,
+                        retry_after=parse_retry_after(response.headers.get("Retry-After"))
+                    )
+
+                decoder = get_stream_decoder(api_name)
+                async for raw in response.content.iter_any():
+                    # 收到结束标记后继续读完剩余数据，使连接能归还连接池复用
+                    if decoder.done:
+                        continue
+                    for chunk in decoder.feed(raw):
+                        if ttft is None:
+                            ttft = time.monotonic() - started
+                        yield chunk
+                if not decoder.done:
+                    for chunk in decoder.flush():
+                        yield chunk
+                self.last_usage = dict(decoder.usage)
+                if decoder.malformed:
+                    self.logger("warning", f"{api_name} 流中有 {decoder.malformed} 个事件无法解析，已跳过")
+        except (GeneratorExit, asyncio.CancelledError):
+            # 调用方提前停止读取或任务被取消，不计入成败
+            if ttft is not None:
+                health.record_ttft(ttft)
+            health.record_cancel()
+            raise
+        except Exception:
+            health.record_failure()
+            raise
+        else:
+            health.record_success(time.monotonic() - started, ttft)
+
+    async def _stream_with_retry(self, prompt: str, api_name: str) -> AsyncGenerator[str, None]:
+        """在同一个API上按重试策略重试，已经产出内容后不再重试"""
+        attempt = 0
+        while True:
+            yielded = False
+            try:
+                async for chunk in self._stream_provider(prompt, api_name):
+                    yielded = True
+                    yield chunk
+                return
+            except Exception as e:
+                if yielded or not self._is_retryable(e):
+                    raise
+                wait = self.retry_policy.wait_time(attempt, getattr(e, "retry_after", None))
+                if wait is None or not self.health.get(api_name).allow_request():
+                    raise
+                attempt += 1
+                self.logger("warning", f"{api_name} 请求失败: {str(e)}，{wait:.1f}秒后第{attempt}次重试")
+                await asyncio.sleep(wait)
+
+    async def _generate_with_provider(self, prompt: str, api_name: str,
+                                      force: bool = False) -> AsyncGenerator[str, None]:
+        """使用单个API生成内容，熔断打开时抛出 CircuitOpenError"""
+        if not force and not self.health.get(api_name).allow_request():
+            raise CircuitOpenError(f"{api_name} 熔断中，跳过")
+        async for chunk in self._stream_with_retry(prompt, api_name):
+            yield chunk
+
+    async def generate_content_stream(
+        self,
+        prompt: str,
+        api_name: str = "claude",
+        on_complete: Optional[Callable[[str, str, str], None]] = None
+    ) -> AsyncGenerator[str, None]:
+        """生成内容的异步流式接口
+
+        按 claude → moonshot → zhipu 的顺序降级，熔断中的API直接跳过
+
+        Args:
+            prompt: 提示词
+            api_name: 首选的API提供方
+            on_complete: 生成完成后的回调 (api_name, prompt, content)，用于计费和保存历史
+        """
+        chain = fallback_chain(api_name)
+        attempted = False
+
+        for index, current_api in enumerate(chain):
+            content = ""
+            try:
+                async for chunk in self._generate_with_provider(prompt, current_api):
+                    content += chunk
+                    yield chunk
+            except CircuitOpenError as e:
+                self.logger("warning", str(e))
+                continue
+            except Exception as e:
+                attempted = True
+                self.logger("error", f"API调用失败: {str(e)}")
+                if index + 1 < len(chain):
+                    self.logger("info", f"尝试下一个API: {chain[index + 1]}")
+                continue
+
+            if content and on_complete:
+                on_complete(current_api, prompt, content)
+            return
+
+        if not attempted:
+            # 全部熔断时不直接放弃，强制尝试首选API
+            self.logger("warning", f"所有API均处于熔断状态，强制尝试 {chain[0]}")
+            content = ""
+            try:
+                async for chunk in self._generate_with_provider(prompt, chain[0], force=True):
+                    content += chunk
+                    yield chunk
+            except Exception as e:
+                self.logger("error", f"API调用失败: {str(e)}")
+                return
+            if content and on_complete:
+                on_complete(chain[0], prompt, content)
+
+    async def generate_content(self, prompt: str, api_name: str = "claude",
+                               on_complete: Optional[Callable[[str, str, str], None]] = None) -> str:
+        """生成完整内容（非流式）"""
+        parts = []
+        async for chunk in self.generate_content_stream(prompt, api_name, on_complete):
+            parts.append(chunk)
+        return "".join(parts)
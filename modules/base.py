@@ -6,11 +6,14 @@
 import streamlit as st
 import sqlite3
 from datetime import datetime
-from pathlib import Path
 import json
 import traceback
-from typing import Optional, Dict, Any, List, Union
+from typing import Optional, Dict, Any, List, Mapping, Union
 from .logger import add_log
+from db.pool import get_pool
+from .config_registry import get_config, get_prompts, get_templates
+from user.user_history import insert_history
+from db.history_codec import decode_content
 
 class BaseManager:
     """基础管理器类，提供数据库连接和基本操作"""
@@ -19,8 +22,8 @@ class BaseManager:
         self.db_path = 'db/users.db'
     
     def get_connection(self) -> sqlite3.Connection:
-        """获取数据库连接"""
-        return sqlite3.connect(self.db_path)
+        """获取数据库连接（连接池中的连接，close() 时归还）"""
+        return get_pool(self.db_path).connection()
     
     def execute_query(self, query: str, params: tuple = ()) -> Optional[List[tuple]]:
         """执行数据库查询"""
@@ -39,36 +42,31 @@ class BaseManager:
                 conn.close()
 
 class ConfigManager:
-    """配置管理器，处理所有配置文件的加载"""
+    """配置管理器，处理所有配置文件的加载（由 config_registry 缓存，返回只读视图）"""
     
     @staticmethod
-    def load_config() -> Optional[Dict[str, Any]]:
+    def load_config() -> Optional[Mapping[str, Any]]:
         """加载主配置文件"""
         try:
-            config_path = Path("config/config.json")
-            with open(config_path, 'r', encoding='utf-8') as file:
-                return json.load(file)
+            return get_config()
         except Exception as e:
             add_log("error", f"加载配置文件失败: {str(e)}", include_trace=True)
             return None
 
     @staticmethod
-    def load_templates() -> Optional[Dict[str, Any]]:
+    def load_templates() -> Optional[Mapping[str, Any]]:
         """加载模板配置"""
         try:
-            template_path = Path("config/templates.json")
-            with open(template_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return get_templates()
         except Exception as e:
             add_log("error", f"加载模板文件失败: {str(e)}", include_trace=True)
             return None
 
     @staticmethod
-    def load_prompts() -> Dict[str, Any]:
+    def load_prompts() -> Mapping[str, Any]:
         """加载提示词配置"""
         try:
-            with open('config/prompt.json', 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return get_prompts()
         except FileNotFoundError:
             add_log("error", "未找到 prompt.json 配置文件")
             return {}
@@ -96,7 +94,7 @@ class HistoryManager(BaseManager):
             formatted_records = []
             for record in records:
                 try:
-                    content = json.loads(record[3]) if record[3] else {}
+                    content = json.loads(decode_content(record[3])) if record[3] else {}
                     history_item = {
                         'user_id': record[0],
                         'timestamp': record[1],
@@ -136,10 +134,12 @@ class HistoryManager(BaseManager):
             timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             user_id = data.get('user_id', st.session_state.get('user'))
 
-            self.execute_query(
-                "INSERT INTO history (user_id, timestamp, type, content) VALUES (?, ?, ?, ?)",
-                (user_id, timestamp, history_type, content)
-            )
+            conn = self.get_connection()
+            try:
+                insert_history(conn, user_id, timestamp, history_type, content)
+                conn.commit()
+            finally:
+                conn.close()
             return True
             
         except Exception as e:
@@ -147,14 +147,14 @@ class HistoryManager(BaseManager):
             return False
 
 def get_user_manager():
-    """延迟导入并获取用户管理器实例"""
-    from user.user_process import UserManager
-    return UserManager()
+    """延迟导入并获取进程内共享的用户管理器实例"""
+    from modules.resources import get_user_manager as shared_user_manager
+    return shared_user_manager()
 
 def get_bill_manager():
-    """延迟导入并获取账单管理器实例"""
-    from bill.bill import BillManager
-    return BillManager()
+    """延迟导入并获取进程内共享的账单管理器实例"""
+    from modules.resources import get_bill_manager as shared_bill_manager
+    return shared_bill_manager()
 
 def update_sidebar_points():
     """更新侧边栏积分显示"""
@@ -0,0 +1,143 @@
+"""
+配置注册表
+config/ 下的 JSON 文件每个进程只解析一次，之后每次读取只比较文件的修改时间和大小，
+文件被修改后自动重新加载（重新加载失败时继续使用上一次成功加载的内容）。
+返回的配置是只读视图（dict 转为 MappingProxyType，list 转为 tuple），进程内共享，调用方不能修改；
+需要修改时用 thaw() 得到普通的 dict/list 副本。
+提示词中的 ${name} 占位符由 PromptTemplate 预先切分，替换时不再扫描整段模板
+
+用法:
+    config = get_config()                          # config/config.json
+    prompts = get_prompts()                        # config/prompt.json
+    prompt = compile_template(prompts["mlp"]["prompt"]).render(core_sentence=...)
+"""
+
+import json
+import os
+import re
+import threading
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from user.logger import add_log
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_DIR = os.path.join(ROOT_DIR, 'config')
+
+_PLACEHOLDER = re.compile(r'\$\{(\w+)\}')
+
+
+def freeze(value: Any) -> Any:
+    """把 JSON 解析结果转为只读结构"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """freeze() 的逆操作，返回可修改的副本"""
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+class PromptTemplate:
+    """预先切分好的提示词模板，render() 只拼接片段
+
+    与 str.replace("${name}", value) 的结果一致：未提供值的占位符原样保留
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        # 偶数位置是普通文本，奇数位置是占位符名称
+        self._parts = _PLACEHOLDER.split(text)
+        self.fields = frozenset(self._parts[1::2])
+
+    def render(self, **values: Any) -> str:
+        parts = self._parts
+        out = [parts[0]]
+        for i in range(1, len(parts), 2):
+            name = parts[i]
+            out.append(str(values[name]) if name in values else f"${{{name}}}")
+            out.append(parts[i + 1])
+        return ''.join(out)
+
+
+@lru_cache(maxsize=256)
+def compile_template(text: str) -> PromptTemplate:
+    """按模板文本缓存编译结果，配置重新加载后新的文本会重新编译"""
+    return PromptTemplate(text)
+
+
+class ConfigRegistry:
+    """按文件缓存解析后的配置，读取时用 os.stat 检查文件是否变化"""
+
+    def __init__(self, config_dir: str = CONFIG_DIR):
+        self.config_dir = config_dir
+        self._lock = threading.Lock()
+        # 文件名 -> ((mtime_ns, size), 只读配置)
+        self._entries: Dict[str, Tuple[Tuple[int, int], Any]] = {}
+
+    def get(self, name: str) -> Any:
+        """读取 config/ 下的 JSON 文件
+
+        第一次加载失败时抛出 FileNotFoundError 或 ValueError（JSON 格式错误）
+        """
+        path = os.path.join(self.config_dir, name)
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    value = freeze(json.load(f))
+            except ValueError as e:
+                if entry is None:
+                    raise
+                # 文件可能正在写入，保留旧版本，下次读取时再试
+                add_log("error", f"重新加载配置文件 {name} 失败，继续使用上一版本: {str(e)}")
+                return entry[1]
+            if entry is not None:
+                add_log("info", f"配置文件 {name} 已重新加载")
+            self._entries[name] = (version, value)
+            return value
+
+
+_registry: Optional[ConfigRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ConfigRegistry:
+    """获取进程级共享的配置注册表"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ConfigRegistry()
+        return _registry
+
+
+def get_config() -> Mapping[str, Any]:
+    return get_registry().get('config.json')
+
+
+def get_templates() -> Mapping[str, Any]:
+    return get_registry().get('templates.json')
+
+
+def get_prompts() -> Mapping[str, Any]:
+    return get_registry().get('prompt.json')
+
+
+def get_aar_prompts() -> Mapping[str, Any]:
+    return get_registry().get('prompt-aar.json')['aar']
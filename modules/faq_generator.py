@@ -2,7 +2,9 @@ import streamlit as st
 import json
 from typing import Optional
 from .api import APIClient
+from .stream_render import render_stream
 from .utils import load_prompts, add_log
+from .config_registry import compile_template
 
 class FAQGenerator:
     def __init__(self, api_client: APIClient):
@@ -59,23 +61,17 @@ class FAQGenerator:
                     add_log("info", f"🚀 开始生成问题: {faq_data['title']}")
                     
                     # 构建完整提示词，替换${core_sentence}占位符
-                    prompt = faq_data['prompt'].replace(
-                        "${core_sentence}", 
-                        full_core_sentence
-                    )
+                    prompt = compile_template(faq_data['prompt']).render(core_sentence=full_core_sentence)
                     
                     # 创建占位符用于流式输出
                     response_placeholder = st.empty()
                     
                     try:
-                        # 初始化响应文本
-                        full_response = ""
-                        
-                        # 流式生成内容
-                        for chunk in self.api_client.generate_content_stream(prompt):
-                            full_response += chunk
-                            # 实时更新显示的内容
-                            response_placeholder.markdown(full_response)
+                        # 流式生成内容，按时间和字数合并后刷新显示
+                        render_stream(
+                            response_placeholder,
+                            self.api_client.generate_content_stream(prompt)
+                        )
                         
                         add_log("info", f"✨ 问题 {faq_data['title']} 生成完成")
                         
@@ -0,0 +1,185 @@
+"""
+对冲请求模块
+首选API在截止时间内没有返回首个内容块时，向备用API发起对冲请求，
+先产出内容的一方胜出，另一方被取消。
+每个对冲请求在自己的线程中按 retry_config 在同一个API上重试（与非对冲模式相同），
+token用量各自记录，只有胜出方的用量写入 result['usage']
+"""
+
+import queue
+import threading
+import time
+from typing import Dict, Any, Generator, List, Optional
+from .provider_health import percentile
+
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:  # 旧版本streamlit
+    from streamlit.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+# 默认对冲配置，可在 config.json 的 hedging 中覆盖
+DEFAULT_HEDGING_CONFIG = {
+    "enabled": False,      # 默认关闭，需显式开启
+    "percentile": 0.95,    # 用首选API首字延迟的该分位数作为对冲截止时间
+    "min_samples": 10,     # 样本不足时使用 default_delay
+    "default_delay": 8.0,  # 默认截止时间（秒）
+    "min_delay": 1.0       # 截止时间下限（秒）
+}
+
+# 事件类型
+CHUNK = "chunk"
+DONE = "done"
+ERROR = "error"
+
+
+def get_hedging_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    """合并默认对冲配置和 config.json 中的配置"""
+    settings = dict(DEFAULT_HEDGING_CONFIG)
+    settings.update(config.get("hedging", {}))
+    return settings
+
+
+def hedge_delay(health, settings: Dict[str, Any]) -> float:
+    """根据首选API的历史首字延迟计算对冲截止时间"""
+    ttfts = list(health.ttfts)
+    if len(ttfts) < int(settings["min_samples"]):
+        delay = float(settings["default_delay"])
+    else:
+        delay = percentile(ttfts, float(settings["percentile"]))
+    return max(float(settings["min_delay"]), delay)
+
+
+class HedgedRunner(threading.Thread):
+    """在后台线程中读取单个API的流（含同一API上的重试），把内容块放入共享事件队列"""
+
+    def __init__(self, client, prompt: str, api_name: str, events: queue.Queue):
+        super().__init__(daemon=True)
+        self.client = client
+        self.prompt = prompt
+        self.api_name = api_name
+        self.events = events
+        self.usage: Dict[str, Any] = {}  # 本请求的token用量，多个对冲请求共用一个客户端，不能写入 client.last_usage
+        self.cancel_event = threading.Event()
+        self._response = None
+        self._response_lock = threading.Lock()
+
+    def _on_response(self, response):
+        with self._response_lock:
+            self._response = response
+            cancelled = self.cancel_event.is_set()
+        if cancelled:
+            response.close()
+
+    def cancel(self):
+        """取消请求：关闭底层连接使阻塞的读取立即返回"""
+        self.cancel_event.set()
+        with self._response_lock:
+            response = self._response
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+
+    def run(self):
+        stream = self.client._stream_with_retry(
+            self.prompt, self.api_name,
+            cancel_event=self.cancel_event,
+            on_response=self._on_response,
+            usage=self.usage
+        )
+        try:
+            for chunk in stream:
+                if self.cancel_event.is_set():
+                    break
+                self.events.put((self, CHUNK, chunk))
+            else:
+                self.events.put((self, DONE, None))
+        except Exception as e:
+            if not self.cancel_event.is_set():
+                self.events.put((self, ERROR, e))
+        finally:
+            stream.close()
+
+
+def hedged_stream(client, prompt: str, candidates: List[str], delay: float,
+                  result: Dict[str, Any]) -> Generator[str, None, None]:
+    """对冲生成：先请求 candidates[0]，超过 delay 秒仍无内容时请求下一个
+
+    正在进行的请求全部失败时立即启动下一个候选；胜出的API名称写入 result['api_name']，
+    其token用量写入 result['usage']
+    """
+    events: queue.Queue = queue.Queue()
+    # 对冲线程中会记录日志，需要绑定调用方的脚本上下文
+    ctx = get_script_run_ctx()
+    pending = list(candidates)
+    runners: List[HedgedRunner] = []
+    winner: Optional[HedgedRunner] = None
+    last_error: Optional[Exception] = None
+
+    def launch() -> bool:
+        # 跳过熔断中的候选
+        while pending:
+            api_name = pending.pop(0)
+            if client.health.get(api_name).allow_request():
+                runner = HedgedRunner(client, prompt, api_name, events)
+                add_script_run_ctx(runner, ctx)
+                runners.append(runner)
+                runner.start()
+                return True
+        return False
+
+    try:
+        if not launch():
+            raise Exception("没有可用的API")
+        active = 1
+        hedge_at = time.monotonic() + delay
+        hedged = False
+
+        while winner is None:
+            timeout = None
+            if not hedged and pending:
+                timeout = max(0.0, hedge_at - time.monotonic())
+            try:
+                runner, kind, payload = events.get(timeout=timeout)
+            except queue.Empty:
+                hedged = True
+                if launch():
+                    active += 1
+                continue
+
+            if kind == CHUNK:
+                winner = runner
+                result["api_name"] = runner.api_name
+                result["hedged"] = len(runners) > 1
+                # 取消其余请求，落败方不计费
+                for other in runners:
+                    if other is not winner:
+                        other.cancel()
+                yield payload
+                break
+
+            # 未产出任何内容就结束的请求
+            active -= 1
+            if kind == ERROR:
+                last_error = payload
+            if active == 0:
+                if not launch():
+                    raise last_error or Exception("所有API均未返回内容")
+                active += 1
+
+        while True:
+            runner, kind, payload = events.get()
+            if runner is not winner:
+                continue
+            if kind == CHUNK:
+                yield payload
+            elif kind == DONE:
+                result["usage"] = dict(winner.usage)
+                return
+            else:
+                raise payload
+    finally:
+        for runner in runners:
+            if runner is not winner or runner.is_alive():
+                runner.cancel()
@@ -0,0 +1,112 @@
+"""
+HTTP连接池模块
+为每个API提供方维护进程级共享的 requests.Session，复用 TCP/TLS 连接，
+避免每次生成都重新握手
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Iterator
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 默认连接池参数，可在 config.json 的 http_pool 中覆盖
+DEFAULT_POOL_CONFIG = {
+    "pool_connections": 4,   # 每个Session缓存的主机连接池数量
+    "pool_maxsize": 16,      # 每个主机最多保持的空闲连接数
+    "idle_timeout": 90       # 会话空闲超过该秒数后被回收
+}
+
+
+class HTTPSessionPool:
+    """按API提供方划分的会话池，进程内所有 APIClient 共享"""
+
+    def __init__(self, pool_connections: int, pool_maxsize: int, idle_timeout: float):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.idle_timeout = idle_timeout
+        self._sessions: Dict[str, requests.Session] = {}
+        self._last_used: Dict[str, float] = {}
+        self._active: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _create_session(self) -> requests.Session:
+        """创建带连接池的会话"""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({"Connection": "keep-alive"})
+        return session
+
+    def _evict_idle_locked(self, now: float):
+        """回收空闲超时且没有进行中请求的会话（调用方需持有锁）"""
+        for provider in list(self._sessions):
+            if self._active.get(provider, 0) > 0:
+                continue
+            if now - self._last_used.get(provider, now) > self.idle_timeout:
+                self._sessions.pop(provider).close()
+                self._last_used.pop(provider, None)
+
+    @contextmanager
+    def lease(self, provider: str) -> Iterator[requests.Session]:
+        """借用某个提供方的会话，流式响应读完前不会被回收"""
+        with self._lock:
+            now = time.monotonic()
+            self._evict_idle_locked(now)
+            session = self._sessions.get(provider)
+            if session is None:
+                session = self._create_session()
+                self._sessions[provider] = session
+            self._active[provider] = self._active.get(provider, 0) + 1
+            self._last_used[provider] = now
+
+        try:
+            yield session
+        finally:
+            with self._lock:
+                self._active[provider] -= 1
+                self._last_used[provider] = time.monotonic()
+
+    def close(self):
+        """关闭所有会话"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._last_used.clear()
+
+
+_pool: Optional[HTTPSessionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_http_pool(config: Optional[Dict[str, Any]] = None) -> HTTPSessionPool:
+    """获取进程级共享的连接池，首次调用时按配置创建"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                settings = dict(DEFAULT_POOL_CONFIG)
+                if config:
+                    settings.update(config.get("http_pool", {}))
+                _pool = HTTPSessionPool(
+                    pool_connections=int(settings["pool_connections"]),
+                    pool_maxsize=int(settings["pool_maxsize"]),
+                    idle_timeout=float(settings["idle_timeout"])
+                )
+    return _pool
+
+
+def close_http_pool():
+    """关闭进程级共享的连接池，之后再次获取会重新创建"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
@@ -0,0 +1,43 @@
+"""
+延迟导入
+体积大的第三方库（pandas、plotly、numpy、reportlab、docx、boto3 等）在模块顶层用 lazy_import 声明，
+第一次访问其属性时才真正导入，应用启动和不需要它们的页面不再承担导入开销。
+启动时的导入耗时由 scripts/importtime_budget.py 检查
+
+用法:
+    pd = lazy_import('pandas')
+    px = lazy_import('plotly.express')
+
+注意类型注解会在定义函数时求值，注解中请写成字符串（如 -> 'pd.DataFrame'），否则会提前触发导入
+"""
+
+import importlib
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    """模块占位对象，第一次访问属性时导入真正的模块，并把其属性复制过来，之后的访问不再经过 __getattr__"""
+
+    def _load(self) -> types.ModuleType:
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return module
+
+    def __getattr__(self, name: str):
+        return getattr(self._load(), name)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        loaded = self.__name__ in sys.modules
+        return f"<lazy module '{self.__name__}'{'' if loaded else ' (not loaded)'}>"
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """返回模块 name，尚未导入时返回延迟导入的占位对象"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
@@ -1,6 +1,7 @@
 import streamlit as st
 from typing import Optional, Dict
 from .api import APIClient
+from .stream_render import render_stream
 from .utils import load_prompts, add_log  # 从utils导入add_log
 
 class PRGenerator:
@@ -151,14 +152,11 @@ class PRGenerator:
                 
                 try:
                     add_log("info", "🚀 开始生成新闻稿...")
-                    # 初始化响应文本
-                    full_response = ""
-                    
-                    # 流式生成内容
-                    for chunk in self.api_client.generate_content_stream(prompt):
-                        full_response += chunk
-                        # 实时更新显示的内容
-                        response_placeholder.markdown(full_response)
+                    # 流式生成内容，按时间和字数合并后刷新显示
+                    render_stream(
+                        response_placeholder,
+                        self.api_client.generate_content_stream(prompt)
+                    )
                     
                     add_log("info", "✨ 新闻稿生成完成")
                     
@@ -0,0 +1,166 @@
+"""
+API提供方健康状态模块
+记录每个提供方的错误率、延迟分位数和首字延迟(TTFT)，
+并实现熔断器：连续失败后打开熔断，冷却后以半开状态放行探测请求
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Optional, List
+
+# 熔断器状态
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# 默认熔断配置，可在 config.json 的 circuit_breaker 中覆盖
+DEFAULT_BREAKER_CONFIG = {
+    "failure_threshold": 3,   # 连续失败多少次后打开熔断
+    "recovery_timeout": 30,   # 熔断打开后多少秒进入半开状态
+    "window": 50              # 统计错误率和分位数的滑动窗口大小
+}
+
+
+class CircuitOpenError(Exception):
+    """提供方熔断中，请求未发出"""
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """计算分位数（最近秩法），无数据时返回 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+    return ordered[index]
+
+
+class ProviderHealth:
+    """单个提供方的健康统计和熔断器"""
+
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float, window: int):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.outcomes = deque(maxlen=window)   # True 表示成功
+        self.latencies = deque(maxlen=window)  # 完整请求耗时（秒）
+        self.ttfts = deque(maxlen=window)      # 首字延迟（秒）
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """判断是否允许发出请求；半开状态下只放行一个探测请求"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.recovery_timeout:
+                    return False
+                self.state = HALF_OPEN
+                self.probe_in_flight = False
+            if self.probe_in_flight:
+                return False
+            self.probe_in_flight = True
+            return True
+
+    def record_success(self, latency: float, ttft: Optional[float]):
+        """记录一次成功请求"""
+        with self._lock:
+            self.outcomes.append(True)
+            self.latencies.append(latency)
+            if ttft is not None:
+                self.ttfts.append(ttft)
+            self.consecutive_failures = 0
+            self.probe_in_flight = False
+            self.state = CLOSED
+
+    def record_failure(self):
+        """记录一次失败请求，达到阈值或半开探测失败时打开熔断"""
+        with self._lock:
+            self.outcomes.append(False)
+            self.consecutive_failures += 1
+            self.probe_in_flight = False
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def record_ttft(self, ttft: float):
+        """单独记录首字延迟（请求被中途取消时也能保留该样本）"""
+        with self._lock:
+            self.ttfts.append(ttft)
+
+    def record_cancel(self):
+        """请求被调用方中止，不计入成功或失败，仅释放半开探测名额"""
+        with self._lock:
+            self.probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回当前健康统计"""
+        with self._lock:
+            outcomes = list(self.outcomes)
+            latencies = list(self.latencies)
+            ttfts = list(self.ttfts)
+            state = self.state
+        return {
+            "provider": self.name,
+            "state": state,
+            "requests": len(outcomes),
+            "error_rate": (outcomes.count(False) / len(outcomes)) if outcomes else 0.0,
+            "latency_p50": percentile(latencies, 0.50),
+            "latency_p95": percentile(latencies, 0.95),
+            "ttft_p50": percentile(ttfts, 0.50),
+            "ttft_p95": percentile(ttfts, 0.95)
+        }
+
+
+class ProviderHealthRegistry:
+    """进程内共享的提供方健康登记表"""
+
+    def __init__(self, failure_threshold: int, recovery_timeout: float, window: int):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.window = window
+        self._providers: Dict[str, ProviderHealth] = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider: str) -> ProviderHealth:
+        """获取（必要时创建）提供方的健康记录"""
+        with self._lock:
+            health = self._providers.get(provider)
+            if health is None:
+                health = ProviderHealth(
+                    provider, self.failure_threshold, self.recovery_timeout, self.window
+                )
+                self._providers[provider] = health
+            return health
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """返回所有提供方的健康统计"""
+        with self._lock:
+            providers = list(self._providers.values())
+        return [health.snapshot() for health in providers]
+
+
+_registry: Optional[ProviderHealthRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_health_registry(config: Optional[Dict[str, Any]] = None) -> ProviderHealthRegistry:
+    """获取进程级共享的健康登记表，首次调用时按配置创建"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                settings = dict(DEFAULT_BREAKER_CONFIG)
+                if config:
+                    settings.update(config.get("circuit_breaker", {}))
+                _registry = ProviderHealthRegistry(
+                    failure_threshold=int(settings["failure_threshold"]),
+                    recovery_timeout=float(settings["recovery_timeout"]),
+                    window=int(settings["window"])
+                )
+    return _registry
@@ -0,0 +1,51 @@
+"""
+API提供方定义
+同步和异步客户端共用的请求构建和降级顺序（SSE解码见 sse.py），不依赖streamlit
+"""
+
+from typing import Dict, Any, List, Tuple
+
+# API降级顺序
+FALLBACK_CHAIN = ("claude", "moonshot", "zhipu")
+
+
+def fallback_chain(api_name: str) -> List[str]:
+    """从指定的API开始的降级顺序"""
+    if api_name in FALLBACK_CHAIN:
+        return list(FALLBACK_CHAIN[FALLBACK_CHAIN.index(api_name):])
+    return [api_name]
+
+
+# Claude 请求的最大输出token数，生成前的积分预授权也按它估算输出字数
+MAX_OUTPUT_TOKENS = 4096
+
+
+def build_request(config: Dict[str, Any], prompt: str, api_name: str) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+    """构建API请求的URL、请求头和请求体"""
+    if api_name == "claude":
+        headers = {
+            "Content-Type": "application/json",
+            "anthropic-version": "2023-06-01",
+            "x-api-key": config['api_keys'][api_name]
+        }
+        data = {
+            "model": "claude-3-sonnet-20240229",
+            "max_tokens": MAX_OUTPUT_TOKENS,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": True
+        }
+    else:
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {config['api_keys'][api_name]}"
+        }
+        data = {
+            "model": config["models"][api_name],
+            "messages": [
+                {"role": "system", "content": "你是一个专业的产品经理..."},
+                {"role": "user", "content": prompt}
+            ],
+            "stream": True
+        }
+    return config["api_urls"][api_name], headers, data
+
@@ -0,0 +1,211 @@
+"""
+进程级共享资源注册表
+数据库连接池、HTTP 连接池、配置注册表、提供方健康登记表、计费队列、用户信息缓存以及无状态的 UserManager/BillManager
+在每个进程中只创建一次，Streamlit 每次重新运行脚本时直接复用，不再重复构造。
+资源按注册顺序创建，按相反顺序关闭：startup() 在应用启动时预先创建需要常驻的资源，
+shutdown() 在进程退出时（atexit，每个进程只登记一次）依次关闭，计费队列先于数据库连接池关闭，保证未落库的事件写完。
+模块级单例在 Streamlit 的重新运行之间保持不变，与 st.cache_resource 的效果相同，
+同时可以在调度器、脚本等没有 Streamlit 的进程中使用
+
+用法:
+    startup()                          # app.py 启动时调用，重复调用无副作用
+    bill_mgr = get_bill_manager()
+    queue = get_resource('billing_queue')
+"""
+
+import atexit
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from user.logger import add_log
+
+
+class ResourceRegistry:
+    """按名称登记资源的创建和关闭函数，首次获取时创建，之后返回同一个实例"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # 名称 -> (创建函数, 关闭函数, 是否在 startup() 时预先创建)
+        self._factories: Dict[str, tuple] = {}
+        self._instances: Dict[str, Any] = {}
+        self._created: List[str] = []  # 按创建顺序记录，关闭时倒序
+        self._started = False
+        self._atexit_registered = False
+
+    def register(self, name: str, factory: Callable[[], Any],
+                 close: Optional[Callable[[Any], None]] = None, eager: bool = False):
+        """登记资源；close 接收资源实例，进程退出时调用"""
+        with self._lock:
+            self._factories[name] = (factory, close, eager)
+
+    def get(self, name: str) -> Any:
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                if name not in self._factories:
+                    raise KeyError(f"未登记的资源: {name}")
+                instance = self._factories[name][0]()
+                self._instances[name] = instance
+                self._created.append(name)
+                if self._factories[name][1] is not None:
+                    # 没有调用 startup() 的进程（调度器、脚本）同样在退出时关闭
+                    self._register_atexit()
+            return instance
+
+    def _register_atexit(self):
+        if not self._atexit_registered:
+            self._atexit_registered = True
+            atexit.register(self.shutdown)
+
+    def startup(self):
+        """预先创建常驻资源并登记退出时的关闭，只在第一次调用时执行"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self._register_atexit()
+            for name, (_, _, eager) in list(self._factories.items()):
+                if eager:
+                    try:
+                        self.get(name)
+                    except Exception as e:
+                        # 留到第一次使用时再创建，由调用方处理错误
+                        add_log("error", f"启动时创建资源 {name} 失败: {str(e)}")
+
+    def shutdown(self):
+        """按创建的相反顺序关闭资源并重置对应的模块级单例，之后再次获取会重新创建
+
+        没有关闭函数的资源（配置、用户缓存、健康登记表等）不占用外部资源，再次获取时沿用模块级单例
+        """
+        with self._lock:
+            created = list(reversed(self._created))
+            instances = dict(self._instances)
+            self._created.clear()
+            self._instances.clear()
+            self._started = False
+        for name in created:
+            close = self._factories[name][1]
+            if close is None:
+                continue
+            try:
+                close(instances[name])
+            except Exception as e:
+                add_log("error", f"关闭资源 {name} 失败: {str(e)}")
+
+
+def _config():
+    from modules.config_registry import get_config
+    return get_config()
+
+
+def _db_pool():
+    from db.pool import get_pool
+    return get_pool()
+
+
+def _close_db_pools(_pool):
+    from db.pool import close_pools
+    close_pools()
+
+
+def _close_http_pool(_pool):
+    from modules.http_pool import close_http_pool
+    close_http_pool()
+
+
+def _http_pool():
+    from modules.http_pool import get_http_pool
+    return get_http_pool(_config())
+
+
+def _provider_health():
+    from modules.provider_health import get_health_registry
+    return get_health_registry(_config())
+
+
+def _billing_queue():
+    from bill.billing_queue import get_billing_queue
+    return get_billing_queue(_config())
+
+
+def _close_billing_queue(_queue):
+    from bill.billing_queue import close_billing_queue
+    close_billing_queue()
+
+
+def _user_manager():
+    from user.user_base import UserManager
+    return UserManager()
+
+
+def _bill_manager():
+    from bill.bill_base import BillManager
+    return BillManager(user_mgr=get_user_manager())
+
+
+def _user_cache():
+    from user.user_cache import get_user_cache
+    return get_user_cache(_config())
+
+
+def _config_registry():
+    from modules.config_registry import get_registry
+    return get_registry()
+
+
+_registry: Optional[ResourceRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_resources() -> ResourceRegistry:
+    """获取进程级共享的资源注册表"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            registry = ResourceRegistry()
+            # 注册顺序即创建顺序，被依赖的资源放在前面，关闭时最后关闭
+            registry.register('config', _config_registry, eager=True)
+            registry.register('db_pool', _db_pool, close=_close_db_pools, eager=True)
+            registry.register('http_pool', _http_pool, close=_close_http_pool, eager=True)
+            registry.register('provider_health', _provider_health)
+            registry.register('user_manager', _user_manager)
+            registry.register('bill_manager', _bill_manager)
+            registry.register('user_cache', _user_cache, eager=True)
+            registry.register('billing_queue', _billing_queue, close=_close_billing_queue, eager=True)
+            _registry = registry
+        return _registry
+
+
+def get_resource(name: str) -> Any:
+    return get_resources().get(name)
+
+
+def startup():
+    get_resources().startup()
+
+
+def shutdown():
+    get_resources().shutdown()
+
+
+def get_user_manager():
+    """进程内共享的 UserManager（无状态，多线程共用安全）"""
+    return get_resource('user_manager')
+
+
+def get_bill_manager():
+    """进程内共享的 BillManager（无状态，多线程共用安全）"""
+    return get_resource('bill_manager')
+
+
+def get_billing_queue():
+    """进程内共享的计费队列（见 bill/billing_queue.py），退出时由注册表关闭"""
+    return get_resource('billing_queue')
+
+
+def get_user_cache():
+    """进程内共享的用户信息缓存（见 user/user_cache.py）"""
+    return get_resource('user_cache')
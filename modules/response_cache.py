@@ -0,0 +1,170 @@
+"""
+LLM响应缓存模块
+按 提供方 + 模型 + 提示词 + 参数 的哈希缓存完整生成结果，存储在独立的SQLite文件中，
+支持TTL过期和按条数/大小的LRU淘汰。
+默认关闭，需在 config.json 的 response_cache.enabled 中开启；开启后同一会话中再次生成相同的提示词
+视为重新生成，不读取缓存而是请求API并用新结果更新缓存（见 APIClient._lookup_cache）
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, Optional, Generator
+
+# 默认缓存配置，可在 config.json 的 response_cache 中覆盖
+DEFAULT_CACHE_CONFIG = {
+    "enabled": False,
+    "db_path": "db/llm_cache.db",
+    "ttl": 7 * 24 * 3600,          # 缓存有效期（秒）
+    "max_entries": 5000,           # 最多缓存条数
+    "max_bytes": 64 * 1024 * 1024, # 缓存内容总大小上限
+    "replay_chunk_size": 64,       # 命中时回放的每块字符数
+    "billing": "full"              # 命中时的计费策略: full / input_only / free
+}
+
+BILLING_POLICIES = ("full", "input_only", "free")
+
+
+class ResponseCache:
+    """基于SQLite的内容寻址响应缓存"""
+
+    def __init__(self, db_path: str, ttl: float, max_entries: int, max_bytes: int):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                cache_key TEXT PRIMARY KEY,
+                provider TEXT NOT NULL,
+                model TEXT,
+                content TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hits INTEGER DEFAULT 0
+            )
+        ''')
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(provider: str, model: Optional[str], prompt: str, params: Dict[str, Any]) -> str:
+        """计算缓存键：提供方、模型、提示词和其余参数的SHA-256"""
+        payload = json.dumps(
+            {"provider": provider, "model": model, "prompt": prompt, "params": params},
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，过期条目会被删除"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, created_at FROM responses WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if not row:
+                return None
+            content, created_at = row
+            if now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE cache_key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE responses SET last_access = ?, hits = hits + 1 WHERE cache_key = ?",
+                (now, key)
+            )
+            self._conn.commit()
+            return content
+
+    def put(self, key: str, provider: str, model: Optional[str], content: str):
+        """写入缓存并执行淘汰"""
+        now = time.time()
+        size = len(content.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._conn.execute('''
+                INSERT OR REPLACE INTO responses
+                (cache_key, provider, model, content, size, created_at, last_access, hits)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 0)
+            ''', (key, provider, model, content, size, now, now))
+            self._evict_locked(now)
+            self._conn.commit()
+
+    def _evict_locked(self, now: float):
+        """删除过期条目，再按最近访问时间淘汰超出上限的条目"""
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        rows = self._conn.execute(
+            "SELECT cache_key, size FROM responses ORDER BY last_access ASC"
+        ).fetchall()
+        expired = []
+        for cache_key, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            expired.append((cache_key,))
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE cache_key = ?", expired)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+
+def replay_stream(content: str, chunk_size: int) -> Generator[str, None, None]:
+    """将缓存内容按块回放为流"""
+    for i in range(0, len(content), chunk_size):
+        yield content[i:i + chunk_size]
+
+
+def get_cache_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    """合并默认缓存配置和 config.json 中的配置"""
+    settings = dict(DEFAULT_CACHE_CONFIG)
+    settings.update(config.get("response_cache", {}))
+    if settings["billing"] not in BILLING_POLICIES:
+        settings["billing"] = "full"
+    return settings
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache(config: Dict[str, Any]) -> Optional[ResponseCache]:
+    """获取进程级共享的响应缓存，未启用时返回 None"""
+    global _cache
+    settings = get_cache_settings(config)
+    if not settings["enabled"]:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    db_path=settings["db_path"],
+                    ttl=float(settings["ttl"]),
+                    max_entries=int(settings["max_entries"]),
+                    max_bytes=int(settings["max_bytes"])
+                )
+    return _cache
@@ -0,0 +1,101 @@
+"""
+API重试模块
+按 config.json 的 retry_config 对可重试的错误（429、5xx、连接中断等）
+在同一个API上做指数退避重试，支持 Retry-After 和随机抖动
+"""
+
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional
+
+from requests import exceptions as requests_exceptions
+
+# 可重试的HTTP状态码
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+# 可重试的网络异常
+RETRYABLE_EXCEPTIONS = (
+    requests_exceptions.ConnectionError,
+    requests_exceptions.Timeout,
+    requests_exceptions.ChunkedEncodingError,
+    ConnectionResetError,
+)
+
+# 默认重试配置，时间单位为毫秒，与 config.json 的 retry_config 一致
+DEFAULT_RETRY_CONFIG = {
+    "max_retries": 3,
+    "initial_wait": 1000,
+    "backoff_factor": 2,
+    "max_wait": 30000,  # 单次等待上限，Retry-After 超过该值时不再重试
+    "jitter": 0.5       # 抖动比例，实际等待在 [base*(1-jitter), base] 之间
+}
+
+
+class APIError(Exception):
+    """API返回非200状态码"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None,
+                 retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 头（秒数或HTTP日期），返回需要等待的秒数"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """指数退避重试策略"""
+
+    def __init__(self, max_retries: int, initial_wait: float, backoff_factor: float,
+                 max_wait: float, jitter: float):
+        self.max_retries = max_retries
+        self.initial_wait = initial_wait / 1000.0
+        self.backoff_factor = backoff_factor
+        self.max_wait = max_wait / 1000.0
+        self.jitter = min(max(jitter, 0.0), 1.0)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "RetryPolicy":
+        """根据 config.json 的 retry_config 创建策略"""
+        settings = dict(DEFAULT_RETRY_CONFIG)
+        settings.update(config.get("retry_config", {}))
+        return cls(
+            max_retries=int(settings["max_retries"]),
+            initial_wait=float(settings["initial_wait"]),
+            backoff_factor=float(settings["backoff_factor"]),
+            max_wait=float(settings["max_wait"]),
+            jitter=float(settings["jitter"])
+        )
+
+    def is_retryable(self, error: Exception) -> bool:
+        """判断错误是否值得在同一个API上重试"""
+        if isinstance(error, APIError):
+            return error.status_code in RETRYABLE_STATUS
+        return isinstance(error, RETRYABLE_EXCEPTIONS)
+
+    def wait_time(self, attempt: int, retry_after: Optional[float] = None) -> Optional[float]:
+        """第 attempt 次重试（从0开始）前的等待秒数，返回 None 表示不应重试"""
+        if attempt >= self.max_retries:
+            return None
+        if retry_after is not None:
+            # 服务端明确要求的等待时间优先，过长则直接降级到下一个API
+            return retry_after if retry_after <= self.max_wait else None
+        base = min(self.max_wait, self.initial_wait * (self.backoff_factor ** attempt))
+        return random.uniform(base * (1 - self.jitter), base)
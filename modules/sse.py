@@ -0,0 +1,259 @@
+"""
+SSE流式解码模块
+增量解析 Server-Sent Events：按空行切分出完整事件后再解码（网络分块切断多字节中文字符时不会乱码）、
+支持多行 data 帧，并为 Claude 和 OpenAI 兼容接口（moonshot、zhipu）提供各自的内容解码器
+"""
+
+import json
+from typing import Dict, Any, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+
+class SSEEvent(NamedTuple):
+    """一个完整的SSE事件，data 保持为原始字节，由 json.loads 直接解码"""
+    event: Optional[str]
+    data: bytes
+
+
+class StreamError(Exception):
+    """流中返回了错误事件"""
+
+
+def parse_frame(frame: bytes) -> Optional[SSEEvent]:
+    """解析一个完整的事件帧（不含结尾空行），没有 data 字段时返回 None"""
+    event = None
+    data = []
+    for line in frame.split(b"\n"):
+        if line.startswith(b"data:"):
+            value = line[5:]
+            data.append(value[1:] if value.startswith(b" ") else value)
+        elif line.startswith(b"event:"):
+            event = line[6:].strip().decode("utf-8", "replace")
+        # 注释行（以:开头）以及 id、retry 等字段无需处理
+    if not data:
+        return None
+    return SSEEvent(event, b"\n".join(data))
+
+
+_NO_FRAMES: List[bytes] = []  # 没有完整事件时返回的共享空列表，调用方只读
+
+
+class SSEDecoder:
+    """增量SSE解码器，按任意边界切分的字节块都能正确解码
+
+    只在收到完整事件（以空行结尾）后才解码，每个字节只处理一次。
+    每块只从缓冲区末尾查找一次最后的空行（rfind），没有完整事件时不切分；
+    只有在流中出现过 \r 时才规范化换行，并且只检查新到达的块
+    """
+
+    __slots__ = ("_buffer", "_crlf")
+
+    def __init__(self):
+        self._buffer = b""
+        self._crlf = False
+
+    def frames(self, chunk: bytes) -> List[bytes]:
+        """输入一块原始字节，返回其中已经完整的事件帧"""
+        buffer = self._buffer
+        buffer = buffer + chunk if buffer else chunk
+        if self._crlf or b"\r" in chunk:
+            # \r\n 可能被切在两块之间，因此规范化拼接后的缓冲区
+            self._crlf = True
+            buffer = buffer.replace(b"\r\n", b"\n")
+        end = buffer.rfind(b"\n\n")
+        if end < 0:
+            self._buffer = buffer
+            return _NO_FRAMES
+        # 最后一个空行之后是尚未结束的事件，留到下一块
+        self._buffer = buffer[end + 2:]
+        complete = buffer[:end]
+        if b"\n\n" in complete:
+            return complete.split(b"\n\n")
+        return [complete]
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        """输入一块原始字节，返回其中已经完整的事件"""
+        return [event for event in map(parse_frame, self.frames(chunk)) if event is not None]
+
+    def flush_frames(self) -> List[bytes]:
+        """流结束时取出缓冲区中剩余的事件帧（服务端未以空行结尾时）"""
+        buffer, self._buffer = self._buffer, b""
+        if self._crlf:
+            buffer = buffer.replace(b"\r\n", b"\n")
+        buffer = buffer.strip(b"\n")
+        return buffer.split(b"\n\n") if buffer else []
+
+    def flush(self) -> List[SSEEvent]:
+        return [event for event in map(parse_frame, self.flush_frames()) if event is not None]
+
+
+# 先按 UTF-8 解码再解析：json.loads 收到 bytes 时每次都要检测编码；
+# raw_decode 省去 decode() 对首尾空白的两次正则匹配，首尾有空白等少见情况再交给 decode()
+_json_decoder = json.JSONDecoder()
+_raw_decode = _json_decoder.raw_decode
+_json_decode = _json_decoder.decode
+
+
+class StreamDecoder:
+    """提供方内容解码器基类
+
+    feed 返回文本增量列表；用量记录在 usage，收到结束标记后 done 为 True，并统计无法解析的事件数。
+    占绝大多数的内容事件以 FAST_PREFIX 开头且只有一行 data，直接截取 data 解析，不经过 parse_frame
+    """
+
+    FAST_PREFIX = b"data: "   # 内容事件帧的固定前缀
+    FAST_EVENT: Optional[str] = None  # 命中前缀时的事件名
+    DONE_DATA: Optional[bytes] = None  # 表示流结束的 data
+
+    def __init__(self):
+        self.sse = SSEDecoder()
+        self.done = False
+        self.malformed = 0  # 无法解析的事件数
+        self.usage: Dict[str, Any] = {}
+
+    def feed(self, chunk: bytes) -> List[str]:
+        """输入一块原始字节，返回解码出的文本增量"""
+        frames = self.sse.frames(chunk)
+        return self.decode_frames(frames) if frames else []
+
+    def flush(self) -> List[str]:
+        """流结束时解码剩余的事件"""
+        return self.decode_frames(self.sse.flush_frames())
+
+    def _select(self, frame: bytes) -> Optional[Tuple[Optional[str], bytes]]:
+        """解析不符合快速路径的帧，返回需要解码的 (事件名, data)；无需解码时返回 None，遇到结束标记时设置 done"""
+        raise NotImplementedError
+
+    def _handle(self, event: Optional[str], data: Dict[str, Any]) -> Optional[str]:
+        """处理解析后的事件，返回文本增量"""
+        raise NotImplementedError
+
+    def decode_frames(self, frames: List[bytes]) -> List[str]:
+        """解码一批完整的事件帧"""
+        prefix = self.FAST_PREFIX
+        offset = len(prefix)
+        fast_event = self.FAST_EVENT
+        done_data = self.DONE_DATA
+        handle = self._handle
+        texts = []
+        for frame in frames:
+            raw = frame[offset:] if frame.startswith(prefix) else None
+            if raw is not None and b"\n" not in raw and raw != done_data:
+                event = fast_event
+            else:
+                selected = self._select(frame)
+                if selected is None:
+                    if self.done:
+                        break
+                    continue
+                event, raw = selected
+
+            try:
+                text = raw.decode("utf-8")
+                data, end = _raw_decode(text)
+                if end != len(text):
+                    data = _json_decode(text)
+            except ValueError:
+                try:
+                    data = _json_decode(raw.decode("utf-8", "replace"))
+                except ValueError:
+                    data = None
+            if not isinstance(data, dict):
+                self.malformed += 1
+                continue
+
+            text = handle(event, data)
+            if text:
+                texts.append(text)
+        return texts
+
+
+class ClaudeStreamDecoder(StreamDecoder):
+    """Anthropic Messages 流式接口解码器"""
+
+    FAST_PREFIX = b"event: content_block_delta\ndata: "
+    FAST_EVENT = "content_block_delta"
+    # 不含内容的事件，无需解析JSON
+    SKIP_EVENTS = frozenset(("ping", "message_start", "content_block_start", "content_block_stop"))
+
+    def _select(self, frame: bytes) -> Optional[Tuple[Optional[str], bytes]]:
+        event = parse_frame(frame)
+        if event is None or event.event in self.SKIP_EVENTS:
+            return None
+        if event.event == "message_stop":
+            self.done = True
+            return None
+        return event
+
+    def _handle(self, event: Optional[str], data: Dict[str, Any]) -> Optional[str]:
+        kind = data.get("type") or event
+        if kind == "content_block_delta":
+            return data.get("delta", {}).get("text")
+        if kind == "message_delta":
+            # message_delta 携带本次生成的输出token数
+            usage = data.get("usage")
+            if usage:
+                self.usage.update(usage)
+        elif kind == "message_stop":
+            self.done = True
+        elif kind == "error":
+            raise StreamError(data.get("error", {}).get("message", "流式响应返回错误"))
+        return None
+
+
+class OpenAIStreamDecoder(StreamDecoder):
+    """OpenAI 兼容流式接口（moonshot、zhipu）解码器"""
+
+    DONE_DATA = b"[DONE]"
+
+    def _select(self, frame: bytes) -> Optional[Tuple[Optional[str], bytes]]:
+        event = parse_frame(frame)
+        if event is None:
+            return None
+        if event.data == self.DONE_DATA:
+            self.done = True
+            return None
+        return None, event.data
+
+    def _handle(self, event: Optional[str], data: Dict[str, Any]) -> Optional[str]:
+        try:
+            choice = data["choices"][0]
+            text = choice["delta"].get("content")
+        except (KeyError, IndexError, TypeError, AttributeError):
+            choice = {}
+            text = None
+            if "error" in data:
+                error = data["error"]
+                raise StreamError(error.get("message", str(error)) if isinstance(error, dict) else str(error))
+
+        # zhipu 在最后一个数据块顶层返回 usage，moonshot 放在 choices[0] 中
+        if "usage" in data or "usage" in choice:
+            usage = data.get("usage") or choice.get("usage")
+            if usage:
+                self.usage.update(usage)
+        return text
+
+
+def get_stream_decoder(api_name: str) -> StreamDecoder:
+    """根据API名称返回对应的流式解码器"""
+    if api_name == "claude":
+        return ClaudeStreamDecoder()
+    return OpenAIStreamDecoder()
+
+
+def decode_stream(decoder: StreamDecoder, chunks: Iterable[bytes]) -> Iterator[str]:
+    """把原始字节块解码为文本增量
+
+    收到结束标记后继续读完剩余数据，使连接能归还连接池复用
+    """
+    frames = decoder.sse.frames
+    decode = decoder.decode_frames
+    for chunk in chunks:
+        if decoder.done:
+            continue
+        batch = frames(chunk)
+        if batch:
+            texts = decode(batch)
+            if texts:
+                yield from texts
+    if not decoder.done:
+        yield from decoder.flush()
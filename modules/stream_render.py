@@ -0,0 +1,67 @@
+"""
+流式输出渲染模块
+把逐块到达的生成内容合并后再刷新到页面：距上次刷新超过 interval 秒或累积了 min_chars 个新字符时
+才重新渲染，避免每个token都重绘整篇文档并向浏览器推送一条消息
+"""
+
+import time
+from typing import Iterable, List
+
+
+class StreamRenderer:
+    """节流渲染器，按时间或字数预算刷新占位符"""
+
+    def __init__(self, placeholder, interval: float = 0.1, min_chars: int = 200, **markdown_kwargs):
+        self.placeholder = placeholder
+        self.interval = interval
+        self.min_chars = min_chars
+        self.markdown_kwargs = markdown_kwargs
+        self._parts: List[str] = []
+        self._pending = 0  # 上次刷新后新增的字符数
+        self._last_render = time.monotonic()
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def append(self, chunk: str):
+        """追加一块内容，达到预算时刷新"""
+        if not chunk:
+            return
+        self._parts.append(chunk)
+        self._pending += len(chunk)
+        if self._pending >= self.min_chars or time.monotonic() - self._last_render >= self.interval:
+            self.flush()
+
+    def flush(self):
+        """把尚未显示的内容刷新到页面"""
+        if not self._pending:
+            return
+        text = self.text
+        # 合并已有片段，下次拼接时不再重复遍历
+        self._parts = [text]
+        self.placeholder.markdown(text, **self.markdown_kwargs)
+        self._pending = 0
+        self._last_render = time.monotonic()
+
+
+def render_stream(placeholder, chunks: Iterable[str], interval: float = 0.1, min_chars: int = 200,
+                  **markdown_kwargs) -> str:
+    """消费流式内容并节流渲染到占位符，返回完整内容
+
+    生成中途出错时先显示已收到的内容再抛出异常
+
+    Args:
+        placeholder: st.empty() 等支持 markdown() 的占位符
+        chunks: 内容块迭代器，通常是 generate_content_stream 的返回值
+        interval: 两次刷新的最小间隔（秒）
+        min_chars: 累积到该字数时立即刷新
+        markdown_kwargs: 透传给 placeholder.markdown，如 unsafe_allow_html=True
+    """
+    renderer = StreamRenderer(placeholder, interval, min_chars, **markdown_kwargs)
+    try:
+        for chunk in chunks:
+            renderer.append(chunk)
+    finally:
+        renderer.flush()
+    return renderer.text
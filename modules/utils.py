@@ -1,31 +1,28 @@
 import os
 import json
-from pathlib import Path
 from datetime import datetime
+from typing import Optional
 import streamlit as st
 import sqlite3
-from bill.bill import BillManager
-from user.user_process import UserManager
-from user.logger import add_log, display_logs
-import traceback
+from user.logger import add_log, display_logs, is_enabled
+from db.pool import get_pool
+from modules.config_registry import get_config, get_prompts, get_templates
+from modules.resources import get_bill_manager, get_billing_queue, get_user_cache
+from user.user_history import insert_history
+from db.history_codec import decode_content
 
 def load_config():
-    """Load configuration from config.json"""
-    config_path = Path("config/config.json")
-    with open(config_path, 'r', encoding='utf-8') as file:
-        return json.load(file)
+    """Load configuration from config.json（进程内缓存，文件修改后自动重新加载，返回只读视图）"""
+    return get_config()
 
 def load_templates():
     """Load UI templates"""
-    template_path = Path("config/templates.json")
-    with open(template_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    return get_templates()
 
 def load_prompts():
     """Load prompts from prompt.json"""
     try:
-        with open('config/prompt.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return get_prompts()
     except FileNotFoundError:
         st.error("未找到 prompt.json 配置文件")
         return {}
@@ -39,16 +36,9 @@ def load_prompts():
 def load_history():
     """从数据库加载历史记录"""
     try:
-        print("\n=== 开始加载历史记录 ===")
-        
-        conn = sqlite3.connect('db/users.db')
+        conn = get_pool().connection()
         cursor = conn.cursor()
         
-        # 检查表结构
-        cursor.execute("PRAGMA table_info(history)")
-        columns = [column[1] for column in cursor.fetchall()]
-        print(f"当前表结构: {columns}")
-        
         try:
             # 获取当前用户的历史记录
             cursor.execute('''
@@ -59,13 +49,12 @@ def load_history():
             ''', (st.session_state.user,))
             
             records = cursor.fetchall()
-            print(f"\n=== 查询到 {len(records)} 条历史记录 ===")
             
             formatted_records = []
             for record in records:
                 try:
                     # 解析content字段
-                    content = json.loads(record[3]) if record[3] else {}
+                    content = json.loads(decode_content(record[3])) if record[3] else {}
                     
                     # 构建历史记录项
                     history_item = {
@@ -80,43 +69,27 @@ def load_history():
                     formatted_records.append(history_item)
                     
                 except json.JSONDecodeError as e:
-                    print(f"解析记录内容失败: {str(e)}")
-                    print(f"问题记录: {record}")
+                    add_log("error", f"解析历史记录内容失败（{record[1]} {record[2]}）: {str(e)}")
                     continue
                     
                 except Exception as e:
-                    print(f"处理记录时发生错误: {str(e)}")
-                    print(f"问题记录: {record}")
+                    add_log("error", f"处理历史记录时发生错误（{record[1]} {record[2]}）: {str(e)}")
                     continue
             
-            print("\n=== 历史记录加载成功 ===")
-            print(f"格式化后的记录: {json.dumps(formatted_records, ensure_ascii=False, indent=2)}")
-            
+            add_log("debug", f"加载历史记录 {len(formatted_records)} 条")
             return formatted_records
             
         except sqlite3.Error as e:
-            error_msg = (
-                f"\n=== 数据库查询错误 ===\n"
-                f"错误信息: {str(e)}\n"
-                f"错误位置: {traceback.format_exc()}"
-            )
-            print(error_msg)
+            add_log("error", f"查询历史记录失败: {str(e)}", include_trace=True)
             return []
             
     except Exception as e:
-        error_msg = (
-            f"\n=== 加载历史记录失败 ===\n"
-            f"错误类型: {type(e).__name__}\n"
-            f"错误信息: {str(e)}\n"
-            f"错误位置: {traceback.format_exc()}"
-        )
-        print(error_msg)
+        add_log("error", f"加载历史记录失败: {type(e).__name__}: {str(e)}", include_trace=True)
         return []
         
     finally:
         if 'conn' in locals():
             conn.close()
-            print("\n=== 数据库连接已关闭 ===")
 
 def save_history(*args, **kwargs):
     """保存历史记录到数据库
@@ -127,10 +100,6 @@ def save_history(*args, **kwargs):
     4. save_history(content=content) - 只传入content的方式
     """
     try:
-        print("\n=== 开始保存历史记录 ===")
-        print(f"接收到的参数: {args}")
-        print(f"接收到的关键字参数: {json.dumps(kwargs, ensure_ascii=False, indent=2)}")
-        
         # 验证和准备数据
         try:
             # 处理只传入content的情况
@@ -182,112 +151,102 @@ def save_history(*args, **kwargs):
             # 验证必要字段
             for field in ['user_id', 'timestamp', 'type', 'content']:
                 if not final_data.get(field):
-                    error_msg = f"缺少必要字段: {field}"
-                    print(error_msg)
-                    raise ValueError(error_msg)
-                    
-            print("\n=== 最终数据 ===")
-            print(json.dumps(final_data, ensure_ascii=False, indent=2))
+                    raise ValueError(f"缺少必要字段: {field}")
+            
+            # 完整内容只在 debug 级别输出
+            if is_enabled('debug'):
+                add_log("debug", f"保存历史记录: {json.dumps(final_data, ensure_ascii=False)}")
             
         except Exception as e:
-            error_msg = (
-                f"\n=== 数据准备失败 ===\n"
-                f"错误类型: {type(e).__name__}\n"
-                f"错误信息: {str(e)}\n"
-                f"原始参数: {args}\n"
-                f"关键字参数: {json.dumps(kwargs, ensure_ascii=False)}"
-            )
-            print(error_msg)
+            add_log("error", f"历史记录数据准备失败: {type(e).__name__}: {str(e)}")
             raise
         
-        # 连接数据库
-        conn = sqlite3.connect('db/users.db')
-        cursor = conn.cursor()
+        # 从连接池借出连接
+        conn = get_pool().connection()
         
-        try:
-            # 插入数据
-            cursor.execute('''
-                INSERT INTO history 
-                (user_id, timestamp, type, content)
-                VALUES (?, ?, ?, ?)
-            ''', (
-                final_data['user_id'],
-                final_data['timestamp'],
-                final_data['type'],
-                final_data['content']
-            ))
-            
-            # 提交事务
-            conn.commit()
-            print("\n=== 历史记录保存成功 ===")
-            return True
-            
-        except sqlite3.Error as e:
-            error_msg = (
-                f"\n=== 数据库错误 ===\n"
-                f"错误信息: {str(e)}\n"
-                f"最终数据: {json.dumps(final_data, ensure_ascii=False)}"
-            )
-            print(error_msg)
-            raise
+        # 插入数据
+        insert_history(
+            conn,
+            final_data['user_id'],
+            final_data['timestamp'],
+            final_data['type'],
+            final_data['content']
+        )
+        
+        # 提交事务
+        conn.commit()
+        add_log("info", f"历史记录已保存（{final_data['type']}，{len(final_data['content'])} 字符）")
+        return True
             
     except Exception as e:
-        error_msg = (
-            f"\n=== 保存历史记录失败 ===\n"
-            f"错误类型: {type(e).__name__}\n"
-            f"错误信息: {str(e)}\n"
-            f"错误位置: {traceback.format_exc()}\n"
-            f"原始参数: {args}\n"
-            f"关键字参数: {json.dumps(kwargs, ensure_ascii=False)}"
-        )
-        print(error_msg)
+        add_log("error", f"保存历史记录失败: {type(e).__name__}: {str(e)}", include_trace=True)
         st.error(f"保存历史记录失败: {str(e)}")
         return False
         
     finally:
         if 'conn' in locals():
             conn.close()
-            print("\n=== 数据库连接已关闭 ===")
 
-def add_letters_record(input_letters: int, output_letters: int, api_name: str, operation: str) -> bool:
-    """Add a new letters record"""
+def reserve_points(input_letters: int, max_tokens: Optional[int] = None, share: int = 1) -> Optional[str]:
+    """生成开始前预授权积分，返回预授权ID；积分不足时提示并返回 None
+
+    Args:
+        max_tokens: 本次请求的最大输出token数，用于估算预授权金额
+        share: 同时进行、共用余额的生成数
+    """
     try:
-        # 获取当前用户ID
-        user_mgr = UserManager()
-        user_info = user_mgr.get_user_info(st.session_state.user)
-        if not user_info:
-            return False
-        
-        # 检查用户是否达到每日限制
-        if not user_mgr.check_daily_limit(st.session_state.user):
-            st.error("已达到每日字符用限制")
-            return False
-        
-        # 检查积分是否足够
-        points_needed = input_letters + output_letters
-        bill_mgr = BillManager()
-        current_points = bill_mgr.get_user_points(user_info['user_id'])
-        
-        if current_points < points_needed:
-            st.error(f"积分不足，需要 {points_needed} 积分，当前剩余 {current_points} 积分")
-            return False
-        
-        # 添加账单记录
-        success = bill_mgr.add_bill_record(
-            user_id=user_info['user_id'],
-            api_name=api_name,
-            operation=operation,
-            input_letters=input_letters,
-            output_letters=output_letters
+        result = get_billing_queue().reserve(
+            st.session_state.user, input_letters, max_tokens=max_tokens, share=share
         )
+        if not result.accepted:
+            st.error(result.message)
+            return None
+        return result.hold_id
+    except Exception as e:
+        st.error(f"预授权积分时出错: {str(e)}")
+        return None
+
+def release_points(hold_id: str) -> bool:
+    """释放未结算的预授权"""
+    try:
+        return get_billing_queue().release(hold_id)
+    except Exception as e:
+        add_log("error", f"释放预授权失败: {str(e)}")
+        return False
+
+def add_letters_record(input_letters: int, output_letters: int, api_name: str, operation: str,
+                       hold_id: Optional[str] = None) -> bool:
+    """Add a new letters record
+
+    检查余额和每日限额后把用量提交到计费队列，由写线程批量落库；
+    传入 hold_id 时结算对应的预授权
+    """
+    try:
+        billing_queue = get_billing_queue()
+        if hold_id:
+            result = billing_queue.settle(
+                hold_id=hold_id,
+                api_name=api_name,
+                operation=operation,
+                input_letters=input_letters,
+                output_letters=output_letters
+            )
+        else:
+            result = billing_queue.submit(
+                username=st.session_state.user,
+                api_name=api_name,
+                operation=operation,
+                input_letters=input_letters,
+                output_letters=output_letters
+            )
         
-        if not success:
-            st.error("记录使用量失败")
+        if not result.accepted:
+            st.error(result.message)
             return False
         
-        # 在侧边栏更新积分显示
+        # 在侧边栏更新积分显示（包含尚未落库的消费）
         if 'sidebar_points' in st.session_state:
-            st.session_state.sidebar_points = bill_mgr.get_user_points(user_info['user_id'])
+            st.session_state.sidebar_points = result.balance
         
         return True
             
@@ -297,14 +256,15 @@ def add_letters_record(input_letters: int, output_letters: int, api_name: str, o
 
 def load_letters():
     """从数据库加载账单数据"""
-    bill_mgr = BillManager()
-    return bill_mgr.get_all_bills()
+    return get_bill_manager().get_all_bills()
 
 def update_sidebar_points():
-    """更新侧边栏积分显示"""
+    """更新侧边栏积分显示（读取用户信息缓存，积分变化时由计费层使缓存失效）"""
     if 'user' in st.session_state and st.session_state.user:
-        user_mgr = UserManager()
-        bill_mgr = BillManager()
-        user_info = user_mgr.get_user_info(st.session_state.user)
+        user_info = get_user_cache().get_user_info(st.session_state.user)
         if user_info:
-            st.session_state.sidebar_points = bill_mgr.get_user_points(user_info['user_id'])
+            # 扣除计费队列中尚未落库的消费
+            st.session_state.sidebar_points = (
+                user_info['points']
+                - get_billing_queue().pending_points(user_info['user_id'])
+            )
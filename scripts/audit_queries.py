@@ -0,0 +1,214 @@
+"""SQL查询计划审计
+
+收集 bill/、user/、db/ 下所有Python文件中的SQL语句（字符串常量），在与线上结构相同的临时数据库上
+执行 EXPLAIN QUERY PLAN，带 WHERE 条件的查询如果退化为全表扫描（SCAN 表名，未使用索引）则审计失败。
+没有 WHERE 条件的统计、导出类语句本来就要读全表，只列出不计为失败；
+需要排序时使用了临时B树（USE TEMP B-TREE）的语句作为警告列出。
+executescript 等一个字符串中的多条语句拆开分别审计；"+" 拼接和 f-string 中引用模块级字符串常量的部分
+代入常量后审计，其余动态拼接（表名、列名来自变量）的语句无法静态审计，单独列为"跳过"，不计为失败。
+
+用法: python scripts/audit_queries.py [--db db/users.db] [--verbose]
+以数据库当前的表结构为基础，并执行 db/migrations.py 中尚未应用的迁移
+"""
+import argparse
+import ast
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from db.migrations import migrate  # noqa: E402
+from db.pool import close_pools, get_pool  # noqa: E402
+
+SCAN_DIRS = ("bill", "user", "db")
+# 关键字之后必须还有内容，单独的 'delete'、'UPDATE' 等字符串不是SQL语句
+SQL_START = re.compile(r"^\s*(SELECT|UPDATE|DELETE|WITH|INSERT\s+INTO\s+\w+\s*(\([^)]*\))?\s*SELECT)\s+\S", re.I | re.S)
+
+# 允许全表扫描的表 -> 原因
+ALLOW_FULL_SCAN = {
+    "sqlite_master": "系统表，只有几十行",
+}
+
+# 允许全表扫描的文件 -> 原因
+ALLOW_FULL_SCAN_FILES = {
+    "db/migrations.py": "一次性的结构迁移和数据回填",
+}
+
+
+def _module_constants(tree: ast.Module) -> Dict[str, str]:
+    """模块级的字符串常量 名称 -> 值，用于代入 f-string 和 "+" 拼接"""
+    constants = {}
+    for node in tree.body:
+        if (isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name)
+                and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str)):
+            constants[node.targets[0].id] = node.value.value
+    return constants
+
+
+def _resolve(node: ast.AST, constants: Dict[str, str]) -> Optional[str]:
+    """把常量、模块级常量、f-string 和 "+" 拼接还原为完整的字符串，含有运行时才确定的部分时返回 None"""
+    if isinstance(node, ast.Constant):
+        return node.value if isinstance(node.value, str) else None
+    if isinstance(node, ast.Name):
+        return constants.get(node.id)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        left, right = _resolve(node.left, constants), _resolve(node.right, constants)
+        return None if left is None or right is None else left + right
+    if isinstance(node, ast.JoinedStr):
+        parts = []
+        for value in node.values:
+            if isinstance(value, ast.FormattedValue):
+                if value.conversion != -1 or value.format_spec is not None:
+                    return None
+                value = value.value
+            part = _resolve(value, constants)
+            if part is None:
+                return None
+            parts.append(part)
+        return "".join(parts)
+    return None
+
+
+def _leading_text(node: ast.AST) -> str:
+    """动态拼接的字符串开头的常量部分，用于判断是否为SQL语句"""
+    while isinstance(node, ast.BinOp):
+        node = node.left
+    if isinstance(node, ast.JoinedStr):
+        node = node.values[0] if node.values else None
+    return node.value if isinstance(node, ast.Constant) and isinstance(node.value, str) else ""
+
+
+def split_statements(script: str) -> List[str]:
+    """把 executescript 的脚本按分号拆成单条语句，字符串和触发器体中的分号不拆开"""
+    statements, current = [], ""
+    for part in script.split(";"):
+        current += part + ";"
+        if sqlite3.complete_statement(current):
+            if current.strip(" \t\r\n;"):
+                statements.append(current.strip()[:-1])
+            current = ""
+    if current.strip(" \t\r\n;"):
+        statements.append(current.strip()[:-1])
+    return statements
+
+
+def collect_statements():
+    """返回 ([(相对路径, 行号, SQL)], [(相对路径, 行号, 原因)])，后者为无法静态审计的动态拼接语句"""
+    statements, skipped = [], []
+    for directory in SCAN_DIRS:
+        for path in sorted((ROOT_DIR / directory).rglob("*.py")):
+            relative = str(path.relative_to(ROOT_DIR))
+            tree = ast.parse(path.read_text(encoding="utf-8"), filename=str(path))
+            constants = _module_constants(tree)
+            # f-string 和 "+" 拼接的组成部分随整个表达式一起处理，不单独收集
+            fragments = set()
+            for node in ast.walk(tree):
+                if isinstance(node, ast.JoinedStr):
+                    fragments.update(id(child) for child in ast.walk(node) if child is not node)
+                elif isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+                    fragments.update(id(child) for child in (node.left, node.right))
+            for node in ast.walk(tree):
+                if id(node) in fragments or not isinstance(node, (ast.Constant, ast.JoinedStr, ast.BinOp)):
+                    continue
+                text = _resolve(node, constants)
+                if text is None:
+                    if SQL_START.match(_leading_text(node)):
+                        skipped.append((relative, node.lineno, "动态拼接，表名或条件在运行时确定"))
+                    continue
+                for sql in split_statements(text):
+                    if SQL_START.match(sql):
+                        statements.append((relative, node.lineno, sql))
+    return statements, skipped
+
+
+def build_schema(source: str, target: str):
+    """把源数据库的表和索引结构复制到临时数据库，再补齐未应用的迁移"""
+    src = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+    dst = sqlite3.connect(target)
+    try:
+        for (sql,) in src.execute("SELECT sql FROM sqlite_master WHERE sql IS NOT NULL "
+                                  "AND name NOT LIKE 'sqlite_%' ORDER BY type = 'index'"):
+            dst.execute(sql)
+        dst.execute(f"PRAGMA user_version = {src.execute('PRAGMA user_version').fetchone()[0]}")
+        dst.commit()
+    finally:
+        src.close()
+        dst.close()
+    result = migrate(target)
+    if not result['success']:
+        raise RuntimeError(result['message'])
+
+
+def explain(conn: sqlite3.Connection, sql: str):
+    # 参数值不影响查询计划，全部绑定为 NULL
+    params = [None] * sql.count("?")
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def is_full_scan(detail: str) -> bool:
+    """SCAN 表名（不带 USING INDEX）表示逐行读取整张表"""
+    return detail.startswith("SCAN ") and "USING" not in detail and "CONSTANT ROW" not in detail
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQL查询计划审计")
+    parser.add_argument("--db", default=str(ROOT_DIR / "db" / "users.db"), help="提供表结构的数据库")
+    parser.add_argument("--verbose", action="store_true", help="输出每条语句的查询计划")
+    args = parser.parse_args()
+
+    failures, warnings, scans, errors, unparsed = [], [], [], [], []
+    with tempfile.TemporaryDirectory() as tmp:
+        schema_db = os.path.join(tmp, "schema.db")
+        build_schema(args.db, schema_db)
+        # 连接池中的连接注册了视图和触发器用到的 history_content()
+        conn = get_pool(schema_db).connection()
+        try:
+            statements, skipped = collect_statements()
+            for path, lineno, sql in statements:
+                where = f"{path}:{lineno}"
+                try:
+                    plan = explain(conn, sql)
+                except sqlite3.Error as e:
+                    if str(e).startswith(("no such table", "no such column")):
+                        # 引用了已废弃或临时表的语句
+                        errors.append(f"{where}  {e}")
+                    else:
+                        # str.format 占位符等语法不完整的语句
+                        unparsed.append(f"{where}  {e}")
+                    continue
+                if args.verbose:
+                    print(f"{where}\n    " + "\n    ".join(plan))
+
+                full_scans = [d for d in plan if is_full_scan(d)]
+                allowed = [d for d in full_scans if d.split()[1] in ALLOW_FULL_SCAN]
+                if path in ALLOW_FULL_SCAN_FILES:
+                    allowed = full_scans
+                if len(full_scans) > len(allowed) and re.search(r"\bWHERE\b", sql, re.I):
+                    failures.append(f"{where}  {'; '.join(full_scans)}")
+                elif full_scans:
+                    scans.append(f"{where}  {'; '.join(full_scans)}")
+                if any(d.startswith("USE TEMP B-TREE") for d in plan):
+                    warnings.append(f"{where}  {'; '.join(d for d in plan if d.startswith('USE TEMP B-TREE'))}")
+        finally:
+            conn.close()
+            close_pools()
+
+    print(f"共审计 {len(statements)} 条语句，跳过 {len(skipped) + len(unparsed)} 条")
+    skipped = [f"{path}:{lineno}  {reason}" for path, lineno, reason in skipped] + unparsed
+    for title, items in (("跳过（无法静态分析）", skipped), ("表或列不存在", errors), ("全表读取（无过滤条件或已允许）", scans),
+                         ("排序使用临时B树", warnings), ("全表扫描（失败）", failures)):
+        if items:
+            print(f"\n{title}: {len(items)}")
+            for item in items:
+                print(f"  {item}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
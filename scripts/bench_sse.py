@@ -0,0 +1,131 @@
+"""SSE解码微基准
+
+用 scripts/fixtures/sse 下的流式响应样本，按随机大小切块（会切断多字节中文字符）
+模拟网络到达的数据，对比旧的逐行解析和 modules/sse.py 的增量解码器的耗时，并校验输出一致。
+增量解码器比旧的逐行解析多做了用量记录、错误事件和多行 data 的处理：每次读取包含多个事件时略快，
+64 字节这样的小块读取时每块的调用开销占主导，约为旧解析的 0.85-0.9 倍，结果仅供对比，不代表整体提速
+
+用法: python scripts/bench_sse.py [--rounds 50] [--max-chunk 64 512 4096]
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from modules.sse import decode_stream, get_stream_decoder  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures" / "sse"
+
+
+def split_chunks(payload: bytes, max_chunk: int, seed: int = 0):
+    """把字节流切成随机大小的块"""
+    rng = random.Random(seed)
+    chunks = []
+    i = 0
+    while i < len(payload):
+        size = rng.randint(1, max_chunk)
+        chunks.append(payload[i:i + size])
+        i += size
+    return chunks
+
+
+def _iter_content(chunks):
+    """与 requests 的 Response.iter_content 一样在原始数据块外包一层生成器"""
+    for chunk in chunks:
+        yield chunk
+
+
+def _iter_lines(chunks):
+    """requests 的 Response.iter_lines 的逐行拼接算法"""
+    pending = None
+    for chunk in _iter_content(chunks):
+        if pending is not None:
+            chunk = pending + chunk
+        lines = chunk.splitlines()
+        if lines and lines[-1] and chunk and lines[-1][-1] == chunk[-1]:
+            pending = lines.pop()
+        else:
+            pending = None
+        yield from lines
+    if pending is not None:
+        yield pending
+
+
+def _parse_sse_line(api_name: str, line: str):
+    """旧实现的逐行解析"""
+    if not line.startswith('data: '):
+        return None
+    if line == 'data: [DONE]':
+        return _DONE
+    try:
+        json_data = json.loads(line[6:])
+        if api_name == "claude":
+            return json_data.get('delta', {}).get('text', '') or json_data.get('content', '') or None
+        return json_data['choices'][0]['delta'].get('content', '') or None
+    except json.JSONDecodeError:
+        return None
+
+
+_DONE = object()
+
+
+def legacy_decode(api_name: str, chunks):
+    """旧实现：iter_lines 逐行拼接，每行 decode 后 json.loads"""
+    done = False
+    for line in _iter_lines(chunks):
+        if done or not line:
+            continue
+        chunk = _parse_sse_line(api_name, line.decode('utf-8'))
+        if chunk is _DONE:
+            done = True
+        elif chunk:
+            yield chunk
+
+
+def new_decode(api_name: str, chunks):
+    return decode_stream(get_stream_decoder(api_name), chunks)
+
+
+def bench(func, api_name: str, chunks, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for _ in func(api_name, chunks):
+            pass
+    return (time.perf_counter() - started) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE解码微基准")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--max-chunk", type=int, nargs="+", default=[64, 512, 4096],
+                        help="每次网络读取的最大字节数，负载高时单次读取往往包含多个事件")
+    args = parser.parse_args()
+
+    print(f"{'provider':<10}{'chunk':>7}{'events':>8}{'legacy(ms)':>12}{'new(ms)':>10}{'new(MB/s)':>11}{'speedup':>9}")
+    for path in sorted(FIXTURES_DIR.glob("*.sse")):
+        api_name = path.stem
+        payload = path.read_bytes()
+        events = payload.count(b"\n\n")
+        expected = "".join(new_decode(api_name, [payload]))
+
+        for max_chunk in args.max_chunk:
+            chunks = split_chunks(payload, max_chunk)
+
+            # 校验：增量解码器在任意切块下都应还原出完整文本，用量也应被记录
+            decoder = get_stream_decoder(api_name)
+            actual = "".join(decode_stream(decoder, chunks))
+            assert actual == expected, f"{api_name}: 切块后的解码结果不一致"
+            assert decoder.usage, f"{api_name}: 未解析到用量"
+
+            legacy = bench(legacy_decode, api_name, chunks, args.rounds)
+            new = bench(new_decode, api_name, chunks, args.rounds)
+            print(f"{api_name:<10}{max_chunk:>7}{events:>8}{legacy * 1000:>12.2f}{new * 1000:>10.2f}"
+                  f"{len(payload) / new / 1e6:>11.1f}{legacy / new:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""启动导入耗时检查
+
+在子进程中用 python -X importtime 导入 app（与 streamlit run app.py 启动时导入的模块相同），
+再单独导入框架（streamlit）作为对照，两者中位数之差即应用自身的导入耗时。
+应用自身的耗时与 scripts/importtime_baseline.json 中记录的基线比较，超过 基线 ×（1 + 容差）时失败；
+同时检查 HEAVY_MODULES 中的重量级依赖没有在启动时被导入（应通过 modules/lazy.py 在首次使用时加载），
+框架自己导入的模块（如 streamlit 导入的 plotly）应用无法推迟，不计为失败。
+
+用法: python scripts/importtime_budget.py [--runs 5] [--module app] [--framework streamlit] [--top 15] [--update]
+--update 用本次测量结果更新基线（依赖版本或机器变化后执行）
+"""
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+from importlib import metadata
+from pathlib import Path
+from typing import Dict, List, Set, Tuple
+
+ROOT_DIR = Path(__file__).parent.parent
+BASELINE_PATH = Path(__file__).parent / "importtime_baseline.json"
+
+# 启动时不应导入的重量级依赖（顶层包名）
+HEAVY_MODULES = ("pandas", "numpy", "plotly", "reportlab", "fpdf", "docx", "boto3", "flask")
+DEFAULT_TOLERANCE = 0.2
+
+# import time:       self [us] |  cumulative | imported package
+LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)")
+
+
+def measure(module: str) -> Tuple[float, Dict[str, int], Set[str]]:
+    """导入一次 module，返回 (总耗时毫秒, 模块 -> 累计耗时微秒, 导入的模块集合)"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{proc.stderr[-2000:]}")
+
+    total_us = 0
+    cumulative: Dict[str, int] = {}
+    imported: Set[str] = set()
+    for line in proc.stderr.splitlines():
+        match = LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, name = match.groups()
+        total_us += int(self_us)
+        cumulative[name] = int(cumulative_us)
+        imported.add(name)
+    return total_us / 1000, cumulative, imported
+
+
+def heavy_imports(imported: Set[str], framework: Set[str]) -> List[str]:
+    """应用导入、但框架本身没有导入的重量级模块"""
+    return sorted(name for name in imported - framework if name.split(".")[0] in HEAVY_MODULES)
+
+
+def _version(package: str) -> str:
+    try:
+        return metadata.version(package)
+    except metadata.PackageNotFoundError:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动导入耗时检查")
+    parser.add_argument("--module", default="app", help="要导入的模块")
+    parser.add_argument("--framework", default="streamlit", help="作为对照的框架模块，其导入耗时和模块不计入应用")
+    parser.add_argument("--runs", type=int, default=5, help="测量次数，取中位数")
+    parser.add_argument("--top", type=int, default=15, help="列出累计耗时最高的模块数")
+    parser.add_argument("--update", action="store_true", help="用本次结果更新基线")
+    args = parser.parse_args()
+
+    # 第一次运行会生成 .pyc，不计入结果
+    measure(args.module)
+    runs = [measure(args.module) for _ in range(args.runs)]
+    framework_runs = [measure(args.framework) for _ in range(args.runs)]
+    total_ms = statistics.median(total for total, _, _ in runs)
+    framework_ms = statistics.median(total for total, _, _ in framework_runs)
+    median_ms = max(0.0, total_ms - framework_ms)
+    _, cumulative, imported = runs[-1]
+    framework_imported = set().union(*(names for _, _, names in framework_runs))
+
+    print(f"导入 {args.module}: 中位数 {total_ms:.1f} ms（{args.runs} 次: "
+          f"{', '.join(f'{total:.1f}' for total, _, _ in runs)}），共 {len(imported)} 个模块")
+    print(f"导入 {args.framework}: 中位数 {framework_ms:.1f} ms，共 {len(framework_imported)} 个模块")
+    print(f"应用自身: {median_ms:.1f} ms，{len(imported - framework_imported)} 个模块")
+    print(f"\n累计耗时最高的 {args.top} 个模块:")
+    for name, us in sorted(cumulative.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {us / 1000:>8.1f} ms  {name}")
+
+    failed = False
+    heavy = heavy_imports(imported, framework_imported)
+    if heavy:
+        failed = True
+        roots = sorted({name.split(".")[0] for name in heavy})
+        print(f"\n启动时导入了重量级依赖（失败）: {', '.join(roots)}")
+        print("  请在模块顶层改用 modules.lazy.lazy_import，或移到使用它的函数中导入")
+
+    baseline = json.loads(BASELINE_PATH.read_text(encoding="utf-8")) if BASELINE_PATH.exists() else None
+    if args.update:
+        baseline = {
+            "module": args.module,
+            "framework": args.framework,
+            "baseline_ms": round(median_ms, 1),  # 应用自身的导入耗时，不含框架
+            "framework_ms": round(framework_ms, 1),
+            "tolerance": (baseline or {}).get("tolerance", DEFAULT_TOLERANCE),
+            "python": sys.version.split()[0],
+            "framework_version": _version(args.framework)
+        }
+        BASELINE_PATH.write_text(json.dumps(baseline, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"\n已更新基线: {baseline['baseline_ms']} ms")
+    elif baseline is None:
+        print(f"\n未找到基线 {BASELINE_PATH.name}，请在部署环境中运行 --update 记录基线")
+    else:
+        budget = baseline["baseline_ms"] * (1 + baseline["tolerance"])
+        status = "失败" if median_ms > budget else "通过"
+        print(f"\n基线 {baseline['baseline_ms']} ms，预算 {budget:.1f} ms（容差 {baseline['tolerance']:.0%}）: {status}")
+        failed = failed or median_ms > budget
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
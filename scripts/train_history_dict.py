@@ -0,0 +1,87 @@
+"""训练历史记录压缩用的 zlib 预置字典
+
+从样本中统计在多条记录里重复出现的片段（按换行和标点切分，包括JSON转义后的 \\n、\\" 等），
+按 (出现的记录数 - 1) × 字节数 排序，取总价值最高的片段拼成不超过32KB的字典，价值越高越靠后
+（zlib 回溯距离越短编码越省）。
+
+默认样本为 config/prfaqs.json 中的示例生成结果以及 prompt.json 中的模板，不读取用户数据。
+字典一旦用于写入就不能再修改：需要更新时输出为新文件，并在 db/history_codec.py 中登记新的编码字节。
+
+用法: python scripts/train_history_dict.py [--output db/history_v1.zdict] [--db db/users.db]
+"""
+import argparse
+import json
+import re
+import sys
+import zlib
+from collections import Counter
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent
+MAX_DICT_BYTES = 32 * 1024  # zlib 窗口大小，更长的字典前半部分不会被用到
+SEGMENT = re.compile(r'[^\n，。：；！？,.:;!?|]+[\n，。：；！？,.:;!?|]*')
+
+
+def load_samples(db_path=None):
+    """返回按存储格式序列化的样本内容"""
+    samples = []
+    for record in json.loads((ROOT_DIR / "config" / "prfaqs.json").read_text(encoding="utf-8")):
+        samples.append(record["content"])
+        samples.append(json.dumps({"input": "", "output": record["content"]}, ensure_ascii=False))
+    prompts = json.loads((ROOT_DIR / "config" / "prompt.json").read_text(encoding="utf-8"))
+    samples.extend(json.dumps(value, ensure_ascii=False) for value in prompts.values())
+
+    if db_path:
+        import sqlite3
+        sys.path.insert(0, str(ROOT_DIR))
+        from db.history_codec import decode_content
+
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            samples.extend(decode_content(row[0]) for row in conn.execute("SELECT content FROM history"))
+        finally:
+            conn.close()
+    return samples
+
+
+def train(samples):
+    doc_freq = Counter()
+    for sample in samples:
+        doc_freq.update({segment for segment in SEGMENT.findall(sample) if len(segment) >= 4})
+
+    scored = sorted(((count - 1) * len(segment.encode("utf-8")), segment)
+                    for segment, count in doc_freq.items() if count > 1)
+    chosen = []
+    size = 0
+    for score, segment in reversed(scored):
+        data = segment.encode("utf-8")
+        if size + len(data) > MAX_DICT_BYTES:
+            continue
+        chosen.append(data)
+        size += len(data)
+    # 价值高的放在末尾
+    return b"".join(reversed(chosen))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="训练历史记录压缩字典")
+    parser.add_argument("--output", default=str(ROOT_DIR / "db" / "history_v1.zdict"))
+    parser.add_argument("--db", help="额外从该数据库的 history 表采样（会把用户内容写入字典，仅用于本地评估）")
+    args = parser.parse_args()
+
+    samples = load_samples(args.db)
+    zdict = train(samples)
+    Path(args.output).write_bytes(zdict)
+
+    raw = sum(len(s.encode("utf-8")) for s in samples)
+    plain = sum(len(zlib.compress(s.encode("utf-8"), 9)) for s in samples)
+    with_dict = 0
+    for sample in samples:
+        compressor = zlib.compressobj(9, zdict=zdict)
+        with_dict += len(compressor.compress(sample.encode("utf-8")) + compressor.flush())
+    print(f"样本 {len(samples)} 条，原始 {raw} 字节；zlib {plain} 字节（{plain / raw:.1%}）；"
+          f"zlib+字典 {with_dict} 字节（{with_dict / raw:.1%}）；字典 {len(zdict)} 字节 -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
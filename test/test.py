@@ -1,4 +1,5 @@
 """领导力测评主模块"""
+import importlib.util
 import streamlit as st
 from pathlib import Path
 import json
@@ -14,10 +15,8 @@ from test.visualization.lp import LeadershipVisualizer
 
 def check_dependencies():
     """检查必要的依赖是否已安装"""
-    try:
-        import docx
-        return True
-    except ImportError:
+    # 只检查是否已安装，不在这里导入
+    if importlib.util.find_spec('docx') is None:
         st.error("""
         缺少必要的依赖包：python-docx
         
@@ -30,6 +29,7 @@ def check_dependencies():
         """)
         add_log("error", "缺少必要的依赖包：python-docx")
         return False
+    return True
 
 class CareerTest:
     """领导力测评类"""
@@ -1,7 +1,7 @@
-import sqlite3
 from datetime import datetime
 import json
 import os
+from db.pool import get_pool
 
 class DatabaseManager:
     def __init__(self, db_path='database/test_results.db'):
@@ -11,8 +11,8 @@ class DatabaseManager:
         self.init_db()
     
     def get_connection(self):
-        """获取数据库连接"""
-        return sqlite3.connect(self.db_path)
+        """获取数据库连接（连接池中的连接，close() 时归还）"""
+        return get_pool(self.db_path).connection()
     
     def init_db(self):
         """初始化数据库"""
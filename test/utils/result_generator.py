@@ -3,25 +3,17 @@ import json
 from pathlib import Path
 from datetime import datetime
 import traceback
-import numpy as np
 import streamlit as st
-import pandas as pd
-from docx import Document
-from docx.shared import Inches
-from docx.enum.text import WD_ALIGN_PARAGRAPH
 import tempfile
 import io
 from modules.utils import add_log, load_config
 from modules.api import APIClient
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from fpdf import FPDF
+from modules.lazy import lazy_import
 import os
 
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
 def load_data():
     """加载所有必要的数据文件"""
     from modules.utils import add_log
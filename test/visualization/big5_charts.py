@@ -1,7 +1,9 @@
 """大五人格可视化模块"""
-import plotly.graph_objects as go
+from modules.lazy import lazy_import
 from typing import Dict, Any
 
+go = lazy_import('plotly.graph_objects')
+
 class Big5Visualizer:
     """大五人格图表可视化类"""
     
@@ -75,7 +77,7 @@ class Big5Visualizer:
             'background': 'rgb(25, 25, 35)' # 深蓝黑色背景
         }
 
-    def create_dual_bar_chart(self, scores: Dict[str, float]) -> go.Figure:
+    def create_dual_bar_chart(self, scores: Dict[str, float]) -> 'go.Figure':
         """创建双向条形图"""
         # 创建图表
         fig = go.Figure()
@@ -1,7 +1,9 @@
 """霍兰德职业兴趣可视化模块"""
-import plotly.graph_objects as go
+from modules.lazy import lazy_import
 from typing import Dict, List, Any
 
+go = lazy_import('plotly.graph_objects')
+
 class HollandVisualizer:
     """霍兰德代码图表可视化类"""
     
@@ -62,7 +64,7 @@ class HollandVisualizer:
             '质量工程师': {'primary': 'C', 'secondary': 'R', 'tertiary': 'I'}
         }
 
-    def create_career_map(self, holland_scores: Dict[str, float]) -> go.Figure:
+    def create_career_map(self, holland_scores: Dict[str, float]) -> 'go.Figure':
         """创建职业兴趣地图"""
         fig = go.Figure()
         
@@ -1,7 +1,9 @@
 """领导力准则可视化模块"""
-import plotly.graph_objects as go
+from modules.lazy import lazy_import
 from typing import Dict, List, Any, Tuple
 
+go = lazy_import('plotly.graph_objects')
+
 class LeadershipVisualizer:
     """领导力准则图表可视化类"""
     
@@ -14,7 +16,7 @@ class LeadershipVisualizer:
             'polar_bg': 'rgb(45, 45, 60)'      # 圆盘背景色（调整为更深的蓝灰色）
         }
     
-    def create_rose_chart(self, scores_data: List[Tuple[str, float]]) -> go.Figure:
+    def create_rose_chart(self, scores_data: List[Tuple[str, float]]) -> 'go.Figure':
         """创建领导力准则玫瑰图
         
         Args:
@@ -1,7 +1,9 @@
 """MBTI可视化模块"""
-import plotly.graph_objects as go
+from modules.lazy import lazy_import
 from typing import Dict, Any
 
+go = lazy_import('plotly.graph_objects')
+
 class MBTIVisualizer:
     """MBTI图表可视化类"""
     
@@ -38,7 +40,7 @@ class MBTIVisualizer:
             }
         ]
 
-    def create_gauge_chart(self, mbti_scores: Dict[str, float], mbti_metadata: Dict[str, Any]) -> go.Figure:
+    def create_gauge_chart(self, mbti_scores: Dict[str, float], mbti_metadata: Dict[str, Any]) -> 'go.Figure':
         """创建MBTI仪表盘组合图"""
         # 创建子图布局
         fig = go.Figure()
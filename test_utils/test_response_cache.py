@@ -0,0 +1,104 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from modules.api import APIClient
+from modules.response_cache import ResponseCache, get_cache_settings, get_response_cache
+from modules.utils import load_config
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.config = load_config()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(
+            db_path=str(Path(self.tmp_dir.name) / "llm_cache.db"),
+            ttl=3600, max_entries=100, max_bytes=1024 * 1024
+        )
+        self.client = APIClient(self.config)
+        self.responses = iter(["第一次生成", "第二次生成", "第三次生成"])
+        self.api_calls = 0
+
+        def fake_stream(prompt, api_name):
+            self.api_calls += 1
+            yield next(self.responses)
+
+        self.fake_stream = fake_stream
+        patches = [
+            mock.patch("modules.api.get_response_cache", return_value=self.cache),
+            mock.patch.object(self.client, "_stream_with_retry", side_effect=fake_stream),
+            mock.patch.object(self.client, "_record_usage", return_value=True),
+            mock.patch("modules.api.save_history"),
+            mock.patch("modules.api.st")
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.cache._conn.close()
+        self.tmp_dir.cleanup()
+
+    def _generate(self, client, prompt="同一个提示词", use_cache=True):
+        chunks = list(client._generate_with_provider(prompt, "claude", use_cache, force=True))
+        return chunks[0]
+
+    def test_disabled_by_default(self):
+        self.assertFalse(get_cache_settings({})["enabled"])
+        self.assertIsNone(get_response_cache({}))
+
+    def test_regenerate_bypasses_cache(self):
+        self.assertEqual(self._generate(self.client), "第一次生成")
+        # 同一会话再次生成：请求API，不回放缓存
+        self.assertEqual(self._generate(self.client), "第二次生成")
+        self.assertEqual(self.api_calls, 2)
+
+    def test_other_session_hits_refreshed_cache(self):
+        self._generate(self.client)
+        self._generate(self.client)
+        other = APIClient(self.config)
+        with mock.patch.object(other, "_record_usage", return_value=True):
+            self.assertEqual(self._generate(other), "第二次生成")
+        self.assertEqual(self.api_calls, 2)
+
+    def test_use_cache_false_never_reads_cache(self):
+        key = self.client._cache_key("同一个提示词", "claude")
+        self.cache.put(key, "claude", None, "缓存的回复")
+        self.assertEqual(self._generate(self.client, use_cache=False), "第一次生成")
+        self.assertEqual(self.cache.get(key), "缓存的回复")
+
+
+    def test_all_in_one_regenerate_bypasses_cache(self):
+        from modules import all_in_one_generator
+        generator = all_in_one_generator.AllInOneGenerator(self.client, concurrent=True, max_workers=2)
+        sections = [("客户FAQ", "问题", "客户FAQ-问题", "同一个提示词")]
+        patches = [
+            mock.patch.object(generator, "_build_sections", return_value=sections),
+            mock.patch.object(all_in_one_generator, "st"),
+            mock.patch.object(all_in_one_generator, "get_script_run_ctx"),
+            mock.patch.object(all_in_one_generator, "add_script_run_ctx"),
+            mock.patch.object(all_in_one_generator, "render_stream",
+                              side_effect=lambda placeholder, chunks: "".join(chunks)),
+            # 工作线程使用新建的客户端，在类上替换
+            mock.patch.object(APIClient, "_stream_with_retry", side_effect=self.fake_stream),
+            mock.patch.object(APIClient, "_record_usage", return_value=True),
+            mock.patch("modules.api.reserve_points", return_value="hold"),
+            mock.patch("modules.api.release_points")
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        generator._generate_sections_concurrently("核心句")
+        generator._generate_sections_concurrently("核心句")
+        first, second = [content for _, content in generator.all_content]
+        self.assertTrue(first.startswith("第一次生成"))
+        # 一键生成再次生成同一部分时请求API，不回放第一次的缓存
+        self.assertTrue(second.startswith("第二次生成"))
+        self.assertEqual(self.api_calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+from collections.abc import Mapping
 from pathlib import Path
 import json
 from modules.utils import (
@@ -23,17 +24,17 @@ class TestUtils(unittest.TestCase):
 
     def test_load_config(self):
         config = load_config()
-        self.assertIsInstance(config, dict)
+        self.assertIsInstance(config, Mapping)
         self.assertTrue(self.config_path.exists())
 
     def test_load_templates(self):
         templates = load_templates()
-        self.assertIsInstance(templates, dict)
+        self.assertIsInstance(templates, Mapping)
         self.assertTrue(self.templates_path.exists())
 
     def test_load_prompts(self):
         prompts = load_prompts()
-        self.assertIsInstance(prompts, dict)
+        self.assertIsInstance(prompts, Mapping)
         self.assertTrue(self.prompts_path.exists())
 
     def test_load_history(self):
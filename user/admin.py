@@ -1,9 +1,9 @@
 import streamlit as st
 import sqlite3
 from datetime import datetime
-from user.user_process import UserManager
+from modules.resources import get_bill_manager, get_user_manager
 from user.logger import add_log
-from bill.bill import BillManager
+from user.user_cache import invalidate_user
 
 def show_admin_panel():
     """显示管理员面板"""
@@ -13,8 +13,8 @@ def show_admin_panel():
     
     st.title("用户管理面板")
     
-    user_mgr = UserManager()
-    bill_mgr = BillManager()
+    user_mgr = get_user_manager()
+    bill_mgr = get_bill_manager()
     conn = user_mgr.get_db_connection()
     c = conn.cursor()
     
@@ -67,6 +67,7 @@ def show_admin_panel():
                             (new_status, user[0]))
                     conn.commit()
                     conn.close()
+                    invalidate_user(user[0])
                     add_log("info", f"用户 {user[1]} 状态已更新为 {'活跃' if new_status else '禁用'}")
                     st.rerun()
             
@@ -81,6 +82,7 @@ def show_admin_panel():
                             (hashed_password, user[0]))
                     conn.commit()
                     conn.close()
+                    invalidate_user(user[0])
                     add_log("info", f"用户 {user[1]} 密码已重置")
                     st.success(f"密码已重置为: {new_password}")
             
@@ -99,6 +101,7 @@ def show_admin_panel():
                             (new_limit, user[0]))
                     conn.commit()
                     conn.close()
+                    invalidate_user(user[0])
                     add_log("info", f"用户 {user[1]} 每日字符限制已更新为 {new_limit}")
                     st.success("每日字符限制已更新")
                     st.rerun()
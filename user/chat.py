@@ -1,5 +1,6 @@
 import streamlit as st
 from modules.api import APIClient
+from modules.stream_render import render_stream
 from user.logger import add_log
 
 def show_chat_interface(api_client: APIClient):
@@ -31,12 +32,11 @@ def show_chat_interface(api_client: APIClient):
         try:
             # 记录输入字符数
             input_letters = len(user_input)
-            content = ""
             
-            # 流式生成回复
-            for chunk in api_client.generate_content_stream(user_input):
-                content += chunk
-                response_placeholder.markdown(content)
+            # 流式生成回复，按时间和字数合并后刷新显示
+            # 聊天每次发送都需要新的回复，不使用响应缓存
+            content = render_stream(response_placeholder,
+                                    api_client.generate_content_stream(user_input, use_cache=False))
             
             # 记录输出字符数并更新使用量
             output_letters = len(content)
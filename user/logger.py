@@ -1,27 +1,215 @@
-import streamlit as st
+"""
+日志
+所有模块通过 add_log(level, message) 记录日志，每条日志：
+- 放入当前会话的 st.session_state.logs（collections.deque 环形缓冲区，容量固定，超出时自动丢弃最旧的），
+  供管理员的日志面板显示；后台线程（计费队列、定时任务）没有会话，只写文件
+- 交给标准库 logging 的 QueueHandler 入队，由 QueueListener 后台线程格式化为一行 JSON，
+  写入按大小轮转的日志文件，请求线程不做任何 I/O；队列满时丢弃并计数，不阻塞请求
+低于 config.json 中 logging.level（默认 info）的日志在入口处直接丢弃；输出完整数据的调试日志使用 debug 级别，
+拼接代价较大的调试内容先用 is_enabled('debug') 判断
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import traceback
+from collections import deque
 from datetime import datetime
+from typing import Any, Dict, Optional
+
+import streamlit as st
+
+try:
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+except ImportError:  # 旧版本 streamlit
+    get_script_run_ctx = None
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_PATH = os.path.join(ROOT_DIR, 'config', 'config.json')
+
+DEFAULT_LOG_CONFIG = {
+    "level": "info",            # debug / info / warning / error
+    "ui_buffer_size": 100,      # 每个会话日志面板保留的条数
+    "file": "logs/app.jsonl",   # 相对项目根目录，为空时不写文件
+    "max_bytes": 10485760,      # 单个日志文件大小上限，超出后轮转
+    "backup_count": 5,
+    "queue_size": 10000,        # 待写入的日志条数上限，超出时丢弃
+    "console": False            # 同时输出到标准错误（本地调试时使用）
+}
+
+# add_log 使用的级别名称 -> logging 级别（user 为用户操作记录，按 info 处理）
+LEVELS = {
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'user': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR
+}
+
+_logger = logging.getLogger('prfaq')
+_logger.propagate = False
+_listener: Optional[logging.handlers.QueueListener] = None
+_threshold = logging.INFO
+_buffer_size = DEFAULT_LOG_CONFIG["ui_buffer_size"]
+_init_lock = threading.Lock()
+_initialized = False
+
+
+class _JsonFormatter(logging.Formatter):
+    """每条日志格式化为一行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': getattr(record, 'log_level', record.levelname.lower()),
+            'message': record.getMessage(),
+            'user': getattr(record, 'user', None),
+            'thread': record.threadName,
+            'pid': record.process
+        }
+        trace = getattr(record, 'trace', None)
+        if trace:
+            entry['trace'] = trace
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃日志并计数，不阻塞也不向标准错误输出异常"""
+
+    dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _load_settings() -> Dict[str, Any]:
+    settings = dict(DEFAULT_LOG_CONFIG)
+    try:
+        with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
+            settings.update(json.load(f).get('logging', {}))
+    except (OSError, ValueError):
+        pass  # 配置不可用时使用默认值；此时日志系统尚未就绪，无法记录
+    return settings
+
+
+def _init():
+    """第一次记录日志时创建队列和写文件的后台线程"""
+    global _listener, _threshold, _buffer_size, _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        settings = _load_settings()
+        _threshold = LEVELS.get(str(settings["level"]).lower(), logging.INFO)
+        _buffer_size = int(settings["ui_buffer_size"])
+
+        handlers = []
+        if settings["file"]:
+            path = settings["file"]
+            if not os.path.isabs(path):
+                path = os.path.join(ROOT_DIR, path)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                handlers.append(logging.handlers.RotatingFileHandler(
+                    path, maxBytes=int(settings["max_bytes"]),
+                    backupCount=int(settings["backup_count"]),
+                    encoding='utf-8', delay=True
+                ))
+            except OSError as e:
+                print(f"无法创建日志目录，日志不写入文件: {str(e)}")
+        if settings["console"]:
+            handlers.append(logging.StreamHandler())
+        formatter = _JsonFormatter()
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        _logger.setLevel(_threshold)
+        if handlers:
+            log_queue: queue.Queue = queue.Queue(int(settings["queue_size"]))
+            _logger.addHandler(_DroppingQueueHandler(log_queue))
+            _listener = logging.handlers.QueueListener(log_queue, *handlers)
+            _listener.start()
+            atexit.register(shutdown)
+        _initialized = True
+
+
+def shutdown():
+    """写完队列中剩余的日志并停止后台线程（进程退出时自动调用）"""
+    global _listener
+    with _init_lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+def is_enabled(level: str) -> bool:
+    """该级别的日志是否会被记录"""
+    if not _initialized:
+        _init()
+    return LEVELS.get(level, logging.INFO) >= _threshold
+
+
+def _session_logs() -> Optional[deque]:
+    """当前会话的日志缓冲区，不在 Streamlit 脚本线程中时返回 None"""
+    try:
+        if get_script_run_ctx is not None and get_script_run_ctx(suppress_warning=True) is None:
+            return None
+        logs = st.session_state.get('logs')
+        if not isinstance(logs, deque) or logs.maxlen != _buffer_size:
+            logs = deque(logs or (), maxlen=_buffer_size)
+            st.session_state.logs = logs
+        return logs
+    except Exception:
+        return None
+
+
+def add_log(level: str, message: str, include_trace: bool = False):
+    """添加日志
+
+    Args:
+        level: 日志级别（debug、info、user、warning、error）
+        message: 日志内容
+        include_trace: 错误日志是否附带当前正在处理的异常的堆栈
+    """
+    if not is_enabled(level):
+        return
+
+    trace = traceback.format_exc() if include_trace and level == 'error' else None
+    logs = _session_logs()
+    user = None
+    if logs is not None:
+        log_entry = {
+            'timestamp': datetime.now().strftime('%H:%M:%S'),
+            'level': level,
+            'message': message
+        }
+        if trace:
+            log_entry['trace'] = trace
+        logs.append(log_entry)
+        user = st.session_state.get('user')
+
+    if _logger.handlers:
+        _logger.log(LEVELS.get(level, logging.INFO), message,
+                    extra={'log_level': level, 'user': user, 'trace': trace})
+
+
+def clear_logs():
+    """清空当前会话的日志面板"""
+    st.session_state.logs = deque(maxlen=_buffer_size)
 
-def add_log(level: str, message: str):
-    """添加日志"""
-    if 'logs' not in st.session_state:
-        st.session_state.logs = []
-    
-    log_entry = {
-        'timestamp': datetime.now().strftime('%H:%M:%S'),
-        'level': level,
-        'message': message
-    }
-    
-    st.session_state.logs.append(log_entry)
-    
-    # Keep only latest 100 logs
-    if len(st.session_state.logs) > 100:
-        st.session_state.logs = st.session_state.logs[-100:]
 
 def display_logs():
     """显示日志"""
     st.markdown("### 系统日志")
-    for log in st.session_state.logs:
+    for log in st.session_state.get('logs', ()):
         color = "#000000"  # 默认黑色
         if log['level'] == 'info':
             color = "#0000FF"  # 蓝色
@@ -29,6 +217,6 @@ def display_logs():
             color = "#FF0000"  # 红色
         elif log['level'] == 'warning':
             color = "#FFA500"  # 橙色
-        
-        st.markdown(f'<span style="color: {color};">[{log["timestamp"]}] {log["message"]}</span>', 
-                   unsafe_allow_html=True) 
\ No newline at end of file
+
+        st.markdown(f'<span style="color: {color};">[{log["timestamp"]}] {log["message"]}</span>',
+                   unsafe_allow_html=True)
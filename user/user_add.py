@@ -1,6 +1,6 @@
 import streamlit as st
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 from user.user_base import UserManager
 from user.logger import add_log
 from bill.bill_base import BillManager
@@ -82,20 +82,23 @@ class UserRegistration:
             c = conn.cursor()
             
             # 检查今天是否已经领取过奖励
+            # 用时间范围代替 date(timestamp)，查询可以走 (user_id, timestamp) 索引
             today = datetime.now().date()
             c.execute('''
-                SELECT timestamp FROM point_transactions 
-                WHERE user_id = ? AND type = 'daily_login' 
-                AND date(timestamp) = date(?)
-            ''', (user_id, today.isoformat()))
+                SELECT timestamp FROM point_transactions
+                WHERE user_id = ? AND type = 'daily_login'
+                AND timestamp >= ? AND timestamp < ?
+            ''', (user_id, today.isoformat(), (today + timedelta(days=1)).isoformat()))
             
             if not c.fetchone():  # 今天还没有领取奖励
                 # 发放登录奖励
+                # 幂等键保证同一天并发登录也只发放一次
                 success = self.bill_mgr.add_points(
                     user_id=user_id,
                     amount=self.DAILY_LOGIN_POINTS,
                     type='daily_login',
-                    description='每日登录奖励'
+                    description='每日登录奖励',
+                    operation_id=f"daily_login:{user_id}:{today.isoformat()}"
                 )
                 
                 if success:
@@ -1,36 +1,24 @@
 import sqlite3
 import hashlib
-import os
 from datetime import datetime
 from typing import Optional, Dict, Any
 from user.logger import add_log
-from db.db_upgrade import upgrade_database
+from db.migrations import ensure_current
+from db.pool import get_pool
+from user.user_cache import USER_INFO_COLUMNS, invalidate_user, user_info_from_row
 
 class UserManager:
     def __init__(self):
         self.db_path = 'db/users.db'
     
     def get_db_connection(self):
-        """获取数据库连接"""
+        """获取数据库连接（连接池中的连接，close() 时归还）"""
         try:
-            # 使用绝对路径
-            db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'db', 'users.db')
-            conn = sqlite3.connect(db_path)
-            
-            # 检查是否需要升级数据库
-            try:
-                # 尝试访问 points 列，如果不存在会抛出异常
-                c = conn.cursor()
-                c.execute("SELECT points FROM users LIMIT 1")
-            except sqlite3.OperationalError:
-                # 如果 points 列不存在，执行数据库升级
-                conn.close()  # 先关闭当前连接
-                upgrade_database()  # 执行升级
-                conn = sqlite3.connect(db_path)  # 重新连接
-            
-            return conn
+            # 本进程第一次访问时确认数据库版本，之后只检查进程内标记
+            ensure_current()
+            return get_pool().connection()
         except Exception as e:
-            print(f"数据库连接失败: {str(e)}")
+            add_log("error", f"数据库连接失败: {str(e)}")
             raise
     
     def hash_password(self, password: str) -> str:
@@ -56,44 +44,24 @@ class UserManager:
                 if result[2] == 1:  # 检查是否活跃
                     return True
                 else:
-                    print("账户已被禁用")
+                    add_log("warning", f"账户 {username} 已被禁用")
                     return False
             return False
         finally:
             conn.close()
     
     def get_user_info(self, username: str) -> Optional[Dict[str, Any]]:
-        """获取用户信息"""
+        """获取用户信息（直接查询数据库；侧边栏等频繁读取的地方使用 user/user_cache.py 的缓存）"""
         conn = self.get_db_connection()
         c = conn.cursor()
         
         try:
-            c.execute('''
-                SELECT user_id, username, email, phone, org_name, role, is_active,
-                       created_at, last_login, total_chars, total_cost,
-                       daily_chars_limit, used_chars_today, points
-                FROM users WHERE username = ?
-            ''', (username,))
+            c.execute(f'SELECT {USER_INFO_COLUMNS} FROM users WHERE username = ?', (username,))
             
             result = c.fetchone()
             
             if result:
-                return {
-                    'user_id': result[0],
-                    'username': result[1],
-                    'email': result[2],
-                    'phone': result[3],
-                    'org_name': result[4],
-                    'role': result[5],
-                    'is_active': bool(result[6]),
-                    'created_at': result[7],
-                    'last_login': result[8],
-                    'total_chars': result[9],
-                    'total_cost': result[10],
-                    'daily_chars_limit': result[11],
-                    'used_chars_today': result[12],
-                    'points': result[13]
-                }
+                return user_info_from_row(result)
         except sqlite3.Error as e:
             add_log("error", f"获取用户信息失败: {str(e)}")
         finally:
@@ -114,6 +82,7 @@ class UserManager:
             ''', (datetime.now().isoformat(), username))
             
             conn.commit()
+            invalidate_user(username=username)
             add_log("info", f"更新用户 {username} 最后登录时间")
             return True
         except Exception as e:
@@ -138,6 +107,7 @@ class UserManager:
             ''', (chars, cost, chars, username))
             
             conn.commit()
+            invalidate_user(username=username)
             add_log("info", f"更新用户 {username} 使用统计")
             return True
         except Exception as e:
@@ -0,0 +1,152 @@
+"""
+用户信息缓存
+侧边栏每次重新运行都要读取当前用户的信息和积分，这里按用户名缓存 users 表中的一行：
+- TTL 内直接返回缓存，不访问数据库
+- 超过 TTL 后只按主键查询 user_versions 中的版本号，版本未变则继续使用缓存，变化时重新加载
+- 本进程内修改用户或积分后（如计费层提交事务后）调用 invalidate_user() 立即失效（写穿透）
+user_versions 由 users 表上的触发器维护（迁移 v8），其他进程或直接执行 SQL 的修改也会使版本号递增，
+因此多个 Streamlit 进程之间最多在一个 TTL 内看到旧值
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from db.migrations import ensure_current
+from db.pool import get_pool
+from user.logger import add_log
+
+USER_INFO_COLUMNS = """user_id, username, email, phone, org_name, role, is_active,
+       created_at, last_login, total_chars, total_cost,
+       daily_chars_limit, used_chars_today, points"""
+
+
+def user_info_from_row(row) -> Dict[str, Any]:
+    """把按 USER_INFO_COLUMNS 顺序查询的一行转为用户信息字典"""
+    return {
+        'user_id': row[0],
+        'username': row[1],
+        'email': row[2],
+        'phone': row[3],
+        'org_name': row[4],
+        'role': row[5],
+        'is_active': bool(row[6]),
+        'created_at': row[7],
+        'last_login': row[8],
+        'total_chars': row[9],
+        'total_cost': row[10],
+        'daily_chars_limit': row[11],
+        'used_chars_today': row[12],
+        'points': row[13]
+    }
+
+
+DEFAULT_USER_CACHE_CONFIG = {
+    "ttl": 5.0,           # 秒，期间不访问数据库
+    "max_entries": 2048   # 超出时淘汰最久未使用的用户
+}
+
+_LOAD_SQL = (
+    f"SELECT {USER_INFO_COLUMNS}, "
+    "(SELECT version FROM user_versions WHERE user_versions.user_id = users.user_id) "
+    "FROM users WHERE username = ?"
+)
+_VERSION_SQL = "SELECT version FROM user_versions WHERE user_id = ?"
+
+
+class UserCache:
+    """按用户名缓存用户信息，线程安全"""
+
+    def __init__(self, ttl: float = 5.0, max_entries: int = 2048):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # 用户名 -> [用户信息, 版本号, 上次确认的时间]
+        self._entries: 'OrderedDict[str, list]' = OrderedDict()
+        self._usernames: Dict[str, str] = {}  # user_id -> 用户名
+        # 每次失效时递增；加载期间发生过失效的结果不写入缓存，避免把提交前读到的旧值放回去
+        self._generation = 0
+
+    def get_user_info(self, username: str) -> Optional[Dict[str, Any]]:
+        """返回用户信息的副本，用户不存在时返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None:
+                self._entries.move_to_end(username)
+                if now - entry[2] < self.ttl:
+                    return dict(entry[0])
+            generation = self._generation
+
+        try:
+            ensure_current()
+            with get_pool().reader() as conn:
+                if entry is not None:
+                    row = conn.execute(_VERSION_SQL, (entry[0]['user_id'],)).fetchone()
+                    if (row[0] if row else 0) == entry[1]:
+                        with self._lock:
+                            if self._entries.get(username) is entry:
+                                entry[2] = now
+                        return dict(entry[0])
+                row = conn.execute(_LOAD_SQL, (username,)).fetchone()
+        except Exception as e:
+            add_log("error", f"读取用户信息失败: {str(e)}")
+            return None
+
+        if row is None:
+            self.invalidate(username=username)
+            return None
+        info = user_info_from_row(row)
+        with self._lock:
+            if generation == self._generation:
+                self._entries[username] = [info, row[-1] or 0, now]
+                self._entries.move_to_end(username)
+                self._usernames[info['user_id']] = username
+                while len(self._entries) > self.max_entries:
+                    evicted, (evicted_info, _, _) = self._entries.popitem(last=False)
+                    self._usernames.pop(evicted_info['user_id'], None)
+        return dict(info)
+
+    def get_points(self, username: str) -> int:
+        """用户当前的积分余额（已落库部分），用户不存在时返回 0"""
+        info = self.get_user_info(username)
+        return info['points'] if info else 0
+
+    def invalidate(self, user_id: Optional[str] = None, username: Optional[str] = None):
+        """使一个用户的缓存失效，两个参数都不传时清空全部"""
+        with self._lock:
+            self._generation += 1
+            if user_id is None and username is None:
+                self._entries.clear()
+                self._usernames.clear()
+                return
+            if username is None:
+                username = self._usernames.get(user_id)
+            entry = self._entries.pop(username, None) if username is not None else None
+            if entry is not None:
+                self._usernames.pop(entry[0]['user_id'], None)
+
+
+_cache: Optional[UserCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_user_cache(config: Optional[Dict[str, Any]] = None) -> UserCache:
+    """获取进程级共享的用户信息缓存"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            settings = dict(DEFAULT_USER_CACHE_CONFIG)
+            settings.update((config or {}).get("user_cache", {}))
+            _cache = UserCache(
+                ttl=float(settings["ttl"]),
+                max_entries=int(settings["max_entries"])
+            )
+        return _cache
+
+
+def invalidate_user(user_id: Optional[str] = None, username: Optional[str] = None):
+    """写入用户或积分的事务提交后调用，使本进程的缓存立即失效"""
+    if _cache is not None:
+        _cache.invalidate(user_id=user_id, username=username)
@@ -1,122 +1,218 @@
 import streamlit as st
 import sqlite3
-from datetime import datetime
-from user.user_process import UserManager
 from user.logger import add_log
+from db.pool import get_pool
+from db.history_fts import search_history
+from db.history_codec import decode_content, encode_content
 import json
 import traceback
+from typing import Any, Dict, List, Optional, Tuple
 
-def show_user_history():
-    """显示用户历史记录"""
+HISTORY_PAGE_SIZE = 20
+HISTORY_PREVIEW_CHARS = 100  # 与 db/migrations.py 中回填 preview 的长度一致
+
+# 分页游标：上一页最后一条记录的 (timestamp, history_id)
+HistoryCursor = Tuple[str, int]
+
+def make_history_preview(content: str) -> str:
+    """生成历史记录摘要：优先取输入，其次取输出，非JSON内容直接截取"""
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        data = None
+    if isinstance(data, dict):
+        text = data.get('input') or data.get('output') or ''
+    else:
+        text = content or ''
+    return str(text)[:HISTORY_PREVIEW_CHARS]
+
+def insert_history(conn: sqlite3.Connection, user_id: str, timestamp: str, record_type: str, content: str) -> int:
+    """写入一条历史记录：生成摘要并压缩内容，返回 history_id
+
+    所有写入 history 表的地方都应通过这里，conn 需为连接池中的连接（全文索引触发器用到 history_content()）
+    """
+    cursor = conn.execute('''
+        INSERT INTO history (user_id, timestamp, type, content, preview)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (user_id, timestamp, record_type, encode_content(content), make_history_preview(content)))
+    return cursor.lastrowid
+
+def fetch_history_page(user_id: str, cursor: Optional[HistoryCursor] = None,
+                       limit: int = HISTORY_PAGE_SIZE) -> Tuple[List[Dict[str, Any]], Optional[HistoryCursor]]:
+    """按 (timestamp, history_id) 倒序分页读取历史记录摘要，不读取 content
+
+    Args:
+        user_id: 用户ID
+        cursor: 上一页返回的游标，None 表示第一页
+        limit: 每页条数
+
+    Returns:
+        (记录列表, 下一页游标)，没有下一页时游标为 None
+    """
+    # 多取一条判断是否还有下一页；行值比较可以直接在 (user_id, timestamp) 索引上定位
+    query = '''
+        SELECT history_id, timestamp, type, preview
+        FROM history
+        WHERE user_id = ?
+    '''
+    params: List[Any] = [user_id]
+    if cursor is not None:
+        query += ' AND (timestamp, history_id) < (?, ?)'
+        params.extend(cursor)
+    query += ' ORDER BY timestamp DESC, history_id DESC LIMIT ?'
+    params.append(limit + 1)
+
+    with get_pool().reader() as conn:
+        rows = conn.execute(query, params).fetchall()
+
+    records = [
+        {'history_id': row[0], 'timestamp': row[1], 'type': row[2], 'preview': row[3] or ''}
+        for row in rows[:limit]
+    ]
+    next_cursor = (records[-1]['timestamp'], records[-1]['history_id']) if len(rows) > limit else None
+    return records, next_cursor
+
+def fetch_history_content(user_id: str, history_id: int) -> Optional[str]:
+    """读取单条历史记录的完整内容"""
+    with get_pool().reader() as conn:
+        row = conn.execute(
+            'SELECT content FROM history WHERE history_id = ? AND user_id = ?', (history_id, user_id)
+        ).fetchone()
+    return decode_content(row[0]) if row else None
+
+def _render_history_content(record_type: str, content: str):
+    """显示一条历史记录的完整内容"""
+    # 解析content字段
     try:
-        print("\n=== 开始加载用户历史记录 ===")
-        
-        # 连接数据库
-        conn = sqlite3.connect('db/users.db')
-        cursor = conn.cursor()
-        
-        try:
-            # 获取当前用户的历史记录
-            cursor.execute('''
-                SELECT history_id, user_id, timestamp, type, content
-                FROM history
-                WHERE user_id = ?
-                ORDER BY timestamp DESC
-            ''', (st.session_state.user,))
-            
-            records = cursor.fetchall()
-            print(f"\n=== 查询到 {len(records)} 条历史记录 ===")
-            
-            if not records:
-                st.info("暂无历史记录")
-                return
-            
-            # 显示历史记录
-            for record in records:
+        content_data = json.loads(content)
+    except json.JSONDecodeError:
+        content_data = {'input': '', 'output': content}
+
+    # 根据记录类型显示不同的内容
+    if record_type == 'career_test':
+        # 显示职业测评结果
+        if isinstance(content_data, dict):
+            if 'test_results' in content_data:
                 try:
-                    history_id, user_id, timestamp, record_type, content = record
-                    
-                    # 解析content字段
-                    try:
-                        content_data = json.loads(content)
-                        print(f"解析content成功: {json.dumps(content_data, ensure_ascii=False, indent=2)}")
-                    except json.JSONDecodeError as e:
-                        print(f"解析content失败: {str(e)}")
-                        content_data = {'input': '', 'output': content}
-                    
-                    # 构建显示标题
-                    title = f"[{timestamp}] {record_type}"
-                    if isinstance(content_data, dict):
-                        preview = content_data.get('input', '')[:50] or content_data.get('output', '')[:50]
-                        if preview:
-                            title += f" - {preview}..."
-                    
-                    # 使用expander显示详细内容
-                    with st.expander(title):
-                        st.write(f"**记录ID**: {history_id}")
-                        st.write(f"**类型**: {record_type}")
-                        st.write(f"**时间**: {timestamp}")
-                        
-                        # 根据记录类型显示不同的内容
-                        if record_type == 'career_test':
-                            # 显示职业测评结果
-                            if isinstance(content_data, dict):
-                                if 'test_results' in content_data:
-                                    try:
-                                        test_results = json.loads(content_data['test_results'])
-                                        st.write("**测评结果**:")
-                                        st.json(test_results)
-                                    except Exception as e:
-                                        print(f"解析测评结果失败: {str(e)}")
-                                st.write("**输出内容**:")
-                                st.markdown(content_data.get('output', ''))
-                        else:
-                            # 显示其他类型的记录
-                            if isinstance(content_data, dict):
-                                if content_data.get('input'):
-                                    st.write("**输入内容**:")
-                                    st.text(content_data['input'])
-                                if content_data.get('output'):
-                                    st.write("**输出内容**:")
-                                    st.markdown(content_data['output'])
-                            else:
-                                st.write("**内容**:")
-                                st.markdown(str(content_data))
-                        
+                    test_results = json.loads(content_data['test_results'])
+                    st.write("**测评结果**:")
+                    st.json(test_results)
                 except Exception as e:
-                    error_msg = (
-                        f"\n=== 显示记录失败 ===\n"
-                        f"错误类型: {type(e).__name__}\n"
-                        f"错误信息: {str(e)}\n"
-                        f"记录内容: {record}\n"
-                        f"错误位置: {traceback.format_exc()}"
-                    )
-                    print(error_msg)
-                    st.error(f"显示记录时发生错误: {str(e)}")
-                    continue
-            
-            print("=== 历史记录显示完成 ===")
-            
-        except sqlite3.Error as e:
-            error_msg = (
-                f"\n=== 数据库查询错误 ===\n"
-                f"错误信息: {str(e)}\n"
-                f"错误位置: {traceback.format_exc()}"
-            )
-            print(error_msg)
-            st.error(f"加载历史记录失败: {str(e)}")
-            
+                    add_log("error", f"解析测评结果失败: {str(e)}")
+            st.write("**输出内容**:")
+            st.markdown(content_data.get('output', ''))
+    else:
+        # 显示其他类型的记录
+        if isinstance(content_data, dict):
+            if content_data.get('input'):
+                st.write("**输入内容**:")
+                st.text(content_data['input'])
+            if content_data.get('output'):
+                st.write("**输出内容**:")
+                st.markdown(content_data['output'])
+        else:
+            st.write("**内容**:")
+            st.markdown(str(content_data))
+
+def _show_history_record(user_id: str, record: Dict[str, Any], summary: str, contents: Dict[int, str]):
+    """显示一条记录的折叠面板，点击按钮后才读取完整内容"""
+    try:
+        history_id = record['history_id']
+        record_type = record['type']
+
+        # 构建显示标题
+        title = f"[{record['timestamp']}] {record_type}"
+        if summary:
+            title += f" - {summary}"
+
+        content = contents.get(history_id)
+        with st.expander(title, expanded=content is not None):
+            st.write(f"**记录ID**: {history_id}")
+            st.write(f"**类型**: {record_type}")
+            st.write(f"**时间**: {record['timestamp']}")
+
+            if content is None and st.button("加载完整内容", key=f"history_load_{history_id}"):
+                content = fetch_history_content(user_id, history_id)
+                if content is None:
+                    st.warning("记录不存在或已删除")
+                else:
+                    contents[history_id] = content
+
+            if content is not None:
+                _render_history_content(record_type, content)
+
+    except Exception as e:
+        add_log("error", f"显示记录失败: {str(e)}\n{traceback.format_exc()}")
+        st.error(f"显示记录时发生错误: {str(e)}")
+
+def _show_search_results(user_id: str, keywords: str, contents: Dict[int, str]):
+    """显示全文检索结果，按相关度排序，命中的关键词加粗显示"""
+    results = search_history(user_id, keywords, limit=HISTORY_PAGE_SIZE)
+    if not results:
+        st.info("没有找到匹配的记录")
+        return
+
+    st.caption(f"找到 {len(results)} 条相关记录" + ("（仅显示最相关的前几条）" if len(results) == HISTORY_PAGE_SIZE else ""))
+    for record in results:
+        _show_history_record(user_id, record, "", contents)
+        st.markdown(record['snippet'].replace("\n", " "))
+
+def show_user_history():
+    """显示用户历史记录
+
+    列表只读取摘要，每页 HISTORY_PAGE_SIZE 条；展开记录后点击按钮才加载完整内容
+    """
+    try:
+        user_id = st.session_state.user
+
+        # 每页起点的游标栈，栈顶是当前页；切换用户时重置
+        if st.session_state.get('history_pages_user') != user_id:
+            st.session_state.history_pages_user = user_id
+            st.session_state.history_pages = [None]
+            st.session_state.history_contents = {}
+        pages = st.session_state.history_pages
+        contents = st.session_state.history_contents
+
+        keywords = st.text_input("搜索历史记录", placeholder="输入关键词，多个关键词用空格分隔",
+                                 key="history_search")
+        if keywords.strip():
+            _show_search_results(user_id, keywords, contents)
+            return
+
+        records, next_cursor = fetch_history_page(user_id, pages[-1])
+
+        if not records:
+            st.info("暂无历史记录")
+            if len(pages) > 1:
+                if st.button("返回第一页"):
+                    pages[:] = [None]
+                    st.rerun()
+            return
+
+        # 显示历史记录
+        for record in records:
+            summary = f"{record['preview'][:50]}..." if record['preview'] else ""
+            _show_history_record(user_id, record, summary, contents)
+
+        # 翻页
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            if st.button("上一页", disabled=len(pages) == 1, use_container_width=True):
+                pages.pop()
+                contents.clear()
+                st.rerun()
+        with col2:
+            st.markdown(f"<div style='text-align: center'>第 {len(pages)} 页</div>", unsafe_allow_html=True)
+        with col3:
+            if st.button("下一页", disabled=next_cursor is None, use_container_width=True):
+                pages.append(next_cursor)
+                contents.clear()
+                st.rerun()
+
+    except sqlite3.Error as e:
+        add_log("error", f"加载历史记录失败: {str(e)}\n{traceback.format_exc()}")
+        st.error(f"加载历史记录失败: {str(e)}")
+
     except Exception as e:
-        error_msg = (
-            f"\n=== 显示历史记录失败 ===\n"
-            f"错误类型: {type(e).__name__}\n"
-            f"错误信息: {str(e)}\n"
-            f"错误位置: {traceback.format_exc()}"
-        )
-        print(error_msg)
+        add_log("error", f"显示历史记录失败: {str(e)}\n{traceback.format_exc()}")
         st.error(f"显示历史记录失败: {str(e)}")
-        
-    finally:
-        if 'conn' in locals():
-            conn.close()
-            print("\n=== 数据库连接已关闭 ===")
\ No newline at end of file